@@ -1,41 +1,24 @@
 #!/usr/bin/env python
 # encoding: utf-8
 
+# CLIMADA, geopandas and the HDX API take several seconds to import so commands import what they
+# need when they run, keeping --help and the commands which read local files quick
+# pylint: disable=import-outside-toplevel
+
+import glob
 import logging
 import os
 import click
 
-import numpy as np
-from climada.util.constants import SYSTEM_DIR
-from climada.util.files_handler import download_file
-
 from hdx.utilities.easy_logging import setup_logging
 
 
-from hdx_scraper_climada.climada_interface import (
-    print_overview_information,
-    get_date_range_from_live_api,
-)
 from hdx_scraper_climada.utilities import (
     read_attributes,
     INDICATOR_LIST,
     print_banner_to_log,
     CLIMADA_DISCLAIMER,
 )
-from hdx_scraper_climada.create_datasets import (
-    get_date_range_from_timeseries_file,
-    get_date_range_from_hdx,
-)
-from hdx_scraper_climada.create_csv_files import export_indicator_data_to_csv
-from hdx_scraper_climada.download_from_hdx import (
-    download_hdx_admin1_boundaries,
-    download_hdx_datasets,
-    ADMIN1_GEOMETRY_FOLDER,
-)
-from hdx_scraper_climada.download_gpw_population_map import download_gpw_population
-from hdx_scraper_climada.run import hdx_climada_run
-
-from hdx_scraper_climada.patched_nightlight import download_nl_files
 
 setup_logging()
 LOGGER = logging.getLogger(__name__)
@@ -70,6 +53,8 @@ def hdx_climada() -> None:
 )
 def info(data_type: str = "litpop"):
     """Show the data_type info from the CLIMADA interface"""
+    from hdx_scraper_climada.climada_interface import print_overview_information
+
     print_banner_to_log(LOGGER, "info")
     data_type = data_type.replace("-", "_")
     print_overview_information(data_type=data_type)
@@ -99,6 +84,11 @@ def info(data_type: str = "litpop"):
 )
 def dataset_date(indicator: str = "all", source: str = "local", hdx_site: str = "stage"):
     """Show dataset date ranges read various sources"""
+    from hdx_scraper_climada.create_datasets import (
+        get_date_range_from_timeseries_file,
+        get_date_range_from_hdx,
+    )
+
     print_banner_to_log(LOGGER, "dataset_date")
     logging.disable(logging.INFO)
     if indicator == "all":
@@ -113,6 +103,8 @@ def dataset_date(indicator: str = "all", source: str = "local", hdx_site: str =
         if source == "local":
             date_range = get_date_range_from_timeseries_file(dataset_attributes)
         elif source == "API":
+            from hdx_scraper_climada.climada_interface import get_date_range_from_live_api
+
             date_range = get_date_range_from_live_api(indicator_)
         elif source == "HDX":
             date_range = get_date_range_from_hdx(indicator_, hdx_site=hdx_site)
@@ -144,13 +136,36 @@ def dataset_date(indicator: str = "all", source: str = "local", hdx_site: str =
     help="an hdx_site value",
 )
 @click.option("--download_directory", is_flag=False, default=None, help="target_directory")
+@click.option(
+    "--optimize",
+    is_flag=True,
+    default=False,
+    help="rewrite blackmarble or population rasters as memory mapped arrays for fast reads",
+)
 def download(
     data_name: str = "boundaries",
     indicator: str = "litpop",
     hdx_site: str = "stage",
     download_directory: str = None,
+    optimize: bool = False,
 ):
     """Download data assets required to build the datasets"""
+    import numpy as np
+    from climada.util.constants import SYSTEM_DIR
+    from climada.util.files_handler import download_file
+
+    from hdx_scraper_climada.download_from_hdx import (
+        convert_admin_boundaries_to_geoparquet,
+        download_hdx_admin1_boundaries,
+        download_hdx_datasets,
+        ADMIN1_GEOMETRY_FOLDER,
+    )
+    from hdx_scraper_climada.download_gpw_population_map import (
+        download_gpw_population,
+        GPW_POPULATION_DIRECTORY,
+    )
+    from hdx_scraper_climada.patched_nightlight import download_nl_files
+
     print_banner_to_log(LOGGER, "download")
     if data_name == "boundaries":
         print(
@@ -160,6 +175,10 @@ def download(
             download_directory=download_directory, hdx_site=hdx_site
         )
         print(f"Downloaded admin1 boundary data to: {resource_file_paths}")
+        if download_directory is None:
+            for file_name in ["polbnda_adm1_1m_ocha.geojson", "polbnda_adm2_1m_ocha.geojson"]:
+                partition_directory = convert_admin_boundaries_to_geoparquet(file_name)
+                print(f"Partitioned {file_name} by country into {partition_directory}", flush=True)
     elif data_name == "population":
         if ("NASA_EARTHDATA_USERNAME" not in os.environ) or (
             "NASA_EARTHDATA_USERNAME" not in os.environ
@@ -171,6 +190,10 @@ def download(
             )
 
         download_gpw_population(target_directory=download_directory)
+        if optimize:
+            if download_directory is None:
+                download_directory = GPW_POPULATION_DIRECTORY
+            optimize_rasters(glob.glob(os.path.join(download_directory, "*.tif")))
     elif data_name == "climada":
         # We would handle "all" here by listing indicators and looping over them
         # Make dataset name
@@ -203,6 +226,8 @@ def download(
             dwnl_path=download_directory,
             year=2016,
         )
+        if optimize:
+            optimize_rasters([os.path.join(download_directory, x % 2016) for x in BM_FILENAMES])
     elif data_name == "geoBoundaries":
         geoBoundaries_admin1_url = (
             "https://github.com/wmgeolab/geoBoundaries/raw/main/releaseData/CGAZ/"
@@ -220,6 +245,11 @@ def download(
                 raise FileNotFoundError
             else:
                 print(f"geoBoundaries file successfully downloaded to {local_path}", flush=True)
+        if download_directory == ADMIN1_GEOMETRY_FOLDER:
+            partition_directory = convert_admin_boundaries_to_geoparquet(
+                "geoBoundariesCGAZ_ADM1.geojson"
+            )
+            print(f"Partitioned geoBoundaries file by country into {partition_directory}")
     else:
         print(
             f"Data_name '{data_name}' is not know, only 'boundaries', 'population', 'climada' "
@@ -227,6 +257,17 @@ def download(
         )
 
 
+def optimize_rasters(raster_paths: list[str]):
+    from hdx_scraper_climada.patched_nightlight import optimize_raster
+
+    for raster_path in raster_paths:
+        if not os.path.exists(raster_path):
+            print(f"{raster_path} was not found, skipping optimization", flush=True)
+            continue
+        array_path = optimize_raster(raster_path)
+        print(f"Optimized {raster_path} to {array_path}", flush=True)
+
+
 @hdx_climada.command(name="create_dataset", short_help="Create a dataset in HDX with CSV files")
 @click.option(
     "--indicator",
@@ -254,12 +295,80 @@ def download(
     default=False,
     help="if present then update to HDX is made, if absent then a dry run is done",
 )
+@click.option(
+    "--workers",
+    type=click.IntRange(min=1),
+    is_flag=False,
+    default=1,
+    help="number of worker processes used to process countries in parallel",
+)
+@click.option(
+    "--memory_budget_gb",
+    type=click.FloatRange(min=0.0, min_open=True),
+    is_flag=False,
+    default=None,
+    help="memory budget in GB for countries processed in parallel",
+)
+@click.option(
+    "--incremental",
+    is_flag=True,
+    default=False,
+    help="if present then only hazard events new since the last run are added to timeseries",
+)
+@click.option(
+    "--parquet",
+    is_flag=True,
+    default=False,
+    help="if present then typed Parquet copies of the CSV files are also written",
+)
+@click.option(
+    "--prefetch",
+    type=click.IntRange(min=0),
+    is_flag=False,
+    default=0,
+    help="number of countries ahead for which CLIMADA data is downloaded in the background",
+)
+@click.option(
+    "--prefetch_disk_budget_gb",
+    type=click.FloatRange(min=0.0, min_open=True),
+    is_flag=False,
+    default=None,
+    help="disk budget in GB for the CLIMADA data directory when prefetching",
+)
 def create_dataset(
-    indicator: str = "litpop", country: str = "all", hdx_site: str = "stage", live: bool = False
+    indicator: str = "litpop",
+    country: str = "all",
+    hdx_site: str = "stage",
+    live: bool = False,
+    workers: int = 1,
+    memory_budget_gb: float = None,
+    incremental: bool = False,
+    parquet: bool = False,
+    prefetch: int = 0,
+    prefetch_disk_budget_gb: float = None,
 ):
     """Create CSV data files for an indicator and create dataset in HDX"""
+    from hdx_scraper_climada.run import hdx_climada_run
+
     print_banner_to_log(LOGGER, "create_dataset")
-    hdx_climada_run(indicator, country, hdx_site=hdx_site, dry_run=not live)
+    memory_budget = None
+    if memory_budget_gb is not None:
+        memory_budget = memory_budget_gb * 1024**3
+    prefetch_disk_budget = None
+    if prefetch_disk_budget_gb is not None:
+        prefetch_disk_budget = prefetch_disk_budget_gb * 1024**3
+    hdx_climada_run(
+        indicator,
+        country,
+        hdx_site=hdx_site,
+        dry_run=not live,
+        workers=workers,
+        memory_budget=memory_budget,
+        incremental=incremental,
+        parquet=parquet,
+        prefetch=prefetch,
+        prefetch_disk_budget=prefetch_disk_budget,
+    )
 
 
 @hdx_climada.command(name="create_csv", short_help="Create a dataset in HDX with CSV files")
@@ -279,6 +388,8 @@ def create_dataset(
 @click.option("--export_directory", is_flag=False, default=None, help="output directory")
 def create_csv(indicator: str = "litpop", country: str = "Haiti", export_directory: str = ""):
     """Create CSV data files for an indicator and country"""
+    from hdx_scraper_climada.create_csv_files import export_indicator_data_to_csv
+
     print_banner_to_log(LOGGER, "create_csv")
     statuses = export_indicator_data_to_csv(
         country=country, indicator=indicator, export_directory=export_directory
@@ -7,13 +7,16 @@ import logging
 import os
 import sys
 
-from typing import Any
+from collections import OrderedDict
+from typing import Any, Callable
 
 import climada
 import geopandas
 import pandas as pd
 import numpy as np
 
+from scipy import sparse
+
 from hdx.utilities.easy_logging import setup_logging
 from hdx.location.country import Country
 
@@ -25,22 +28,75 @@ import climada.util.coordinates as u_coord
 # from climada.entity.exposures import LitPop
 from hdx_scraper_climada.patched_litpop import LitPop
 
-from hdx_scraper_climada.download_from_hdx import get_best_admin_shapes
-
+from hdx_scraper_climada.download_from_hdx import (
+    get_admin1_shapes_from_hdx,
+    get_best_admin_shapes,
+)
+from hdx_scraper_climada.instrumentation import increment, span
+from hdx_scraper_climada.hazard_store import (
+    EXPOSURE_COLUMNS,
+    count_stored_centroids,
+    make_hazard_store_directory,
+    read_country_exposure,
+    read_hazard_reductions,
+    read_store_manifest,
+    write_country_exposures,
+    write_hazard_reductions,
+)
+from hdx_scraper_climada.spatial_index import (
+    AdminShapeIndex,
+    grid_indices_within,
+    split_points_by_shape_rows,
+)
 
-CLIENT = Client()
 
 setup_logging()
 LOGGER = logging.getLogger(__name__)
 
+# Constructing a Client queries the CLIMADA API, so it is made on first use by get_client
+CLIENT = None
+
 GLOBAL_INDICATOR_CACHE = {}
+# Hazards are cached by indicator and CLIMADA properties (which include the country) with the least
+# recently used evicted once the cache exceeds HAZARD_CACHE_MAX_BYTES
+HAZARD_CACHE = OrderedDict()
+HAZARD_CACHE_MAX_BYTES = 4 * 1024**3
+HAZARD_REDUCTIONS_CACHE = {}
+LITPOP_COUNTRY_CACHE = {}
+CROP_PRODUCTION_CACHE = {}
+CROP_PRODUCTION_MATRIX_CACHE = {}
+CROP_PRODUCTION_EXPOSURES = [
+    (crop, irrigation_status)
+    for crop in ["mai", "whe", "soy", "ric"]
+    for irrigation_status in ["noirr", "firr"]
+]
+# CLIMADA data type and properties, excluding country_iso3alpha, used for the detail data of each
+# hazard indicator
+HAZARD_DATA_TYPES = {
+    "earthquake": ("earthquake", {}),
+    "flood": ("flood", {}),
+    "wildfire": ("wildfire", {}),
+    "river-flood": ("river_flood", {"climate_scenario": "historical"}),
+    "tropical-cyclone": ("tropical_cyclone", {"event_type": "observed"}),
+    "storm-europe": ("storm_europe", {}),
+}
+# Gridded hazards and LitPop exposures are split between admin shapes by rasterizing the shapes onto
+# their grid, points near a boundary are still tested exactly so the result is the same either way
+USE_ADMIN_LABEL_GRID = True
+ADMIN_LABEL_GRID_CACHE = {}
+ADMIN_SHAPE_INDEX_CACHE = {}
 SPATIAL_FILTER_CACHE = {}
-CACHE_HIT = 0
-CACHE_MISS = 0
+
+
+def get_client() -> Client:
+    global CLIENT
+    if CLIENT is None:
+        CLIENT = Client()
+    return CLIENT
 
 
 def print_overview_information(data_type="litpop"):
-    data_types = CLIENT.list_data_type_infos()
+    data_types = get_client().list_data_type_infos()
     print("Available Data Types\n====================", flush=True)
     for dataset in data_types:
         print(f"{dataset.data_type} ({dataset.data_type_group})", flush=True)
@@ -63,8 +119,8 @@ def print_overview_information(data_type="litpop"):
         print(f"status: {dataset.status}", flush=True)
         print(f"version_notes: {dataset.version_notes}", flush=True)
 
-    dataset_infos = CLIENT.list_dataset_infos(data_type=data_type)
-    dataset_default = CLIENT.get_property_values(dataset_infos)
+    dataset_infos = get_client().list_dataset_infos(data_type=data_type)
+    dataset_default = get_client().get_property_values(dataset_infos)
 
     print("\nAvailable property values")
     for item in dataset_default.items():
@@ -170,12 +226,9 @@ def get_date_range_from_live_api(indicator: str) -> str:
         "tropical-cyclone",
         "storm-europe",
     ]:
-        indicator_data = CLIENT.get_hazard(
-            indicator.replace("-", "_"),
-            properties=climada_properties,
-        )
-        start_date = datetime.datetime.fromordinal(int(indicator_data.date[0])).isoformat()
-        end_date = datetime.datetime.fromordinal(int(indicator_data.date[-1])).isoformat()
+        hazard_reductions = get_hazard_reductions(indicator.replace("-", "_"), climada_properties)
+        start_date = datetime.datetime.fromordinal(int(hazard_reductions["date"][0])).isoformat()
+        end_date = datetime.datetime.fromordinal(int(hazard_reductions["date"][-1])).isoformat()
         date_range = f"[{start_date} TO {end_date}]"
 
     return date_range
@@ -186,25 +239,158 @@ def calculate_litpop_for_admin1(
     country: str,
     indicator: str,
 ) -> pd.DataFrame:
-    country_iso_numeric = get_country_iso_numeric(country)
-    admin1_indicator_data = LitPop.from_shape_and_countries(
-        admin1_shape, country_iso_numeric, res_arcsec=150
-    )
-    admin1_indicator_gdf = admin1_indicator_data.gdf
+    country_litpop_gdf, admin1_positions = get_country_litpop_for_admin1(admin1_shape, country)
+    admin1_indicator_gdf = country_litpop_gdf.iloc[admin1_positions].reset_index(drop=True)
     admin1_indicator_gdf["indicator"] = len(admin1_indicator_gdf) * [indicator]
-    admin1_indicator_gdf["longitude"] = admin1_indicator_gdf.geometry.apply(lambda p: p.x)
-    admin1_indicator_gdf["latitude"] = admin1_indicator_gdf.geometry.apply(lambda p: p.y)
     admin1_indicator_gdf = admin1_indicator_gdf[["latitude", "longitude", "indicator", "value"]]
     return admin1_indicator_gdf
 
 
+def get_country_litpop_for_admin1(
+    admin1_shape: list[geopandas.geoseries.GeoSeries], country: str
+) -> tuple[geopandas.GeoDataFrame, np.ndarray]:
+    """LitPop.from_shape_and_countries builds the LitPop exposure for the whole country and then
+    crops it to the shape. This builds the country exposure once, and splits it between all the
+    admin1 shapes for the country in a single pass, the exposure and split are cached for the
+    most recent country.
+
+    Arguments:
+        admin1_shape {list[geopandas.geoseries.GeoSeries]} -- admin1 shape, as from
+                                                              get_admin1_shapes_from_hdx
+        country {str} -- full name of country
+
+    Returns:
+        tuple[geopandas.GeoDataFrame, np.ndarray] -- country exposure gdf and the positions of the
+                                                     rows in admin1_shape
+    """
+    country_iso_numeric = get_country_iso_numeric(country)
+    if country_iso_numeric not in LITPOP_COUNTRY_CACHE:
+        LITPOP_COUNTRY_CACHE.clear()
+        with span("exposure_fetch"):
+            country_litpop_gdf = add_coordinate_columns(
+                LitPop.from_countries(country_iso_numeric, res_arcsec=150).gdf
+            )
+        _, admin1_shapes = get_admin1_shapes_from_hdx(Country.get_iso3_country_code(country))
+        with span("spatial_filter"):
+            admin1_positions = split_points_by_shape_rows(
+                country_litpop_gdf["longitude"].to_numpy(),
+                country_litpop_gdf["latitude"].to_numpy(),
+                admin1_shapes,
+                use_grid=USE_ADMIN_LABEL_GRID,
+            )
+        increment("points_filtered", len(country_litpop_gdf))
+        LITPOP_COUNTRY_CACHE[country_iso_numeric] = (
+            country_litpop_gdf,
+            admin1_shapes,
+            admin1_positions,
+        )
+
+    country_litpop_gdf, admin1_shapes, admin1_positions = LITPOP_COUNTRY_CACHE[country_iso_numeric]
+    shape_number = get_shape_number(admin1_shapes, admin1_shape)
+    if shape_number is not None:
+        return country_litpop_gdf, admin1_positions[shape_number]
+
+    # A shape from elsewhere is split from the cached exposure on its own
+    positions = split_points_by_shape_rows(
+        country_litpop_gdf["longitude"].to_numpy(),
+        country_litpop_gdf["latitude"].to_numpy(),
+        [admin1_shape],
+    )[0]
+    return country_litpop_gdf, positions
+
+
+def get_shape_number(
+    admin1_shapes: list[geopandas.geoseries.GeoSeries],
+    admin1_shape: list[geopandas.geoseries.GeoSeries],
+) -> int | None:
+    # The boundary registry hands out the same shape objects to every caller, so a shape from
+    # get_admin1_shapes_from_hdx is found by identity
+    for i, shape in enumerate(admin1_shapes):
+        if shape is admin1_shape:
+            return i
+    return None
+
+
+def get_country_shape_index(country: str) -> tuple[list, AdminShapeIndex, dict]:
+    """The admin1 shapes for a country and an AdminShapeIndex over all of them, built once and
+    cached for the most recent country along with the splits made with it by get_admin1_positions
+
+    Arguments:
+        country {str} -- full name of country
+
+    Returns:
+        tuple[list, AdminShapeIndex, dict] -- admin1 shapes, their index and the cached splits
+    """
+    country_iso3alpha = Country.get_iso3_country_code(country)
+    if country_iso3alpha not in ADMIN_SHAPE_INDEX_CACHE:
+        ADMIN_SHAPE_INDEX_CACHE.clear()
+        _, admin1_shapes = get_admin1_shapes_from_hdx(country_iso3alpha)
+        ADMIN_SHAPE_INDEX_CACHE[country_iso3alpha] = (
+            admin1_shapes,
+            AdminShapeIndex(admin1_shapes),
+            {},
+        )
+
+    return ADMIN_SHAPE_INDEX_CACHE[country_iso3alpha]
+
+
+def get_admin1_positions(
+    admin1_shape: list[geopandas.geoseries.GeoSeries],
+    country: str,
+    points_key: Any,
+    longitudes: np.ndarray,
+    latitudes: np.ndarray,
+) -> np.ndarray | None:
+    """Split a set of points between all the admin1 shapes for a country with the country's
+    AdminShapeIndex, the split is made once for each set of points and cached with the index
+
+    Arguments:
+        admin1_shape {list[geopandas.geoseries.GeoSeries]} -- admin1 shape, as from
+                                                              get_admin1_shapes_from_hdx
+        country {str} -- full name of country
+        points_key {Any} -- identifies the exposure or hazard the points come from
+        longitudes {np.ndarray} -- point longitudes
+        latitudes {np.ndarray} -- point latitudes
+
+    Returns:
+        np.ndarray | None -- positions of the points within admin1_shape, or None if the shape is
+                             not one of the country's admin1 shapes
+    """
+    admin1_shapes, shape_index, admin1_splits = get_country_shape_index(country)
+    shape_number = get_shape_number(admin1_shapes, admin1_shape)
+    if shape_number is None:
+        return None
+
+    if points_key not in admin1_splits:
+        with span("spatial_filter"):
+            admin1_splits[points_key] = shape_index.indices_within(longitudes, latitudes)
+        increment("points_filtered", len(longitudes))
+
+    return admin1_splits[points_key][shape_number]
+
+
+def add_coordinate_columns(gdf: geopandas.GeoDataFrame) -> geopandas.GeoDataFrame:
+    """Add longitude and latitude columns to a GeoDataFrame of points, reading the geometry in one
+    vectorized pass. Exposures which already carry these columns are returned unchanged
+
+    Arguments:
+        gdf {geopandas.GeoDataFrame} -- a GeoDataFrame of points
+
+    Returns:
+        geopandas.GeoDataFrame -- the GeoDataFrame with longitude and latitude columns
+    """
+    if "longitude" in gdf.columns and "latitude" in gdf.columns:
+        return gdf
+    return gdf.assign(longitude=gdf.geometry.x.to_numpy(), latitude=gdf.geometry.y.to_numpy())
+
+
 def calculate_litpop_alt_for_admin1(
     admin1_shape: list[geopandas.geoseries.GeoSeries],
     country: str,
     indicator: str,
 ) -> pd.DataFrame:
     country_iso_numeric = get_country_iso_numeric(country)
-    admin1_indicator_data = CLIENT.get_exposures(
+    admin1_indicator_data = get_client().get_exposures(
         "litpop",
         properties={
             "country_iso3num": str(country_iso_numeric),
@@ -213,12 +399,17 @@ def calculate_litpop_alt_for_admin1(
         },
     )
 
-    admin1_indicator_gdf = admin1_indicator_data.gdf.reset_index()
-    admin1_indicator_gdf["longitude"] = admin1_indicator_gdf.geometry.apply(lambda p: p.x)
-    admin1_indicator_gdf["latitude"] = admin1_indicator_gdf.geometry.apply(lambda p: p.y)
+    admin1_indicator_gdf = add_coordinate_columns(admin1_indicator_data.gdf.reset_index())
 
+    index_within = get_admin1_positions(
+        admin1_shape,
+        country,
+        indicator,
+        admin1_indicator_gdf["longitude"].to_numpy(),
+        admin1_indicator_gdf["latitude"].to_numpy(),
+    )
     admin1_indicator_gdf = filter_dataframe_with_geometry(
-        admin1_indicator_gdf, admin1_shape, indicator
+        admin1_indicator_gdf, admin1_shape, indicator, index_within=index_within
     )
 
     return admin1_indicator_gdf
@@ -228,60 +419,233 @@ def calculate_crop_production_for_admin1(
     admin1_shape: list[geopandas.geoseries.GeoSeries],
     country: str,
 ) -> pd.DataFrame:
-    # Global data is cached in a dictionary GLOBAL_INDICATOR_CACHE keyed by the indicator name
-    # the `global` keyword is not required because we mutate this dictionary rather than reassign.
+    crop_production = get_country_crop_production_matrix(country)
+    if crop_production is None:
+        return calculate_crop_production_for_admin1_by_exposure(admin1_shape, country)
+
+    longitudes, latitudes, values, admin1_shapes, admin1_positions = crop_production
+    shape_number = get_shape_number(admin1_shapes, admin1_shape)
+    if shape_number is not None:
+        positions = admin1_positions[shape_number]
+    else:
+        # A shape from elsewhere is not in the country's index so it is indexed on its own
+        positions = AdminShapeIndex([admin1_shape]).indices_within(longitudes, latitudes)[0]
 
-    crops = ["mai", "whe", "soy", "ric"]
-    irrigation_statuses = ["noirr", "firr"]
-    crop_gdfs = []
-    for crop in crops:
-        for irrigation_status in irrigation_statuses:
-            indicator_key = f"crop-production.{crop}.{irrigation_status}.USD"
-            if indicator_key not in GLOBAL_INDICATOR_CACHE:
-                admin1_indicator_data = CLIENT.get_exposures(
-                    "crop_production",
-                    properties={
-                        "crop": crop,
-                        "irrigation_status": irrigation_status,
-                        "unit": "USD",
-                        "spatial_coverage": "global",
-                    },
-                )
-                GLOBAL_INDICATOR_CACHE[indicator_key] = admin1_indicator_data
-            else:
-                admin1_indicator_data = GLOBAL_INDICATOR_CACHE[indicator_key]
-
-            admin1_indicator_gdf = admin1_indicator_data.gdf.reset_index()
-            admin1_indicator_gdf["longitude"] = admin1_indicator_gdf.geometry.apply(lambda p: p.x)
-            admin1_indicator_gdf["latitude"] = admin1_indicator_gdf.geometry.apply(lambda p: p.y)
-            country_iso_numeric = get_country_iso_numeric(country)
-            admin1_indicator_gdf = admin1_indicator_gdf[
-                admin1_indicator_gdf["region_id"] == country_iso_numeric
+    indicator_keys = [
+        f"crop-production.{crop}.{irrigation_status}.USD"
+        for crop, irrigation_status in CROP_PRODUCTION_EXPOSURES
+    ]
+    # All of the exposures share a grid so either every one has rows in the region or none do
+    if len(positions) == 0:
+        LOGGER.info("No rows inside geometry filter")
+        centroid = calculate_centroid(admin1_shape)
+        admin1_indicator_gdf = pd.DataFrame(
+            [
+                {
+                    "latitude": round(centroid[0].y, 2),
+                    "longitude": round(centroid[0].x, 2),
+                    "indicator": indicator_key,
+                    "value": 0.0,
+                }
+                for indicator_key in indicator_keys
             ]
-            admin1_indicator_gdf = filter_dataframe_with_geometry(
-                admin1_indicator_gdf, admin1_shape, indicator_key
+        )
+        return admin1_indicator_gdf
+
+    # Rows are ordered by exposure then by point, as from concatenating one filter per exposure
+    admin1_indicator_gdf = pd.DataFrame(
+        {
+            "latitude": np.tile(latitudes[positions], len(indicator_keys)),
+            "longitude": np.tile(longitudes[positions], len(indicator_keys)),
+            "indicator": np.repeat(np.array(indicator_keys, dtype=object), len(positions)),
+            "value": values[positions].T.ravel(),
+        }
+    )
+
+    return admin1_indicator_gdf
+
+
+def calculate_crop_production_for_admin1_by_exposure(
+    admin1_shape: list[geopandas.geoseries.GeoSeries],
+    country: str,
+) -> pd.DataFrame:
+    crop_gdfs = []
+    for crop, irrigation_status in CROP_PRODUCTION_EXPOSURES:
+        indicator_key = f"crop-production.{crop}.{irrigation_status}.USD"
+        admin1_indicator_gdf = get_country_crop_production(country, crop, irrigation_status)
+        index_within = get_admin1_positions(
+            admin1_shape,
+            country,
+            indicator_key,
+            admin1_indicator_gdf["longitude"].to_numpy(),
+            admin1_indicator_gdf["latitude"].to_numpy(),
+        )
+        admin1_indicator_gdf = filter_dataframe_with_geometry(
+            admin1_indicator_gdf, admin1_shape, indicator_key, index_within=index_within
+        )
+        if len(admin1_indicator_gdf) == 0:
+            # Calculate centroid of region
+            centroid = calculate_centroid(admin1_shape)
+
+            admin1_indicator_gdf = pd.DataFrame(
+                [
+                    {
+                        "latitude": round(centroid[0].y, 2),
+                        "longitude": round(centroid[0].x, 2),
+                        "indicator": indicator_key,
+                        "value": 0.0,
+                    }
+                ]
             )
-            if len(admin1_indicator_gdf) == 0:
-                # Calculate centroid of region
-                centroid = calculate_centroid(admin1_shape)
-
-                admin1_indicator_gdf = pd.DataFrame(
-                    [
-                        {
-                            "latitude": round(centroid[0].y, 2),
-                            "longitude": round(centroid[0].x, 2),
-                            "indicator": indicator_key,
-                            "value": 0.0,
-                        }
-                    ]
-                )
-            crop_gdfs.append(admin1_indicator_gdf)
+        crop_gdfs.append(admin1_indicator_gdf)
 
     admin1_indicator_gdf = pd.concat(crop_gdfs, axis=0, ignore_index=True)
 
     return admin1_indicator_gdf
 
 
+def get_country_crop_production_matrix(country: str) -> tuple | None:
+    """Stack the values of all the crop production exposures for a country into a single
+    n_points x n_exposures array on their shared grid, and split the grid points between the
+    country's admin1 shapes in one pass. This is cached for the most recent country.
+
+    Arguments:
+        country {str} -- full name of country
+
+    Returns:
+        tuple | None -- longitudes, latitudes, values, admin1 shapes and the positions of the points
+                        in each admin1 shape, or None if the exposures are not on the same grid
+    """
+    country_iso_numeric = get_country_iso_numeric(country)
+    if country_iso_numeric not in CROP_PRODUCTION_MATRIX_CACHE:
+        CROP_PRODUCTION_MATRIX_CACHE.clear()
+        crop_dfs = [
+            get_country_crop_production(country, crop, irrigation_status)
+            for crop, irrigation_status in CROP_PRODUCTION_EXPOSURES
+        ]
+        longitudes = crop_dfs[0]["longitude"].to_numpy()
+        latitudes = crop_dfs[0]["latitude"].to_numpy()
+        shared_grid = all(
+            np.array_equal(x["longitude"].to_numpy(), longitudes)
+            and np.array_equal(x["latitude"].to_numpy(), latitudes)
+            for x in crop_dfs[1:]
+        )
+        if shared_grid:
+            values = np.column_stack([x["value"].to_numpy() for x in crop_dfs])
+            admin1_shapes, shape_index, _ = get_country_shape_index(country)
+            with span("spatial_filter"):
+                admin1_positions = shape_index.indices_within(longitudes, latitudes)
+            increment("points_filtered", len(longitudes))
+            CROP_PRODUCTION_MATRIX_CACHE[country_iso_numeric] = (
+                longitudes,
+                latitudes,
+                values,
+                admin1_shapes,
+                admin1_positions,
+            )
+        else:
+            LOGGER.info(f"Crop production exposures for {country} are not on a shared grid")
+            CROP_PRODUCTION_MATRIX_CACHE[country_iso_numeric] = None
+
+    return CROP_PRODUCTION_MATRIX_CACHE[country_iso_numeric]
+
+
+def get_country_crop_production(country: str, crop: str, irrigation_status: str) -> pd.DataFrame:
+    """Get the points of a global crop production exposure which lie in a country. The global
+    exposure is split by region_id into the local store once, after which a country is read from
+    its own file without loading the global exposure.
+
+    Arguments:
+        country {str} -- full name of country
+        crop {str} -- ISIMIP crop code i.e. mai
+        irrigation_status {str} -- noirr or firr
+
+    Returns:
+        pd.DataFrame -- latitude, longitude and value columns for the country
+    """
+    country_iso_numeric = get_country_iso_numeric(country)
+    cache_key = (crop, irrigation_status, country_iso_numeric)
+    if cache_key in CROP_PRODUCTION_CACHE:
+        return CROP_PRODUCTION_CACHE[cache_key]
+
+    store_directory, dataset_version = get_crop_production_store(crop, irrigation_status)
+    country_exposure = read_country_exposure(store_directory, dataset_version, country_iso_numeric)
+    if country_exposure is None:
+        LOGGER.info(build_crop_production_store(crop, irrigation_status))
+        country_exposure = read_country_exposure(
+            store_directory, dataset_version, country_iso_numeric
+        )
+
+    CROP_PRODUCTION_CACHE[cache_key] = pd.DataFrame(country_exposure, columns=EXPOSURE_COLUMNS)
+
+    return CROP_PRODUCTION_CACHE[cache_key]
+
+
+def get_crop_production_properties(crop: str, irrigation_status: str) -> dict:
+    return {
+        "crop": crop,
+        "irrigation_status": irrigation_status,
+        "unit": "USD",
+        "spatial_coverage": "global",
+    }
+
+
+def get_crop_production_store(crop: str, irrigation_status: str) -> tuple[str, dict]:
+    properties = get_crop_production_properties(crop, irrigation_status)
+    dataset_info = get_client().get_dataset_info(data_type="crop_production", properties=properties)
+    dataset_version = {"uuid": dataset_info.uuid, "version": dataset_info.version}
+    store_directory = make_hazard_store_directory("crop_production", properties)
+
+    return store_directory, dataset_version
+
+
+def build_crop_production_store(crop: str, irrigation_status: str) -> str:
+    """Split a global crop production exposure by country into the local store, unless the store
+    is already there for the current version of the dataset. The store is shared by all countries
+    so this is run once, before any worker processes start, by build_crop_production_stores
+
+    Arguments:
+        crop {str} -- ISIMIP crop code i.e. mai
+        irrigation_status {str} -- noirr or firr
+
+    Returns:
+        str -- status message
+    """
+    store_directory, dataset_version = get_crop_production_store(crop, irrigation_status)
+    if read_store_manifest(store_directory, dataset_version) is not None:
+        status = f"Crop production store for {crop}.{irrigation_status} is up to date"
+        return status
+
+    # Global data is cached in a dictionary GLOBAL_INDICATOR_CACHE keyed by the indicator name
+    properties = get_crop_production_properties(crop, irrigation_status)
+    indicator_key = f"crop-production.{crop}.{irrigation_status}.USD"
+    if indicator_key not in GLOBAL_INDICATOR_CACHE:
+        with span("exposure_fetch"):
+            GLOBAL_INDICATOR_CACHE[indicator_key] = get_client().get_exposures(
+                "crop_production", properties=properties
+            )
+    global_gdf = add_coordinate_columns(GLOBAL_INDICATOR_CACHE[indicator_key].gdf)
+    status = write_country_exposures(
+        store_directory,
+        {name: global_gdf[name].to_numpy() for name in EXPOSURE_COLUMNS},
+        global_gdf["region_id"].to_numpy(),
+        "crop_production",
+        properties,
+        dataset_version,
+    )
+    # The global exposure is only needed to build the store
+    del GLOBAL_INDICATOR_CACHE[indicator_key]
+
+    return status
+
+
+def build_crop_production_stores() -> list[str]:
+    return [
+        build_crop_production_store(crop, irrigation_status)
+        for crop, irrigation_status in CROP_PRODUCTION_EXPOSURES
+    ]
+
+
 def calculate_hazards_for_admin1(
     admin1_shape: list[geopandas.geoseries.GeoSeries],
     country: str,
@@ -319,33 +683,247 @@ def calculate_hazards_for_admin1(
     elif indicator == "storm_europe":
         indicator_key = "storm-europe"
 
-    admin1_indicator_data = CLIENT.get_hazard(
-        indicator,
-        properties=climada_properties,
-    )
+    hazard_reductions = get_hazard_reductions(indicator, climada_properties)
 
-    latitudes = admin1_indicator_data.centroids.lat.round(5)
-    longitudes = admin1_indicator_data.centroids.lon.round(5)
-    max_intensity = np.max(admin1_indicator_data.intensity, axis=0).toarray().flatten()
+    latitudes = hazard_reductions["latitude"].round(5)
+    longitudes = hazard_reductions["longitude"].round(5)
+
+    # Intensity transforms run on the arrays, the dataframe index keeps the centroid positions
+    max_intensity, keep = transform_intensity_values(hazard_reductions["max_intensity"], indicator)
+    centroid_positions = np.arange(len(max_intensity))
+    if keep is not None:
+        centroid_positions = np.flatnonzero(keep)
     admin1_indicator_gdf = pd.DataFrame(
-        {"latitude": latitudes, "longitude": longitudes, "value": max_intensity}
+        {
+            "latitude": latitudes[centroid_positions],
+            "longitude": longitudes[centroid_positions],
+            "value": max_intensity[centroid_positions],
+        },
+        index=centroid_positions,
     )
 
-    admin1_indicator_gdf = filter_dataframe_with_intensity(admin1_indicator_gdf, indicator)
+    grid_key = (indicator, tuple(sorted(climada_properties.items())))
+    index_within = get_admin1_positions_on_grid(
+        admin1_shape, country, grid_key, longitudes, latitudes
+    )
+    if index_within is None:
+        index_within = get_admin1_positions(admin1_shape, country, grid_key, longitudes, latitudes)
 
     admin1_indicator_gdf = filter_dataframe_with_geometry(
-        admin1_indicator_gdf, admin1_shape, indicator_key
+        admin1_indicator_gdf, admin1_shape, indicator_key, index_within=index_within
     )
 
     return admin1_indicator_gdf
 
 
+def get_admin1_positions_on_grid(
+    admin1_shape: list[geopandas.geoseries.GeoSeries],
+    country: str,
+    grid_key: tuple,
+    longitudes: np.ndarray,
+    latitudes: np.ndarray,
+) -> np.ndarray | None:
+    """Split a hazard grid between all the admin1 shapes for a country using
+    spatial_index.grid_indices_within, caching the split for the most recent grid
+
+    Arguments:
+        admin1_shape {list[geopandas.geoseries.GeoSeries]} -- admin1 shape, as from
+                                                              get_admin1_shapes_from_hdx
+        country {str} -- full name of country
+        grid_key {tuple} -- identifies the hazard the points come from
+        longitudes {np.ndarray} -- hazard centroid longitudes
+        latitudes {np.ndarray} -- hazard centroid latitudes
+
+    Returns:
+        np.ndarray | None -- positions of the centroids within admin1_shape, or None if the
+                             centroids are not on a regular grid or the shape is not one of the
+                             country's admin1 shapes
+    """
+    if not USE_ADMIN_LABEL_GRID:
+        return None
+
+    if grid_key not in ADMIN_LABEL_GRID_CACHE:
+        ADMIN_LABEL_GRID_CACHE.clear()
+        _, admin1_shapes = get_admin1_shapes_from_hdx(Country.get_iso3_country_code(country))
+        with span("spatial_filter"):
+            admin1_positions = grid_indices_within(longitudes, latitudes, admin1_shapes)
+        increment("points_filtered", len(longitudes))
+        if admin1_positions is None:
+            LOGGER.info(f"Centroids for {grid_key[0]} are not on a regular grid")
+        ADMIN_LABEL_GRID_CACHE[grid_key] = (admin1_shapes, admin1_positions)
+
+    admin1_shapes, admin1_positions = ADMIN_LABEL_GRID_CACHE[grid_key]
+    shape_number = get_shape_number(admin1_shapes, admin1_shape)
+    if admin1_positions is None or shape_number is None:
+        return None
+
+    return admin1_positions[shape_number]
+
+
+def get_hazard_from_cache(
+    climada_indicator: str, climada_properties: dict
+) -> tuple[climada.hazard.base.Hazard, np.ndarray]:
+    """Get a hazard from the CLIMADA API along with its maximum intensity over all events for each
+    centroid, both are cached so they are only fetched and calculated once per country
+
+    Arguments:
+        climada_indicator {str} -- CLIMADA data type i.e. tropical_cyclone rather than
+                                   tropical-cyclone
+        climada_properties {dict} -- properties to pass to the CLIMADA engine, including
+                                     country_iso3alpha
+
+    Returns:
+        tuple[climada.hazard.base.Hazard, np.ndarray] -- the hazard and its per centroid maximum
+    """
+    cache_key = (climada_indicator, tuple(sorted(climada_properties.items())))
+    if cache_key in HAZARD_CACHE:
+        increment("hazard_cache_hit")
+        HAZARD_CACHE.move_to_end(cache_key)
+        return HAZARD_CACHE[cache_key]
+
+    increment("hazard_cache_miss")
+    with span("hazard_fetch"):
+        hazard = get_client().get_hazard(
+            climada_indicator,
+            properties=climada_properties,
+        )
+    max_intensity = np.max(hazard.intensity, axis=0).toarray().flatten()
+    HAZARD_CACHE[cache_key] = (hazard, max_intensity)
+
+    while len(HAZARD_CACHE) > 1 and (
+        sum(estimate_hazard_bytes(*x) for x in HAZARD_CACHE.values()) > HAZARD_CACHE_MAX_BYTES
+    ):
+        evicted_key, _ = HAZARD_CACHE.popitem(last=False)
+        LOGGER.info(f"Evicted {evicted_key} from the hazard cache")
+
+    return hazard, max_intensity
+
+
+def get_hazard_reductions(climada_indicator: str, climada_properties: dict) -> dict:
+    """Get the centroid locations, per centroid maximum intensity, event dates and event names for
+    a hazard. These are read from the local hazard store, only loading the full hazard from the
+    CLIMADA API if the store is missing or the dataset version has changed.
+
+    Arguments:
+        climada_indicator {str} -- CLIMADA data type i.e. tropical_cyclone rather than
+                                   tropical-cyclone
+        climada_properties {dict} -- properties to pass to the CLIMADA engine, including
+                                     country_iso3alpha
+
+    Returns:
+        dict -- arrays keyed by hazard_store.HAZARD_REDUCTIONS
+    """
+    cache_key = (climada_indicator, tuple(sorted(climada_properties.items())))
+    if cache_key in HAZARD_REDUCTIONS_CACHE:
+        return HAZARD_REDUCTIONS_CACHE[cache_key]
+
+    with span("hazard_fetch"):
+        dataset_info = get_client().get_dataset_info(
+            data_type=climada_indicator, properties=climada_properties
+        )
+        dataset_version = {"uuid": dataset_info.uuid, "version": dataset_info.version}
+        store_directory = make_hazard_store_directory(climada_indicator, climada_properties)
+
+        hazard_reductions = read_hazard_reductions(store_directory, dataset_version)
+    if hazard_reductions is not None:
+        increment("hazard_store_hit")
+    else:
+        increment("hazard_store_miss")
+        hazard, max_intensity = get_hazard_from_cache(climada_indicator, climada_properties)
+        hazard_reductions = {
+            "latitude": hazard.centroids.lat,
+            "longitude": hazard.centroids.lon,
+            "max_intensity": max_intensity,
+            "date": hazard.date,
+            "event_name": hazard.event_name,
+        }
+        status = write_hazard_reductions(
+            store_directory,
+            hazard_reductions,
+            climada_indicator,
+            climada_properties,
+            dataset_version,
+        )
+        LOGGER.info(status)
+
+    HAZARD_REDUCTIONS_CACHE[cache_key] = hazard_reductions
+
+    return hazard_reductions
+
+
+def get_hazard_event_names(country: str, indicator: str) -> list[str]:
+    """Get the names of all the events in the hazard for a country, from the local hazard store
+    where possible
+
+    Arguments:
+        country {str} -- full name of country
+        indicator {str} -- an indicator in HAZARD_DATA_TYPES
+
+    Returns:
+        list[str] -- event names
+    """
+    climada_indicator, climada_properties = HAZARD_DATA_TYPES[indicator]
+    climada_properties = climada_properties.copy()
+    climada_properties["country_iso3alpha"] = Country.get_iso3_country_code(country)
+
+    hazard_reductions = get_hazard_reductions(climada_indicator, climada_properties)
+    return [str(x) for x in hazard_reductions["event_name"]]
+
+
+def get_climada_datasets(country: str, indicator: str) -> list[tuple[str, dict]]:
+    """The CLIMADA API datasets fetched to process an indicator for a country, used to download
+    them ahead of time. LitPop is built from local nightlight and population files so has none
+
+    Arguments:
+        country {str} -- full name of country
+        indicator {str} -- which indicator we are processing
+
+    Returns:
+        list[tuple[str, dict]] -- CLIMADA data type and properties for each dataset
+    """
+    climada_datasets = []
+    if indicator in HAZARD_DATA_TYPES:
+        climada_indicator, climada_properties = HAZARD_DATA_TYPES[indicator]
+        climada_properties = climada_properties.copy()
+        climada_properties["country_iso3alpha"] = Country.get_iso3_country_code(country)
+        climada_datasets.append((climada_indicator, climada_properties))
+    elif indicator == "crop-production":
+        for crop, irrigation_status in CROP_PRODUCTION_EXPOSURES:
+            properties = get_crop_production_properties(crop, irrigation_status)
+            climada_datasets.append(("crop_production", properties))
+
+    return climada_datasets
+
+
+def count_hazard_centroids(country: str, indicator: str) -> int | None:
+    # Number of centroids in the hazard for a country from the local hazard store, this does not
+    # call the CLIMADA API so returns None if the hazard has not been stored yet
+    if indicator not in HAZARD_DATA_TYPES:
+        return None
+    climada_indicator, climada_properties = HAZARD_DATA_TYPES[indicator]
+    climada_properties = climada_properties.copy()
+    climada_properties["country_iso3alpha"] = Country.get_iso3_country_code(country)
+
+    store_directory = make_hazard_store_directory(climada_indicator, climada_properties)
+    return count_stored_centroids(store_directory)
+
+
+def estimate_hazard_bytes(hazard: climada.hazard.base.Hazard, max_intensity: np.ndarray) -> int:
+    n_bytes = max_intensity.nbytes
+    for matrix in [hazard.intensity, hazard.fraction]:
+        if sparse.issparse(matrix):
+            n_bytes += matrix.data.nbytes + matrix.indices.nbytes + matrix.indptr.nbytes
+    n_bytes += hazard.centroids.lat.nbytes + hazard.centroids.lon.nbytes
+    return n_bytes
+
+
 def calculate_indicator_timeseries_admin(
     country: str,
     indicator: str = "earthquake",
     climada_properties: dict = None,
     test_run: bool = False,
     verbose: bool = False,
+    skip_event_names: set = None,
 ) -> list[dict]:
     global SPATIAL_FILTER_CACHE
     SPATIAL_FILTER_CACHE = {}
@@ -382,10 +960,7 @@ def calculate_indicator_timeseries_admin(
     else:
         climada_properties["country_iso3alpha"] = country_iso3alpha
 
-    indicator_data = CLIENT.get_hazard(
-        climada_indicator,
-        properties=climada_properties,
-    )
+    indicator_data, _ = get_hazard_from_cache(climada_indicator, climada_properties)
 
     if indicator == "flood" and country in ["Colombia", "Nigeria", "Sudan", "Venezuela"]:
         indicator_data = flood_timeseries_data_shim(indicator_data)
@@ -397,86 +972,220 @@ def calculate_indicator_timeseries_admin(
 
     latitudes = indicator_data.centroids.lat
     longitudes = indicator_data.centroids.lon
-    events = []
+    # The centroid grid is the same for every event so the centroid to admin shape assignment is
+    # made just once
+    increment("points_filtered", len(longitudes))
+    with span("spatial_filter"):
+        admin_positions = None
+        if USE_ADMIN_LABEL_GRID:
+            admin_positions = grid_indices_within(longitudes, latitudes, admin_shapes)
+        if admin_positions is None:
+            assignment = AdminShapeIndex(admin_shapes).assignment_matrix(longitudes, latitudes)
+        else:
+            assignment = sparse.csr_matrix(
+                (
+                    np.ones(sum(len(x) for x in admin_positions)),
+                    (
+                        np.concatenate(admin_positions),
+                        np.repeat(
+                            np.arange(len(admin_positions)), [len(x) for x in admin_positions]
+                        ),
+                    ),
+                ),
+                shape=(len(longitudes), len(admin_positions)),
+            )
+
     n_events = indicator_data.intensity.shape[0]
-    n_shapes = len(admin_shapes)
-    for i, event_intensity in enumerate(indicator_data.intensity):
-        if selected_model is not None and not indicator_data.event_name[i].endswith(selected_model):
-            continue
-        values = event_intensity.toarray().flatten()
-        if sum(values) == 0.0:
-            continue
-        country_data = pd.DataFrame(
-            {
-                "latitude": latitudes,
-                "longitude": longitudes,
-                "value": values,
-            }
+    selected_events = np.flatnonzero(np.asarray(indicator_data.intensity.sum(axis=1)).ravel())
+    if selected_model is not None:
+        selected_events = np.array(
+            [i for i in selected_events if indicator_data.event_name[i].endswith(selected_model)],
+            dtype=np.int64,
+        )
+    if skip_event_names:
+        selected_events = np.array(
+            [i for i in selected_events if indicator_data.event_name[i] not in skip_event_names],
+            dtype=np.int64,
+        )
+    if test_run:
+        selected_events = selected_events[0:1]
+    LOGGER.info(f"**Processing {len(selected_events)} of {n_events} events**")
+    increment("events_processed", len(selected_events))
+
+    with span("aggregation"):
+        event_admin_table = aggregate_events_by_admin(
+            indicator,
+            indicator_data.intensity[selected_events],
+            assignment,
+            latitudes,
+            longitudes,
         )
 
-        country_data = filter_dataframe_with_intensity(country_data, indicator)
-
-        LOGGER.info(f"**Processing event {i} of {n_events}**")
-        for j, admin_shape in enumerate(admin_shapes):
-            # Switch off caching for flood because the filter above stops it working
-            if indicator == "flood":
-                cache_key = None
-            else:
-                cache_key = f"{admin1_names[j]}-{admin2_names[j]}"
-            admin_indicator_gdf = filter_dataframe_with_geometry(
-                country_data, admin_shape, indicator_key, cache_key=cache_key
+    events = []
+    for k, event_number in enumerate(event_admin_table["event"]):
+        i = selected_events[event_number]
+        j = event_admin_table["shape"][k]
+        value = event_admin_table["value"][k]
+        if indicator in ["river-flood"]:
+            model_name = indicator_data.event_name[i][5:]
+            indicator_key = f"river-flood.{model_name}"
+        event_date = datetime.datetime.fromordinal(int(indicator_data.date[i])).isoformat()
+        if verbose:
+            LOGGER.info(
+                f"{country_iso3alpha}-{admin1_names[j]}-{admin2_names[j]} "
+                f"Event on {event_date[0:10]}  MaxInt:{value:0.2f}"
             )
-            if verbose:
-                LOGGER.info(
-                    f"Processing shape {j} of {n_shapes} "
-                    f"{country_iso3alpha}-{admin1_names[j]}-{admin2_names[j]}"
-                )
-
-            value, aggregation = aggregate_value(indicator, admin_indicator_gdf)
-
-            if indicator in ["river-flood"]:
-                model_name = indicator_data.event_name[i][5:]
-                indicator_key = f"river-flood.{model_name}"
-            if value > 0.0:
-                event_date = datetime.datetime.fromordinal(int(indicator_data.date[i])).isoformat()
-                if verbose:
-                    LOGGER.info(f"Event on {event_date[0:10]}  MaxInt:{value:0.2f}")
-                events.append(
-                    {
-                        "country_name": country,
-                        "admin1_name": admin1_names[j],
-                        "admin2_name": admin2_names[j],
-                        "latitude": round(admin_indicator_gdf["latitude"].mean(), 4),
-                        "longitude": round(admin_indicator_gdf["longitude"].mean(), 4),
-                        "aggregation": aggregation,
-                        "indicator": indicator_key,
-                        "event_date": event_date,
-                        "value": value,
-                    }
-                )
-        if test_run:
-            break
+        events.append(
+            {
+                "country_name": country,
+                "admin1_name": admin1_names[j],
+                "admin2_name": admin2_names[j],
+                "latitude": event_admin_table["latitude"][k],
+                "longitude": event_admin_table["longitude"][k],
+                "aggregation": event_admin_table["aggregation"],
+                "indicator": indicator_key,
+                "event_date": event_date,
+                "value": value,
+            }
+        )
 
-    print(f"CACHE_HIT: {CACHE_HIT}", flush=True)
-    print(f"CACHE_MISS: {CACHE_MISS}", flush=True)
     return events
 
 
 def aggregate_value(indicator: str, filtered_df: pd.DataFrame) -> tuple[float, str]:
     aggregation = "sum"
-    if indicator.startswith("earthquake") or indicator in ["tropical-cyclone", "storm-europe"]:
+    aggregation_mode = get_aggregation_mode(indicator)
+    if aggregation_mode == "max":
         value = round(filtered_df["value"].max(), 2)
         aggregation = "max"
-    elif indicator in ["wildfire", "river-flood", "flood"]:
+    elif aggregation_mode == "count":
         mask_df = filtered_df[filtered_df["value"] != 0.0]
         value = round(len(mask_df), 0)
-    elif indicator.startswith("crop-production") or indicator in ["litpop"]:
+    else:
         value = round(filtered_df["value"].sum(), 0)
+
+    return value, aggregation
+
+
+def get_aggregation_mode(indicator: str) -> str:
+    if indicator.startswith("earthquake") or indicator in ["tropical-cyclone", "storm-europe"]:
+        aggregation_mode = "max"
+    elif indicator in ["wildfire", "river-flood", "flood"]:
+        aggregation_mode = "count"
+    elif indicator.startswith("crop-production") or indicator in ["litpop"]:
+        aggregation_mode = "sum"
     else:
         print(f"Indicator {indicator} not implemented in climada_interface:aggregate_value")
         raise NotImplementedError
 
-    return value, aggregation
+    return aggregation_mode
+
+
+def aggregate_events_by_admin(
+    indicator: str,
+    intensity: sparse.csr_matrix,
+    assignment: sparse.csr_matrix,
+    latitudes: np.ndarray,
+    longitudes: np.ndarray,
+) -> dict[str, np.ndarray]:
+    """The sparse equivalent of aggregate_value applied to every event and admin shape at once.
+    Only non-zero intensities are touched, each one is expanded to the admin shapes its centroid
+    lies within and reduced by (event, admin shape).
+
+    Arguments:
+        indicator {str} -- which indicator we are processing, this sets the aggregation
+        intensity {sparse.csr_matrix} -- n_events x n_centroids hazard intensity
+        assignment {sparse.csr_matrix} -- n_centroids x n_shapes from
+                                          AdminShapeIndex.assignment_matrix
+        latitudes {np.ndarray} -- centroid latitudes
+        longitudes {np.ndarray} -- centroid longitudes
+
+    Returns:
+        dict[str, np.ndarray] -- "event", "shape", "value", "latitude" and "longitude" arrays for
+                                 each (event, shape) with a value greater than zero, ordered by
+                                 event then shape. "aggregation" holds the aggregation name
+    """
+    aggregation = "sum"
+    n_shapes = assignment.shape[1]
+
+    intensity = intensity.tocsr(copy=True)
+    intensity.eliminate_zeros()
+    entry_events = np.repeat(np.arange(intensity.shape[0]), np.diff(intensity.indptr))
+    entry_centroids = intensity.indices
+    entry_values, keep = transform_intensity_values(intensity.data, indicator)
+    if keep is not None:
+        entry_events = entry_events[keep]
+        entry_centroids = entry_centroids[keep]
+        entry_values = entry_values[keep]
+
+    # Expand each non-zero entry once for every admin shape its centroid is assigned to
+    shapes_per_entry = np.diff(assignment.indptr)[entry_centroids]
+    expanded_entries = np.repeat(np.arange(len(entry_centroids)), shapes_per_entry)
+    expanded_offsets = np.arange(len(expanded_entries)) - np.repeat(
+        np.cumsum(shapes_per_entry) - shapes_per_entry, shapes_per_entry
+    )
+    expanded_shapes = assignment.indices[
+        np.repeat(assignment.indptr[entry_centroids], shapes_per_entry) + expanded_offsets
+    ]
+
+    cell_keys, cell_inverse = np.unique(
+        entry_events[expanded_entries].astype(np.int64) * n_shapes + expanded_shapes,
+        return_inverse=True,
+    )
+    expanded_values = entry_values[expanded_entries]
+    cell_counts = np.bincount(cell_inverse, minlength=len(cell_keys))
+
+    aggregation_mode = get_aggregation_mode(indicator)
+    if aggregation_mode == "max":
+        cell_values = np.full(len(cell_keys), -np.inf)
+        np.maximum.at(cell_values, cell_inverse, expanded_values)
+        cell_values = np.round(cell_values, 2)
+        aggregation = "max"
+    elif aggregation_mode == "count":
+        cell_values = cell_counts
+    else:
+        cell_values = np.round(
+            np.bincount(cell_inverse, weights=expanded_values, minlength=len(cell_keys))
+        )
+
+    cell_events = cell_keys // n_shapes
+    cell_shapes = cell_keys % n_shapes
+
+    # Flood drops zero intensity centroids so the mean location depends on the event, otherwise it
+    # is the mean over all of the centroids in the admin shape
+    if indicator == "flood":
+        expanded_centroids = entry_centroids[expanded_entries]
+        cell_latitudes = (
+            np.bincount(
+                cell_inverse, weights=latitudes[expanded_centroids], minlength=len(cell_keys)
+            )
+            / cell_counts
+        )
+        cell_longitudes = (
+            np.bincount(
+                cell_inverse, weights=longitudes[expanded_centroids], minlength=len(cell_keys)
+            )
+            / cell_counts
+        )
+    else:
+        shape_counts = np.asarray(assignment.sum(axis=0)).ravel()
+        with np.errstate(invalid="ignore", divide="ignore"):
+            shape_latitudes = assignment.T @ latitudes / shape_counts
+            shape_longitudes = assignment.T @ longitudes / shape_counts
+        cell_latitudes = shape_latitudes[cell_shapes]
+        cell_longitudes = shape_longitudes[cell_shapes]
+
+    positive = cell_values > 0.0
+    event_admin_table = {
+        "event": cell_events[positive],
+        "shape": cell_shapes[positive],
+        "value": cell_values[positive],
+        "latitude": np.round(cell_latitudes[positive], 4),
+        "longitude": np.round(cell_longitudes[positive], 4),
+        "aggregation": aggregation,
+    }
+
+    return event_admin_table
 
 
 def get_country_iso_numeric(country):
@@ -498,24 +1207,65 @@ def calculate_centroid(admin1_shape: list[geopandas.geoseries.GeoSeries]) -> Any
     return centroid
 
 
+def drop_zero_intensity(values: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    # Filter out zero entries to reduce the file size for flood
+    return values, values != 0.0
+
+
+def halve_grid_line_artefacts(values: np.ndarray) -> tuple[np.ndarray, np.ndarray | None]:
+    # Halve values over 600 for wildfire to remove grid line artefact, then halve values still over
+    # 600 a second time, these were the vertices
+    values = np.where(values > 600.0, values / 2.0, values)
+    values = np.where(values > 600.0, values / 2.0, values)
+    return values, None
+
+
+# Intensity transforms for each indicator, applied in order. A transform takes an array of
+# intensities and returns the new intensities and a mask of the entries to keep, or None to keep
+# them all. Indicators are matched with either the CLIMADA or HDX name, e.g. river_flood or
+# river-flood
+INTENSITY_TRANSFORMS = {
+    "flood": [drop_zero_intensity],
+    "wildfire": [halve_grid_line_artefacts],
+}
+
+
+def register_intensity_transform(indicator: str, transform: Callable):
+    INTENSITY_TRANSFORMS.setdefault(indicator, []).append(transform)
+
+
+def transform_intensity_values(
+    values: np.ndarray, indicator: str
+) -> tuple[np.ndarray, np.ndarray | None]:
+    """Apply the INTENSITY_TRANSFORMS for an indicator to an array of intensities, which may be the
+    maximum intensity at each centroid or the data of a sparse intensity matrix
+
+    Arguments:
+        values {np.ndarray} -- intensities
+        indicator {str} -- which indicator we are processing
+
+    Returns:
+        tuple[np.ndarray, np.ndarray | None] -- intensities the same length as values, and a mask of
+                                                the entries to keep or None to keep them all
+    """
+    keep = None
+    for transform in INTENSITY_TRANSFORMS.get(indicator.replace("_", "-"), []):
+        values, transform_keep = transform(values)
+        if transform_keep is not None:
+            keep = transform_keep if keep is None else keep & transform_keep
+
+    return values, keep
+
+
 def filter_dataframe_with_intensity(
     admin1_indicator_gdf: pd.DataFrame, indicator: str
 ) -> pd.DataFrame:
-    # Filter out zero entries to reduce the file size for flood
-    if indicator in ["flood"]:
-        admin1_indicator_gdf = admin1_indicator_gdf[admin1_indicator_gdf["value"] != 0.0]
-
-    # Halve values over 600 for wildfire to remove grid line artefact,
-    if indicator in ["wildfire"]:
-        admin1_indicator_gdf["value"] = admin1_indicator_gdf["value"].apply(
-            lambda x: x / 2.0 if x > 600.0 else x
-        )
-        # Further half values over 600.0 which were the vertices
-        admin1_indicator_gdf["value"] = admin1_indicator_gdf["value"].apply(
-            lambda x: x / 2.0 if x > 600.0 else x
-        )
+    values, keep = transform_intensity_values(admin1_indicator_gdf["value"].to_numpy(), indicator)
+    if keep is not None:
+        admin1_indicator_gdf = admin1_indicator_gdf[keep]
+        values = values[keep]
 
-    return admin1_indicator_gdf
+    return admin1_indicator_gdf.assign(value=values)
 
 
 def filter_dataframe_with_geometry(
@@ -523,31 +1273,31 @@ def filter_dataframe_with_geometry(
     admin1_shape: list[geopandas.geoseries.GeoSeries],
     indicator_key: str,
     cache_key: str = None,
+    index_within: np.ndarray = None,
 ) -> pd.DataFrame:
-    global CACHE_HIT, CACHE_MISS
-    admin1_indicator_geo_gdf = geopandas.GeoDataFrame(
-        admin1_indicator_gdf,
-        geometry=geopandas.points_from_xy(
-            admin1_indicator_gdf.longitude, admin1_indicator_gdf.latitude
-        ),
-    )
-
-    if cache_key is not None and cache_key in SPATIAL_FILTER_CACHE:
-        indices_within = SPATIAL_FILTER_CACHE[cache_key]
-        CACHE_HIT += 1
-    else:
-        indices_within = pd.Series(False, index=admin1_indicator_geo_gdf.index)
-        for shp in admin1_shape:
-            indices_within = indices_within | admin1_indicator_geo_gdf.geometry.within(shp)
-        SPATIAL_FILTER_CACHE[cache_key] = indices_within
-        CACHE_MISS += 1
-
-    admin1_indicator_geo_gdf = admin1_indicator_geo_gdf.loc[indices_within]
-
-    admin1_indicator_geo_gdf["indicator"] = len(admin1_indicator_geo_gdf) * [indicator_key]
-    admin1_indicator_geo_gdf = admin1_indicator_geo_gdf[
-        ["latitude", "longitude", "indicator", "value"]
+    # The cache holds the index labels of the points within the shape, so a cached answer remains
+    # valid for a dataframe which has had rows removed by filter_dataframe_with_intensity. Callers
+    # which have already found the points, e.g. from an admin label grid, pass them as index_within
+    if index_within is None and cache_key is not None and cache_key in SPATIAL_FILTER_CACHE:
+        index_within = SPATIAL_FILTER_CACHE[cache_key]
+        increment("spatial_filter_cache_hit")
+    elif index_within is None:
+        with span("spatial_filter"):
+            shape_index = AdminShapeIndex([admin1_shape])
+            positions_within = shape_index.indices_within(
+                admin1_indicator_gdf["longitude"].to_numpy(),
+                admin1_indicator_gdf["latitude"].to_numpy(),
+            )[0]
+            index_within = admin1_indicator_gdf.index[positions_within]
+        if cache_key is not None:
+            SPATIAL_FILTER_CACHE[cache_key] = index_within
+        increment("spatial_filter_cache_miss")
+        increment("points_filtered", len(admin1_indicator_gdf))
+
+    admin1_indicator_geo_gdf = admin1_indicator_gdf.loc[
+        admin1_indicator_gdf.index.isin(index_within), ["latitude", "longitude", "value"]
     ]
+    admin1_indicator_geo_gdf.insert(2, "indicator", len(admin1_indicator_geo_gdf) * [indicator_key])
 
     if len(admin1_indicator_geo_gdf) == 0:
         LOGGER.info("No rows inside geometry filter")
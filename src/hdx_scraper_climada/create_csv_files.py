@@ -1,14 +1,21 @@
 #!/usr/bin/env python
 # encoding: utf-8
 
+import csv
 import datetime
+import json
 import logging
 import os
+import shutil
 import time
 
-from collections import OrderedDict, deque
+from collections import Counter, OrderedDict, deque
+from collections.abc import Iterable, Iterator
 
+import numpy as np
 import pandas as pd
+import pyarrow
+import pyarrow.parquet
 
 from climada.util.api_client import Client
 
@@ -17,24 +24,31 @@ from hdx.utilities.easy_logging import setup_logging
 
 
 from hdx_scraper_climada.utilities import (
+    add_summary_file_index_rows,
+    get_summary_fragment_path,
+    get_summary_fragments,
+    read_summary_file_index,
+    write_summary_file_index,
     write_dictionary,
     HAS_TIMESERIES,
+    NO_DATA,
     get_set_of_countries_in_summary_file,
 )
 from hdx_scraper_climada.download_from_hdx import (
     get_admin1_shapes_from_hdx,
 )
+from hdx_scraper_climada.instrumentation import increment, reset_profile, span, write_profile
 
 from hdx_scraper_climada.climada_interface import (
     calculate_indicator_for_admin1,
     calculate_indicator_timeseries_admin,
     aggregate_value,
+    get_hazard_event_names,
 )
 
 setup_logging()
 LOGGER = logging.getLogger(__name__)
 
-
 HXL_TAGS = OrderedDict(
     [
         ("country_name", "#country"),
@@ -62,19 +76,38 @@ TIMESERIES_HXL_TAGS = OrderedDict(
 )
 
 
+# Column types for the Parquet copies of the CSV files. Values stay float64 because summary values
+# are sums in USD which float32 cannot hold to the nearest dollar. event_date stays an ISO format
+# string, as in the CSV files
+PARQUET_COLUMN_TYPES = {
+    "country_name": "category",
+    "admin1_name": "category",
+    "admin2_name": "category",
+    "latitude": np.float32,
+    "longitude": np.float32,
+    "aggregation": "category",
+    "indicator": "category",
+    "value": np.float64,
+}
+
+
 def export_indicator_data_to_csv(
     country: str = "Haiti",
     indicator: str = "litpop",
     export_directory: str = None,
+    incremental: bool = False,
+    merge: bool = True,
 ) -> list[str]:
     statuses = []
     t0 = time.time()
     n_lines = 0
     n_lines_timeseries = 0
+    reset_profile()
     LOGGER.info(f"\nProcessing {country}")
     # Construct file paths
     output_paths = make_detail_and_summary_file_paths(country, indicator, export_directory)
 
+    summary_rows = None
     if os.path.exists(output_paths["output_detail_path"]):
         LOGGER.info(f"Detail file for {country}-{indicator} already exists")
         statuses.append(f"Output file {output_paths['output_detail_path']} already exists")
@@ -82,10 +115,12 @@ def export_indicator_data_to_csv(
         # Make detail files
         LOGGER.info(f"Making detail file for {country}-{indicator}")
         try:
-            country_dataframes = create_detail_dataframes(country, indicator)
-            status = write_detail_data(country_dataframes, output_paths["output_detail_path"])
+            # Each admin1 dataframe is written and summarised as soon as it is calculated
+            status, summary_rows, n_lines = write_detail_and_summary_data(
+                generate_detail_dataframes(country, indicator), output_paths["output_detail_path"]
+            )
         except (Client.NoResult, AttributeError):
-            country_dataframes = None
+            summary_rows = None
             status = f"There is no CLIMADA data for {country}-{indicator}"
         statuses.append(status)
 
@@ -94,13 +129,12 @@ def export_indicator_data_to_csv(
         output_paths["output_summary_path"], indicator
     ):
         LOGGER.info(f"Making detail file for {country}-{indicator}")
-        if country_dataframes is None:
-            LOGGER.info(
-                f"No country_dataframes available to make summary file for {country}-{indicator}"
-            )
+        if summary_rows is None:
+            LOGGER.info(f"No summary rows available to make summary file for {country}-{indicator}")
         else:
-            summary_rows, n_lines = create_summary_data(country_dataframes)
-            status = write_summary_data(summary_rows, output_paths["output_summary_path"])
+            status = write_summary_fragment(
+                summary_rows, output_paths["output_summary_fragment_path"]
+            )
             statuses.append(status)
     else:
         LOGGER.info(f"Summary data for {country}-{indicator} already exists")
@@ -108,11 +142,32 @@ def export_indicator_data_to_csv(
 
     # Make timeseries summary file
     if indicator in HAS_TIMESERIES:
-        if country not in get_set_of_countries_in_summary_file(
+        timeseries_countries = get_set_of_countries_in_summary_file(
             output_paths["output_timeseries_path"], indicator
-        ):
+        )
+        processed_event_names = read_timeseries_event_names(
+            output_paths["output_timeseries_events_path"]
+        ).get(country)
+        make_timeseries = True
+        skip_event_names = None
+        if country not in timeseries_countries:
             LOGGER.info(f"Making timeseries summary file for {country}-{indicator}")
+        elif incremental and processed_event_names is not None:
+            LOGGER.info(f"Adding new events to timeseries summary file for {country}-{indicator}")
+            skip_event_names = set(processed_event_names)
+        elif incremental and country not in NO_DATA.get(indicator, set()):
+            LOGGER.info(
+                f"No record of the events in the timeseries summary for {country}-{indicator}, "
+                "it must be remade to be updated incrementally"
+            )
+            make_timeseries = False
+        else:
+            LOGGER.info(f"Timeseries summary data for {country}-{indicator} already exists")
+            make_timeseries = False
+
+        if make_timeseries:
             timeseries_summary_rows = []
+            event_names = None
             climada_properties = None
             if indicator == "river-flood":
                 climada_properties = {"climate_scenario": "historical"}
@@ -121,8 +176,12 @@ def export_indicator_data_to_csv(
 
             try:
                 timeseries_summary_rows = calculate_indicator_timeseries_admin(
-                    country, indicator=indicator, climada_properties=climada_properties
+                    country,
+                    indicator=indicator,
+                    climada_properties=climada_properties,
+                    skip_event_names=skip_event_names,
                 )
+                event_names = get_hazard_event_names(country, indicator)
             except TypeError:
                 LOGGER.info(
                     f".date attribute for {country}-{indicator} is malformed, "
@@ -134,14 +193,36 @@ def export_indicator_data_to_csv(
 
             if len(timeseries_summary_rows) != 0:
                 n_lines_timeseries = len(timeseries_summary_rows)
-                status = write_summary_data(
+                if skip_event_names is not None:
+                    # The country's published rows are kept and the new events added after them
+                    _ = seed_summary_fragments(output_paths["output_timeseries_path"], [country])
+                status = write_summary_fragment(
                     timeseries_summary_rows,
-                    output_paths["output_timeseries_path"],
+                    output_paths["output_timeseries_fragment_path"],
                     hxl_tags=TIMESERIES_HXL_TAGS,
+                    append=skip_event_names is not None,
                 )
                 statuses.append(status)
-        else:
-            LOGGER.info(f"Timeseries summary data for {country}-{indicator} already exists")
+
+            # Events are only recorded as processed once their rows are safely written, otherwise
+            # an incremental update would skip them
+            if event_names is not None:
+                LOGGER.info(
+                    record_timeseries_event_names(
+                        output_paths["output_timeseries_events_path"], country, event_names
+                    )
+                )
+
+    if merge:
+        LOGGER.info(merge_summary_fragments(output_paths["output_summary_path"], HXL_TAGS))
+        if indicator in HAS_TIMESERIES:
+            LOGGER.info(
+                merge_summary_fragments(output_paths["output_timeseries_path"], TIMESERIES_HXL_TAGS)
+            )
+
+    increment("summary_rows", n_lines)
+    increment("timeseries_summary_rows", n_lines_timeseries)
+    LOGGER.info(write_profile(country, indicator, export_directory))
 
     statuses.append(
         f"Processing for {country} took {time.time()-t0:0.0f} seconds "
@@ -172,28 +253,46 @@ def make_detail_and_summary_file_paths(
         export_directory, f"{indicator}", f"admin1-timeseries-summaries-{indicator}.csv"
     )
 
-    indicator_directory = os.path.dirname(file_path_dict["output_summary_path"])
-    if not os.path.exists(indicator_directory):
-        LOGGER.info(f"Creating {os.path.dirname(file_path_dict['output_summary_path'])}")
-        os.makedirs(os.path.dirname(file_path_dict["output_summary_path"]), exist_ok=True)
+    file_path_dict["output_summary_fragment_path"] = get_summary_fragment_path(
+        file_path_dict["output_summary_path"], country
+    )
+
+    file_path_dict["output_timeseries_fragment_path"] = get_summary_fragment_path(
+        file_path_dict["output_timeseries_path"], country
+    )
+
+    file_path_dict["output_timeseries_events_path"] = os.path.join(
+        export_directory,
+        f"{indicator}",
+        "fragments",
+        f"{country_str}-admin1-timeseries-events-{indicator}.json",
+    )
+
+    fragment_directory = os.path.dirname(file_path_dict["output_summary_fragment_path"])
+    if not os.path.exists(fragment_directory):
+        LOGGER.info(f"Creating {fragment_directory}")
+        os.makedirs(fragment_directory, exist_ok=True)
 
     return file_path_dict
 
 
 def create_detail_dataframes(country: str, indicator: str = "litpop") -> list:
+    return list(generate_detail_dataframes(country, indicator))
+
+
+def generate_detail_dataframes(country: str, indicator: str = "litpop") -> Iterator[pd.DataFrame]:
     country_iso3a = Country.get_iso3_country_code(country)
     # Get admin1 dataset
     admin1_names, admin1_shapes = get_admin1_shapes_from_hdx(country_iso3a)
 
     if len(admin1_names) == 0 and len(admin1_shapes) == 0:
         LOGGER.info(f"No Admin1 areas found for {country}")
-        return []
+        return
 
     LOGGER.info(f"Admin1 areas in {country}:")
     LOGGER.info(admin1_names)
 
-    # This chunk produces a list of dataframes from the supplied
-    country_dataframes = []
+    # This chunk yields a dataframe for each admin1 area in turn, so only one is held at a time
     n_regions = len(admin1_shapes)
     for i, admin1_shape in enumerate(admin1_shapes, start=0):
         if admin1_names[i] is None:
@@ -205,9 +304,7 @@ def create_detail_dataframes(country: str, indicator: str = "litpop") -> list:
         )
 
         LOGGER.info(f"Wrote {len(admin1_indicator_gdf)} lines")
-        country_dataframes.append(admin1_indicator_gdf)
-
-    return country_dataframes
+        yield admin1_indicator_gdf
 
 
 def create_summary_data(
@@ -231,7 +328,8 @@ def create_summary_data(
             row["latitude"] = round(filtered_df["latitude"].mean(), 4)
             row["longitude"] = round(filtered_df["longitude"].mean(), 4)
             row["indicator"] = indicator
-            value, aggregation = aggregate_value(indicator, filtered_df)
+            with span("aggregation"):
+                value, aggregation = aggregate_value(indicator, filtered_df)
             row["value"] = value
             row["aggregation"] = aggregation
 
@@ -244,44 +342,368 @@ def create_summary_data(
 def write_summary_data(summary_rows: list, output_summary_path: str, hxl_tags: dict = None) -> str:
     if hxl_tags is None:
         hxl_tags = HXL_TAGS
-    if not os.path.exists(output_summary_path):
+    country_row_counts = Counter(x["country_name"] for x in summary_rows)
+    newfile = not os.path.exists(output_summary_path)
+    if newfile:
+        summary_file_index = {"size": 0, "countries": {}}
         # This is slightly convoluted, but efficient
         # https://www.geeksforgeeks.org/python-perform-append-at-beginning-of-list/
         summary_rows = deque(summary_rows)
         summary_rows.appendleft(hxl_tags)
         summary_rows = list(summary_rows)
+    else:
+        summary_file_index = read_summary_file_index(output_summary_path)
 
     status = write_dictionary(
         output_summary_path,
         summary_rows,
         append=True,
     )
+
+    # The index records the byte range of this append against each country in it, the header
+    # and HXL tag rows of a new file are not part of the range
+    start = summary_file_index["size"]
+    if newfile:
+        with open(output_summary_path, "rb") as summary_file:
+            _ = summary_file.readline()
+            _ = summary_file.readline()
+            start = summary_file.tell()
+    stop = os.path.getsize(output_summary_path)
+    for country, n_rows in country_row_counts.items():
+        add_summary_file_index_rows(summary_file_index, country, n_rows, start, stop)
+    summary_file_index["size"] = stop
+    write_summary_file_index(output_summary_path, summary_file_index)
+    return status
+
+
+def write_summary_fragment(
+    summary_rows: list[dict],
+    fragment_path: str,
+    hxl_tags: dict = None,
+    append: bool = False,
+) -> str:
+    """Write one country's summary or timeseries summary rows to its own fragment file, replacing
+    any earlier fragment for the country unless append is True. Fragments have a header row but no
+    HXL tag row, they are combined into the published file by merge_summary_fragments
+
+    Arguments:
+        summary_rows {list[dict]} -- summary rows for a single country
+        fragment_path {str} -- path from get_summary_fragment_path
+
+    Keyword Arguments:
+        hxl_tags {dict} -- HXL tags giving the column order (default: {None})
+        append {bool} -- add the rows to an existing fragment (default: {False})
+
+    Returns:
+        str -- status message
+    """
+    if hxl_tags is None:
+        hxl_tags = HXL_TAGS
+    if len(summary_rows) == 0:
+        status = f"No summary rows provided for {fragment_path}"
+        return status
+
+    # The fragment is written in full to a temporary file so a failed run never leaves it partial
+    tmp_path = f"{fragment_path}.{os.getpid()}.tmp"
+    append = append and os.path.exists(fragment_path)
+    with span("csv_write"):
+        if append:
+            shutil.copyfile(fragment_path, tmp_path)
+        with open(tmp_path, "a", encoding="utf-8", errors="ignore") as fragment_file:
+            dict_writer = csv.DictWriter(fragment_file, list(hxl_tags.keys()), lineterminator="\n")
+            if not append:
+                dict_writer.writeheader()
+            dict_writer.writerows(summary_rows)
+        os.replace(tmp_path, fragment_path)
+
+    status = f"{len(summary_rows)} summary rows written to {fragment_path}"
+    return status
+
+
+def seed_summary_fragments(output_summary_path: str, countries: list[str] = None) -> str:
+    """Make fragments for countries in a published summary file which do not yet have one, so that
+    a summary file made before fragments were introduced survives the next merge
+
+    Arguments:
+        output_summary_path {str} -- path to the published summary file
+
+    Keyword Arguments:
+        countries {list[str]} -- only seed these countries, None for all (default: {None})
+
+    Returns:
+        str -- status message
+    """
+    if not os.path.exists(output_summary_path):
+        status = f"No published summary file {output_summary_path} to seed fragments from"
+        return status
+
+    summary_fragments = get_summary_fragments(output_summary_path)
+    summary_file_index = read_summary_file_index(output_summary_path)
+    n_seeded = 0
+    with open(output_summary_path, "rb") as summary_file:
+        header = summary_file.readline()
+        country_column = next(csv.reader([header.decode("utf-8")])).index("country_name")
+        for country, entry in summary_file_index["countries"].items():
+            if country in summary_fragments or (countries is not None and country not in countries):
+                continue
+            fragment_path = get_summary_fragment_path(output_summary_path, country)
+            with open(f"{fragment_path}.{os.getpid()}.tmp", "wb") as fragment_file:
+                fragment_file.write(header)
+                for start, stop in entry["ranges"]:
+                    summary_file.seek(start)
+                    for line in summary_file.read(stop - start).splitlines(keepends=True):
+                        row = next(csv.reader([line.decode("utf-8", errors="ignore")]))
+                        if row[country_column] == country:
+                            fragment_file.write(line)
+            os.replace(f"{fragment_path}.{os.getpid()}.tmp", fragment_path)
+            n_seeded += 1
+
+    status = f"Seeded {n_seeded} fragments from {output_summary_path}"
     return status
 
 
-def write_detail_data(country_dataframes: list[pd.DataFrame], output_file_path: str) -> str:
+def merge_summary_fragments(output_summary_path: str, hxl_tags: dict) -> str:
+    """Concatenate the per-country fragments of a summary or timeseries summary file into the
+    published file, in country name order, and write its index. Fragment bodies are copied as
+    bytes without being parsed
+
+    Arguments:
+        output_summary_path {str} -- path to the published summary file
+        hxl_tags {dict} -- HXL tags for the file, i.e. HXL_TAGS or TIMESERIES_HXL_TAGS
+
+    Returns:
+        str -- status message
+    """
+    _ = seed_summary_fragments(output_summary_path)
+    summary_fragments = get_summary_fragments(output_summary_path)
+    if len(summary_fragments) == 0:
+        status = f"No fragments to merge into {output_summary_path}"
+        return status
+
+    summary_file_index = {"size": 0, "countries": {}}
+    tmp_path = f"{output_summary_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8", newline="") as summary_file:
+        dict_writer = csv.DictWriter(summary_file, list(hxl_tags.keys()), lineterminator="\n")
+        dict_writer.writeheader()
+        dict_writer.writerow(hxl_tags)
+
+    with span("csv_write"), open(tmp_path, "ab") as summary_file:
+        for country in sorted(summary_fragments.keys()):
+            start = summary_file.tell()
+            with open(summary_fragments[country], "rb") as fragment_file:
+                _ = fragment_file.readline()
+                n_rows = 0
+                for line in fragment_file:
+                    summary_file.write(line)
+                    n_rows += 1
+            add_summary_file_index_rows(
+                summary_file_index, country, n_rows, start, summary_file.tell()
+            )
+        summary_file_index["size"] = summary_file.tell()
+
+    os.replace(tmp_path, output_summary_path)
+    write_summary_file_index(output_summary_path, summary_file_index)
+
+    status = f"Merged {len(summary_fragments)} fragments into {output_summary_path}"
+    return status
+
+
+def read_timeseries_event_names(events_path: str) -> dict:
+    if not os.path.exists(events_path):
+        return {}
+    with open(events_path, encoding="utf-8") as events_file:
+        return json.load(events_file)
+
+
+def record_timeseries_event_names(events_path: str, country: str, event_names: list[str]) -> str:
+    """Record the hazard events which have been processed into the timeseries summary file for a
+    country, so an incremental update only processes events which are new
+
+    Arguments:
+        events_path {str} -- path to the events file alongside the timeseries summary file
+        country {str} -- full name of country
+        event_names {list[str]} -- names of all of the events in the hazard
+
+    Returns:
+        str -- status message
+    """
+    recorded_event_names = read_timeseries_event_names(events_path)
+    recorded_event_names[country] = sorted(set(event_names))
+    with open(f"{events_path}.tmp", "w", encoding="utf-8") as events_file:
+        json.dump(recorded_event_names, events_file, indent=2, sort_keys=True)
+    os.replace(f"{events_path}.tmp", events_path)
+
+    status = f"Recorded {len(event_names)} {country} events in {events_path}"
+    return status
+
+
+def get_parquet_path(csv_path: str) -> str:
+    return f"{os.path.splitext(csv_path)[0]}.parquet"
+
+
+def convert_csv_to_parquet(csv_path: str, hxl_tags: dict, parquet_path: str = None) -> str:
+    """Write a Parquet copy of a detail, summary or timeseries CSV file with typed columns. The HXL
+    tag row is removed from the data and stored in the schema metadata under "hxl_tags". The copy
+    is only remade if the CSV file is newer
+
+    Arguments:
+        csv_path {str} -- path to a CSV file written by this module
+        hxl_tags {dict} -- HXL tags for the columns of the file, i.e. HXL_TAGS
+
+    Keyword Arguments:
+        parquet_path {str} -- output path, defaults to the CSV path with a .parquet extension
+                              (default: {None})
+
+    Returns:
+        str -- status message
+    """
+    if parquet_path is None:
+        parquet_path = get_parquet_path(csv_path)
+    if os.path.exists(parquet_path) and os.path.getmtime(parquet_path) >= os.path.getmtime(
+        csv_path
+    ):
+        status = f"Parquet file {parquet_path} is up to date"
+        return status
+
+    data = read_csv_data_file(csv_path)
+
+    table = pyarrow.Table.from_pandas(data, preserve_index=False)
+    metadata = table.schema.metadata or {}
+    metadata[b"hxl_tags"] = json.dumps(hxl_tags).encode("utf-8")
+    table = table.replace_schema_metadata(metadata)
+    pyarrow.parquet.write_table(table, f"{parquet_path}.tmp")
+    os.replace(f"{parquet_path}.tmp", parquet_path)
+
+    status = f"Parquet file {parquet_path} written with {len(data)} rows"
+    return status
+
+
+def read_data_file(csv_path: str) -> tuple[pd.DataFrame, dict]:
+    """Read a detail, summary or timeseries file, preferring an up to date Parquet copy
+
+    Arguments:
+        csv_path {str} -- path to a CSV file written by this module
+
+    Returns:
+        tuple[pd.DataFrame, dict] -- the data without the HXL tag row, and the HXL tags
+    """
+    parquet_path = get_parquet_path(csv_path)
+    if os.path.exists(parquet_path) and (
+        not os.path.exists(csv_path) or os.path.getmtime(parquet_path) >= os.path.getmtime(csv_path)
+    ):
+        table = pyarrow.parquet.read_table(parquet_path)
+        hxl_tags = json.loads(table.schema.metadata[b"hxl_tags"], object_pairs_hook=OrderedDict)
+        return table.to_pandas(), hxl_tags
+
+    hxl_tags = OrderedDict(pd.read_csv(csv_path, nrows=1, dtype=str).iloc[0].fillna("").to_dict())
+    return read_csv_data_file(csv_path), hxl_tags
+
+
+def read_csv_data_file(csv_path: str) -> pd.DataFrame:
+    # Both read_data_file and the Parquet copy type the columns here, so the data is the same
+    # whichever file it is read from. Blank names, such as admin2_name for admin1 level countries,
+    # are kept as empty strings rather than NaN
+    text_columns = ["event_date"] + [k for k, v in PARQUET_COLUMN_TYPES.items() if v == "category"]
+    data = pd.read_csv(
+        csv_path, skiprows=[1], dtype={x: str for x in text_columns}, keep_default_na=False
+    )
+    data = data.astype({k: v for k, v in PARQUET_COLUMN_TYPES.items() if k in data.columns})
+    return data
+
+
+def write_parquet_files(
+    countries: list[str], indicator: str, export_directory: str = None
+) -> list[str]:
+    statuses = []
+    for country in countries:
+        detail_path = make_detail_and_summary_file_paths(country, indicator, export_directory)[
+            "output_detail_path"
+        ]
+        if os.path.exists(detail_path):
+            statuses.append(convert_csv_to_parquet(detail_path, HXL_TAGS))
+
+    output_paths = make_detail_and_summary_file_paths("Haiti", indicator, export_directory)
+    if os.path.exists(output_paths["output_summary_path"]):
+        statuses.append(convert_csv_to_parquet(output_paths["output_summary_path"], HXL_TAGS))
+    if os.path.exists(output_paths["output_timeseries_path"]):
+        statuses.append(
+            convert_csv_to_parquet(output_paths["output_timeseries_path"], TIMESERIES_HXL_TAGS)
+        )
+
+    return statuses
+
+
+def write_detail_data(country_dataframes: Iterable[pd.DataFrame], output_file_path: str) -> str:
+    """Write admin1 dataframes to a detail file one at a time as they are produced, so that the
+    whole country's detail table is never held in memory. The file is written under a temporary
+    name and only moved into place once every dataframe has been written
+
+    Arguments:
+        country_dataframes {Iterable[pd.DataFrame]} -- admin1 dataframes, e.g. from
+                                                       generate_detail_dataframes
+        output_file_path {str} -- path to the detail file
+
+    Returns:
+        str -- status message
+    """
     if os.path.exists(output_file_path):
         status = f"Output file {output_file_path} already exists, not overwriting"
         return status
 
-    if len(country_dataframes) == 0:
+    columns = list(HXL_TAGS.keys())
+    tmp_path = f"{output_file_path}.{os.getpid()}.tmp"
+    n_dataframes = 0
+    try:
+        pd.DataFrame([HXL_TAGS]).to_csv(tmp_path, index=False)
+        for df in country_dataframes:
+            n_dataframes += 1
+            if len(df) != 0:
+                with span("csv_write"):
+                    df.to_csv(tmp_path, mode="a", header=False, index=False, columns=columns)
+        if n_dataframes != 0:
+            os.replace(tmp_path, output_file_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    if n_dataframes == 0:
         status = "No country_dataframes provided"
         return status
-    country_indicator_gdf = pd.concat(country_dataframes, axis=0, ignore_index=True)
-    hxl_tag_row = pd.DataFrame([HXL_TAGS])
-    country_indicator_gdf = pd.concat(
-        [hxl_tag_row, country_indicator_gdf], axis=0, ignore_index=True
-    )
-    country_indicator_gdf.to_csv(
-        output_file_path,
-        index=False,
-    )
 
     status = f"Indicator data file written to {output_file_path}"
 
     return status
 
 
+def write_detail_and_summary_data(
+    country_dataframes: Iterable[pd.DataFrame], output_file_path: str
+) -> tuple[str, list[dict], int]:
+    """Write the detail file as in write_detail_data, making the summary rows for each admin1
+    dataframe as it passes through
+
+    Arguments:
+        country_dataframes {Iterable[pd.DataFrame]} -- admin1 dataframes
+        output_file_path {str} -- path to the detail file
+
+    Returns:
+        tuple[str, list[dict], int] -- status message, summary rows and number of detail lines
+    """
+    summary_rows = []
+    n_lines = 0
+
+    def summarise_dataframes() -> Iterator[pd.DataFrame]:
+        nonlocal n_lines
+        for df in country_dataframes:
+            admin1_summary_rows, admin1_n_lines = create_summary_data([df])
+            summary_rows.extend(admin1_summary_rows)
+            n_lines += admin1_n_lines
+            yield df
+
+    status = write_detail_data(summarise_dataframes(), output_file_path)
+
+    return status, summary_rows, n_lines
+
+
 if __name__ == "__main__":
     COUNTRY = "Colombia"
     INDICATOR = "flood"
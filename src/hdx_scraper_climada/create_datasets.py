@@ -1,6 +1,8 @@
 #!/usr/bin/env python
 # encoding: utf-8
 
+# pylint: disable=import-outside-toplevel
+
 import datetime
 import json
 import logging
@@ -9,17 +11,19 @@ import re
 import time
 import traceback
 
-import pandas
+from typing import TYPE_CHECKING
+
 import yaml
 
 from hdx.utilities.easy_logging import setup_logging
-from hdx.api.configuration import Configuration, ConfigurationError
-from hdx.data.dataset import Dataset
-from hdx.data.resource import Resource
-from hdx.data.showcase import Showcase
 
 from hdx_scraper_climada.utilities import read_attributes, read_countries, NO_DATA
 
+# The HDX API and pandas are slow to import so they are imported in the functions which use them,
+# this keeps the CLI quick to start for commands which do not talk to HDX
+if TYPE_CHECKING:
+    from hdx.data.dataset import Dataset
+
 setup_logging()
 LOGGER = logging.getLogger(__name__)
 
@@ -122,6 +126,8 @@ def make_countries_group(dataset_name: str) -> list[dict]:
 
 
 def configure_hdx_connection(hdx_site: str = "stage"):
+    from hdx.api.configuration import Configuration, ConfigurationError
+
     try:
         Configuration.delete()
         Configuration.create(
@@ -141,6 +147,8 @@ def configure_hdx_connection(hdx_site: str = "stage"):
 def compile_resource_list(
     dataset_attributes: dict, countries_data: list[dict], test_run: bool = False
 ) -> list[dict]:
+    from hdx.data.resource import Resource
+
     resource_names = dataset_attributes["resource"]
     resource_list = []
     for resource_name in resource_names:
@@ -193,6 +201,8 @@ def compile_resource_list(
 
 
 def compile_showcase_list(dataset_attributes: dict):
+    from hdx.data.showcase import Showcase
+
     showcase_list = []
 
     showcase_names = dataset_attributes.get("showcase", [])
@@ -219,7 +229,10 @@ def compile_showcase_list(dataset_attributes: dict):
 
 def create_or_fetch_base_dataset(
     dataset_name: str, dataset_attributes: dict, hdx_site: str = "stage", force_create: bool = False
-) -> tuple[Dataset, bool]:
+) -> tuple["Dataset", bool]:
+    from hdx.api.configuration import Configuration
+    from hdx.data.dataset import Dataset
+
     configure_hdx_connection(hdx_site=hdx_site)
     dataset = Dataset.read_from_hdx(dataset_name)
     is_new = True
@@ -252,7 +265,7 @@ def create_or_fetch_base_dataset(
     return dataset, is_new
 
 
-def add_quickchart(dataset: Dataset, dataset_attributes: dict) -> tuple[str, Dataset]:
+def add_quickchart(dataset: "Dataset", dataset_attributes: dict) -> tuple[str, "Dataset"]:
     status = ""
 
     resource_name = dataset_attributes.get("quickchart_resource_name", None)
@@ -324,20 +337,30 @@ def get_date_range_from_timeseries_file(
         timeseries_path = os.path.join(
             output_directory, dataset_attributes["output_subdirectory"], timeseries_filename
         )
-        # Load file if it exists
-        timeseries_data = pandas.read_csv(timeseries_path, low_memory=False)
-        timeseries_data.drop(timeseries_data.head(1).index, inplace=True)
+        date_range = read_date_range_from_timeseries_file(timeseries_path)
 
-        # Extract first and last date
-        start_date = timeseries_data["event_date"].min()
-        end_date = timeseries_data["event_date"].max()
+    return date_range
+
+
+def read_date_range_from_timeseries_file(timeseries_path: str) -> str:
+    import pandas
 
-        date_range = f"[{start_date} TO {end_date}]"
+    # Load file if it exists
+    timeseries_data = pandas.read_csv(timeseries_path, low_memory=False)
+    timeseries_data.drop(timeseries_data.head(1).index, inplace=True)
+
+    # Extract first and last date
+    start_date = timeseries_data["event_date"].min()
+    end_date = timeseries_data["event_date"].max()
+
+    date_range = f"[{start_date} TO {end_date}]"
 
     return date_range
 
 
 def get_date_range_from_hdx(indicator: str, hdx_site: str = "stage", dataset_name: str = None):
+    from hdx.data.dataset import Dataset
+
     configure_hdx_connection(hdx_site=hdx_site)
     if dataset_name is None:
         dataset_name = f"climada-{indicator}-dataset"
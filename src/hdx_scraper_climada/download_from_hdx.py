@@ -2,21 +2,31 @@
 # encoding: utf-8
 
 import fnmatch
+import json
 import os
 import logging
+import shutil
 
 from pathlib import Path
 
 import geopandas
+import pyarrow.parquet
 
 import climada.util.coordinates as u_coord
 
 from hdx.data.dataset import Dataset
 from hdx.utilities.easy_logging import setup_logging
 from hdx_scraper_climada.create_datasets import configure_hdx_connection
+from hdx_scraper_climada.instrumentation import increment, span
 
 ADMIN1_GEOMETRY_FOLDER = os.path.join(os.path.dirname(__file__), "admin1_geometry")
 UNMAP_DATASET_NAME = "unmap-international-boundaries-geojson"
+# The column holding the ISO3 country code in each boundary file, used to partition the file
+BOUNDARY_FILE_ISO3_COLUMNS = {
+    "polbnda_adm1_1m_ocha.geojson": "alpha_3",
+    "polbnda_adm2_1m_ocha.geojson": "alpha_3",
+    "geoBoundariesCGAZ_ADM1.geojson": "shapeGroup",
+}
 
 setup_logging()
 LOGGER = logging.getLogger(__name__)
@@ -51,26 +61,167 @@ def download_hdx_admin1_boundaries(
     return subn_resources
 
 
-def get_admin1_shapes_from_hdx(country_iso3a):
-    admin1_file_path = os.path.join(ADMIN1_GEOMETRY_FOLDER, "polbnda_adm1_1m_ocha.geojson")
+def read_admin_boundaries_for_country(file_name: str, country_iso3a: str) -> geopandas.GeoDataFrame:
+    """Read the rows of a global boundary file for a single country from its GeoParquet partition,
+    converting the GeoJSON file to partitions first if required
+
+    Arguments:
+        file_name {str} -- a boundary file name from BOUNDARY_FILE_ISO3_COLUMNS
+        country_iso3a {str} -- ISO3 country code
+
+    Returns:
+        geopandas.GeoDataFrame -- boundaries for the country, with no rows if there are none
+    """
+    partition_directory = convert_admin_boundaries_to_geoparquet(file_name)
+    partition_path = os.path.join(partition_directory, f"{country_iso3a.upper()}.parquet")
+    if not os.path.exists(partition_path):
+        partition_path = os.path.join(partition_directory, "_empty.parquet")
+
+    return geopandas.read_parquet(partition_path)
+
+
+def convert_admin_boundaries_to_geoparquet(file_name: str) -> str:
+    """Split a global boundary GeoJSON file into one GeoParquet file per country. This is done once,
+    and again only if the GeoJSON file changes, so later reads for a country take milliseconds
+    rather than seconds to parse the whole file
+
+    Arguments:
+        file_name {str} -- a boundary file name from BOUNDARY_FILE_ISO3_COLUMNS
+
+    Returns:
+        str -- the directory holding the partitions
+    """
+    file_path = os.path.join(ADMIN1_GEOMETRY_FOLDER, file_name)
 
-    if not os.path.exists(admin1_file_path):
+    if not os.path.exists(file_path):
         raise FileNotFoundError(
-            f"{admin1_file_path} was not found, run `download_admin1_geometry.py` to download"
+            f"{file_path} was not found, run `download_admin1_geometry.py` to download"
         )
 
-    admin1_gpd = geopandas.read_file(admin1_file_path)
-
-    admin1_for_country = admin1_gpd[admin1_gpd["alpha_3"] == country_iso3a.upper()]
+    partition_directory = os.path.join(ADMIN1_GEOMETRY_FOLDER, file_name.replace(".geojson", ""))
+    manifest_path = os.path.join(partition_directory, "_manifest.json")
+    source_stat = os.stat(file_path)
+    source = {"size": source_stat.st_size, "mtime": source_stat.st_mtime}
+    if os.path.exists(manifest_path):
+        with open(manifest_path, encoding="utf-8") as manifest_file:
+            if json.load(manifest_file) == source:
+                return partition_directory
+
+    # The partitions are written to a directory of their own and renamed into place, so a process
+    # reading the partitions never sees one which another process is still writing
+    tmp_directory = f"{partition_directory}.{os.getpid()}.tmp"
+    old_directory = f"{partition_directory}.{os.getpid()}.old"
+    LOGGER.info(f"Partitioning {file_path} by country into {partition_directory}")
+    shutil.rmtree(tmp_directory, ignore_errors=True)
+    Path(tmp_directory).mkdir(parents=True)
+    boundaries_gpd = geopandas.read_file(file_path)
+    iso3_column = BOUNDARY_FILE_ISO3_COLUMNS[file_name]
+    for country_iso3a, country_gpd in boundaries_gpd.groupby(iso3_column, sort=False):
+        country_gpd.to_parquet(os.path.join(tmp_directory, f"{country_iso3a}.parquet"))
+    # An empty partition keeps the columns for countries which are not in the file
+    boundaries_gpd.iloc[0:0].to_parquet(os.path.join(tmp_directory, "_empty.parquet"))
+    with open(
+        os.path.join(tmp_directory, "_manifest.json"), "w", encoding="utf-8"
+    ) as manifest_file:
+        json.dump(source, manifest_file)
+
+    # A directory with files in it cannot be replaced, so stale partitions are moved aside first
+    if os.path.exists(partition_directory):
+        os.replace(partition_directory, old_directory)
+    try:
+        os.replace(tmp_directory, partition_directory)
+    except OSError:
+        LOGGER.info(f"{partition_directory} was written by another process, discarding our copy")
+    shutil.rmtree(tmp_directory, ignore_errors=True)
+    shutil.rmtree(old_directory, ignore_errors=True)
+
+    return partition_directory
+
+
+def convert_all_admin_boundaries_to_geoparquet() -> list[str]:
+    """Convert each boundary file in BOUNDARY_FILE_ISO3_COLUMNS which has been downloaded, this is
+    done before starting worker processes so that they only ever read the partitions
+
+    Returns:
+        list[str] -- the directories holding the partitions
+    """
+    partition_directories = []
+    for file_name in BOUNDARY_FILE_ISO3_COLUMNS:
+        if os.path.exists(os.path.join(ADMIN1_GEOMETRY_FOLDER, file_name)):
+            partition_directories.append(convert_admin_boundaries_to_geoparquet(file_name))
+
+    return partition_directories
+
+
+class BoundaryRegistry:
+    """Holds admin boundaries for the life of the process. Each country's boundaries are read from
+    a boundary file once, and the shapes for each admin name are found in a single groupby pass.
+    Results are shared between callers so they are returned as tuples and should not be modified.
+    """
+
+    def __init__(self):
+        self.boundaries = {}
+        self.shapes = {}
+
+    def get_boundaries(self, file_name: str, country_iso3a: str) -> geopandas.GeoDataFrame:
+        cache_key = (file_name, country_iso3a.upper())
+        if cache_key not in self.boundaries:
+            increment("boundary_cache_miss")
+            with span("boundary_load"):
+                self.boundaries[cache_key] = read_admin_boundaries_for_country(
+                    file_name, country_iso3a
+                )
+        else:
+            increment("boundary_cache_hit")
+        return self.boundaries[cache_key]
+
+    def get_shapes(
+        self, file_name: str, country_iso3a: str, name_columns: tuple[str, ...]
+    ) -> tuple[tuple, ...]:
+        """Get the admin names and shapes for a country, there is one entry per row of the
+        boundary file and the shape for a row is every row sharing its name in the last of the
+        name_columns
+
+        Arguments:
+            file_name {str} -- a boundary file name from BOUNDARY_FILE_ISO3_COLUMNS
+            country_iso3a {str} -- ISO3 country code
+            name_columns {tuple[str, ...]} -- columns to return names from, i.e.
+                                              ("ADM1_REF", "ADM2_REF")
+
+        Returns:
+            tuple[tuple, ...] -- a tuple of names for each of name_columns followed by a tuple of
+                                 geopandas.GeoSeries shapes
+        """
+        cache_key = (file_name, country_iso3a.upper(), name_columns)
+        if cache_key not in self.shapes:
+            country_gdf = self.get_boundaries(file_name, country_iso3a)
+            names = tuple(tuple(country_gdf[x].to_list()) for x in name_columns)
+            geometry = country_gdf["geometry"]
+            shapes_by_name = {
+                name: geometry.iloc[positions]
+                for name, positions in country_gdf.groupby(
+                    name_columns[-1], sort=False
+                ).indices.items()
+            }
+            # Rows without a name match no rows
+            no_shape = geometry.iloc[0:0]
+            shapes = tuple(shapes_by_name.get(name, no_shape) for name in names[-1])
+            self.shapes[cache_key] = (*names, shapes)
+
+        return self.shapes[cache_key]
+
+    def clear(self):
+        self.boundaries = {}
+        self.shapes = {}
+
+
+BOUNDARY_REGISTRY = BoundaryRegistry()
 
-    admin1_names = admin1_for_country["ADM1_REF"].to_list()
 
-    admin1_shapes = []
-    for admin1_name in admin1_names:
-        admin1_shape_geoseries = admin1_for_country[admin1_for_country["ADM1_REF"] == admin1_name][
-            "geometry"
-        ]
-        admin1_shapes.append(admin1_shape_geoseries)
+def get_admin1_shapes_from_hdx(country_iso3a):
+    admin1_names, admin1_shapes = BOUNDARY_REGISTRY.get_shapes(
+        "polbnda_adm1_1m_ocha.geojson", country_iso3a, ("ADM1_REF",)
+    )
 
     assert len(admin1_names) == len(admin1_shapes)
 
@@ -82,27 +233,10 @@ def get_admin1_shapes_from_hdx(country_iso3a):
 
 def get_admin2_shapes_from_hdx(
     country_iso3a: str,
-) -> tuple[list, list, list[geopandas.GeoDataFrame]]:
-    admin2_file_path = os.path.join(ADMIN1_GEOMETRY_FOLDER, "polbnda_adm2_1m_ocha.geojson")
-
-    if not os.path.exists(admin2_file_path):
-        raise FileNotFoundError(
-            f"{admin2_file_path} was not found, run `download_admin1_geometry.py` to download"
-        )
-
-    admin2_gpd = geopandas.read_file(admin2_file_path)
-
-    admin2_for_country = admin2_gpd[admin2_gpd["alpha_3"] == country_iso3a.upper()]
-
-    admin1_names = admin2_for_country["ADM1_REF"].to_list()
-    admin2_names = admin2_for_country["ADM2_REF"].to_list()
-
-    admin2_shapes = []
-    for admin2_name in admin2_names:
-        admin2_shape_geoseries = admin2_for_country[admin2_for_country["ADM2_REF"] == admin2_name][
-            "geometry"
-        ]
-        admin2_shapes.append(admin2_shape_geoseries)
+) -> tuple[tuple, tuple, tuple[geopandas.GeoSeries]]:
+    admin1_names, admin2_names, admin2_shapes = BOUNDARY_REGISTRY.get_shapes(
+        "polbnda_adm2_1m_ocha.geojson", country_iso3a, ("ADM1_REF", "ADM2_REF")
+    )
 
     assert len(admin2_names) == len(admin2_shapes)
     return admin1_names, admin2_names, admin2_shapes
@@ -110,17 +244,40 @@ def get_admin2_shapes_from_hdx(
 
 def get_best_admin_shapes(
     country_iso3alpha: str,
-) -> tuple[list, list, list[geopandas.GeoDataFrame], str]:
+) -> tuple[tuple, tuple, tuple[geopandas.GeoSeries], str]:
     admin_level = "2"
     admin1_names, admin2_names, admin_shapes = get_admin2_shapes_from_hdx(country_iso3alpha)
     if len(admin2_names) == 0:
         admin1_names, admin_shapes = get_admin1_shapes_from_hdx(country_iso3alpha)
         admin_level = "1"
-        admin2_names = len(admin1_names) * [""]
+        admin2_names = len(admin1_names) * ("",)
 
     return admin1_names, admin2_names, admin_shapes, admin_level
 
 
+def count_admin_shapes_by_country() -> dict[str, int]:
+    """Count the admin shapes get_best_admin_shapes would return for each country from the row
+    counts of the GeoParquet partitions
+
+    Returns:
+        dict[str, int] -- number of admin shapes keyed by ISO3 country code
+    """
+    shape_counts = {}
+    for file_name in ["polbnda_adm1_1m_ocha.geojson", "polbnda_adm2_1m_ocha.geojson"]:
+        try:
+            partition_directory = convert_admin_boundaries_to_geoparquet(file_name)
+        except FileNotFoundError as error:
+            LOGGER.info(f"{error}, shape counts will be incomplete")
+            continue
+        # admin2 counts overwrite admin1 counts where they are available
+        for partition_path in Path(partition_directory).glob("[!_]*.parquet"):
+            shape_counts[partition_path.stem] = pyarrow.parquet.read_metadata(
+                partition_path
+            ).num_rows
+
+    return shape_counts
+
+
 def download_hdx_datasets(
     dataset_filter: str,
     resource_filter: str = "*",
@@ -181,25 +338,9 @@ def get_admin1_shapes_from_natural_earth(country_iso3a):
 
 
 def get_admin1_shapes_from_geoboundaries(country_iso3a: str):
-    admin1_file_path = os.path.join(ADMIN1_GEOMETRY_FOLDER, "geoBoundariesCGAZ_ADM1.geojson")
-
-    if not os.path.exists(admin1_file_path):
-        raise FileNotFoundError(
-            f"{admin1_file_path} was not found, run `download_admin1_geometry.py` to download"
-        )
-
-    admin1_gpd = geopandas.read_file(admin1_file_path)
-
-    admin1_for_country = admin1_gpd[admin1_gpd["shapeGroup"] == country_iso3a.upper()]
-
-    admin1_names = admin1_for_country["shapeName"].to_list()
-
-    admin1_shapes = []
-    for admin1_name in admin1_names:
-        admin1_shape_geoseries = admin1_for_country[admin1_for_country["shapeName"] == admin1_name][
-            "geometry"
-        ]
-        admin1_shapes.append(admin1_shape_geoseries)
+    admin1_names, admin1_shapes = BOUNDARY_REGISTRY.get_shapes(
+        "geoBoundariesCGAZ_ADM1.geojson", country_iso3a, ("shapeName",)
+    )
 
     assert len(admin1_names) == len(admin1_shapes)
 
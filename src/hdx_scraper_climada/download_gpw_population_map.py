@@ -26,6 +26,13 @@ from hdx_scraper_climada.utilities import print_banner_to_log
 setup_logging()
 LOGGER = logging.getLogger(__name__)
 
+GPW_POPULATION_DIRECTORY = os.path.join(
+    os.path.expanduser("~"),
+    "climada",
+    "data",
+    "gpw-v4-population-count-rev11_2020_30_sec_tif",
+)
+
 
 # overriding requests.Session.rebuild_auth to mantain headers when redirected
 class SessionWithHeaderRedirection(requests.Session):
@@ -56,12 +63,7 @@ class SessionWithHeaderRedirection(requests.Session):
 def download_gpw_population(target_directory: str = None):
     print_banner_to_log(LOGGER, "Download GWP Population data")
     if target_directory is None:
-        target_directory = os.path.join(
-            os.path.expanduser("~"),
-            "climada",
-            "data",
-            "gpw-v4-population-count-rev11_2020_30_sec_tif",
-        )
+        target_directory = GPW_POPULATION_DIRECTORY
 
     username = os.environ["NASA_EARTHDATA_USERNAME"]
     password = os.environ["NASA_EARTHDATA_PASSWORD"]
@@ -0,0 +1,207 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+import hashlib
+import json
+import logging
+import os
+
+import numpy as np
+
+from hdx.utilities.easy_logging import setup_logging
+
+HAZARD_STORE_FOLDER = os.path.join(os.path.dirname(__file__), "hazard_store")
+HAZARD_REDUCTIONS = ["latitude", "longitude", "max_intensity", "date", "event_name"]
+EXPOSURE_COLUMNS = ["latitude", "longitude", "value"]
+
+setup_logging()
+LOGGER = logging.getLogger(__name__)
+
+
+def make_hazard_store_directory(data_type: str, properties: dict, store_folder: str = None) -> str:
+    if store_folder is None:
+        store_folder = HAZARD_STORE_FOLDER
+    properties_hash = hashlib.sha1(
+        json.dumps(properties, sort_keys=True).encode("utf-8")
+    ).hexdigest()
+
+    return os.path.join(store_folder, data_type, properties_hash[0:16])
+
+
+def read_hazard_reductions(store_directory: str, dataset_version: dict) -> dict | None:
+    """Read the hazard reductions saved by write_hazard_reductions as memory mapped arrays
+
+    Arguments:
+        store_directory {str} -- directory from make_hazard_store_directory
+        dataset_version {dict} -- uuid and version of the current CLIMADA dataset
+
+    Returns:
+        dict | None -- arrays keyed by HAZARD_REDUCTIONS, or None if the store is missing or
+                       was made from a different version of the dataset
+    """
+    if read_store_manifest(store_directory, dataset_version) is None:
+        return None
+
+    reductions = {}
+    for name in HAZARD_REDUCTIONS:
+        reductions[name] = np.load(os.path.join(store_directory, f"{name}.npy"), mmap_mode="r")
+
+    return reductions
+
+
+def read_store_manifest(store_directory: str, dataset_version: dict) -> dict | None:
+    manifest_path = os.path.join(store_directory, "manifest.json")
+    if not os.path.exists(manifest_path):
+        return None
+
+    with open(manifest_path, encoding="utf-8") as manifest_file:
+        manifest = json.load(manifest_file)
+
+    if manifest["dataset_version"] != dataset_version:
+        LOGGER.info(
+            f"Store {store_directory} is for {manifest['dataset_version']}, "
+            f"current dataset is {dataset_version}"
+        )
+        return None
+
+    return manifest
+
+
+def write_store_manifest(store_directory: str, manifest: dict):
+    manifest_path = os.path.join(store_directory, "manifest.json")
+    tmp_path = f"{manifest_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as manifest_file:
+        json.dump(manifest, manifest_file, indent=2)
+    os.replace(tmp_path, manifest_path)
+
+
+def write_hazard_reductions(
+    store_directory: str,
+    reductions: dict,
+    data_type: str,
+    properties: dict,
+    dataset_version: dict,
+) -> str:
+    os.makedirs(store_directory, exist_ok=True)
+    manifest_path = os.path.join(store_directory, "manifest.json")
+
+    # The manifest is removed first and written last so a partially written store is never read
+    if os.path.exists(manifest_path):
+        os.remove(manifest_path)
+
+    for name in HAZARD_REDUCTIONS:
+        values = np.asarray(reductions[name])
+        # Object arrays, such as event names read from HDF5, are pickled by np.save and cannot be
+        # memory mapped so they are stored as fixed width unicode
+        if values.dtype == object:
+            values = values.astype(str)
+        np.save(os.path.join(store_directory, f"{name}.npy"), values, allow_pickle=False)
+
+    manifest = {
+        "data_type": data_type,
+        "properties": properties,
+        "dataset_version": dataset_version,
+    }
+    write_store_manifest(store_directory, manifest)
+
+    status = f"Hazard reductions for {data_type} written to {store_directory}"
+    return status
+
+
+def write_country_exposures(
+    store_directory: str,
+    exposure_columns: dict,
+    region_ids: np.ndarray,
+    data_type: str,
+    properties: dict,
+    dataset_version: dict,
+) -> str:
+    """Split a global exposure by country into one .npz file per region_id, so that later reads
+    for a country touch only its own points. Rows keep their order within each country.
+
+    Arguments:
+        store_directory {str} -- directory from make_hazard_store_directory
+        exposure_columns {dict} -- arrays for the whole exposure keyed by EXPOSURE_COLUMNS
+        region_ids {np.ndarray} -- ISO numeric country code for each row of the exposure
+        data_type {str} -- CLIMADA data type
+        properties {dict} -- CLIMADA properties of the exposure
+        dataset_version {dict} -- uuid and version of the CLIMADA dataset
+
+    Returns:
+        str -- status message
+    """
+    os.makedirs(store_directory, exist_ok=True)
+    manifest_path = os.path.join(store_directory, "manifest.json")
+
+    if os.path.exists(manifest_path):
+        os.remove(manifest_path)
+
+    # region_id may be stored as a float, files are named by the integer code used for lookups
+    region_ids = np.asarray(region_ids).astype(np.int64)
+    order = np.argsort(region_ids, kind="stable")
+    country_region_ids, starts = np.unique(region_ids[order], return_index=True)
+    stops = np.append(starts[1:], len(order))
+    for region_id, start, stop in zip(country_region_ids, starts, stops):
+        country_rows = order[start:stop]
+        country_path = os.path.join(store_directory, f"{int(region_id)}.npz")
+        # Each file is written in full and renamed into place so it is never read part written
+        tmp_path = f"{country_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as country_file:
+            np.savez(
+                country_file,
+                **{
+                    name: np.asarray(exposure_columns[name])[country_rows]
+                    for name in EXPOSURE_COLUMNS
+                },
+            )
+        os.replace(tmp_path, country_path)
+
+    manifest = {
+        "data_type": data_type,
+        "properties": properties,
+        "dataset_version": dataset_version,
+        "region_ids": [int(x) for x in country_region_ids],
+    }
+    write_store_manifest(store_directory, manifest)
+
+    status = (
+        f"Exposure for {data_type} split into {len(country_region_ids)} countries "
+        f"in {store_directory}"
+    )
+    return status
+
+
+def read_country_exposure(
+    store_directory: str, dataset_version: dict, region_id: int
+) -> dict | None:
+    """Read a single country's rows written by write_country_exposures
+
+    Arguments:
+        store_directory {str} -- directory from make_hazard_store_directory
+        dataset_version {dict} -- uuid and version of the current CLIMADA dataset
+        region_id {int} -- ISO numeric country code
+
+    Returns:
+        dict | None -- arrays keyed by EXPOSURE_COLUMNS, empty if the country has no points, or
+                       None if the store is missing or was made from a different dataset version
+    """
+    manifest = read_store_manifest(store_directory, dataset_version)
+    if manifest is None:
+        return None
+
+    if region_id not in manifest["region_ids"]:
+        return {name: np.array([], dtype=np.float64) for name in EXPOSURE_COLUMNS}
+
+    with np.load(os.path.join(store_directory, f"{int(region_id)}.npz")) as country_file:
+        exposure_columns = {name: country_file[name] for name in EXPOSURE_COLUMNS}
+
+    return exposure_columns
+
+
+def count_stored_centroids(store_directory: str) -> int | None:
+    manifest_path = os.path.join(store_directory, "manifest.json")
+    if not os.path.exists(manifest_path):
+        return None
+
+    latitudes = np.load(os.path.join(store_directory, "latitude.npy"), mmap_mode="r")
+    return len(latitudes)
@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+import csv
+import json
+import logging
+import os
+import time
+
+from collections.abc import Iterator
+from contextlib import contextmanager
+
+from hdx.utilities.easy_logging import setup_logging
+
+setup_logging()
+LOGGER = logging.getLogger(__name__)
+
+# Timings and counts for the country being processed, spans are keyed by name and hold the number
+# of times the span was entered and the total seconds spent in it. Spans may nest, so the time of
+# an inner span is also counted in the outer one
+SPANS = {}
+COUNTERS = {}
+
+
+@contextmanager
+def span(name: str) -> Iterator[None]:
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        entry = SPANS.setdefault(name, {"count": 0, "seconds": 0.0})
+        entry["count"] += 1
+        entry["seconds"] += time.perf_counter() - t0
+
+
+def increment(name: str, n: int = 1):
+    COUNTERS[name] = COUNTERS.get(name, 0) + n
+
+
+def reset_profile():
+    SPANS.clear()
+    COUNTERS.clear()
+
+
+def get_profile_path(country: str, indicator: str, export_directory: str = None) -> str:
+    if export_directory is None:
+        export_directory = os.path.join(os.path.dirname(__file__), "output")
+    country_str = country.lower().replace(" ", "-")
+    return os.path.join(export_directory, "profiles", f"{indicator}-{country_str}.json")
+
+
+def write_profile(country: str, indicator: str, export_directory: str = None) -> str:
+    """Write the spans and counters recorded since the last reset_profile to a JSON file for the
+    country and indicator, replacing the profile from any earlier run
+
+    Arguments:
+        country {str} -- full name of country
+        indicator {str} -- which indicator we are processing
+
+    Keyword Arguments:
+        export_directory {str} -- output directory, the profile goes in its profiles
+                                  subdirectory (default: {None})
+
+    Returns:
+        str -- status message
+    """
+    profile_path = get_profile_path(country, indicator, export_directory)
+    os.makedirs(os.path.dirname(profile_path), exist_ok=True)
+    profile = {
+        "country": country,
+        "indicator": indicator,
+        "spans": {
+            name: {"count": entry["count"], "seconds": round(entry["seconds"], 4)}
+            for name, entry in SPANS.items()
+        },
+        "counters": dict(COUNTERS),
+    }
+    with open(f"{profile_path}.tmp", "w", encoding="utf-8") as profile_file:
+        json.dump(profile, profile_file, indent=2, sort_keys=True)
+    os.replace(f"{profile_path}.tmp", profile_path)
+
+    status = f"Profile for {country}-{indicator} written to {profile_path}"
+    return status
+
+
+def write_run_profile(countries: list[str], indicator: str, export_directory: str = None) -> str:
+    """Combine the profiles of the countries in a run into a single CSV file with a row per
+    country and span or counter
+
+    Arguments:
+        countries {list[str]} -- countries processed in the run
+        indicator {str} -- which indicator we are processing
+
+    Keyword Arguments:
+        export_directory {str} -- output directory (default: {None})
+
+    Returns:
+        str -- status message
+    """
+    run_profile_path = os.path.join(
+        os.path.dirname(get_profile_path("Haiti", indicator, export_directory)),
+        f"{indicator}-run-profile.csv",
+    )
+    rows = []
+    for country in countries:
+        profile_path = get_profile_path(country, indicator, export_directory)
+        if not os.path.exists(profile_path):
+            continue
+        with open(profile_path, encoding="utf-8") as profile_file:
+            profile = json.load(profile_file)
+        for name, entry in sorted(profile["spans"].items()):
+            rows.append([country, "span", name, entry["count"], entry["seconds"]])
+        for name, value in sorted(profile["counters"].items()):
+            rows.append([country, "counter", name, value, ""])
+
+    os.makedirs(os.path.dirname(run_profile_path), exist_ok=True)
+    with open(run_profile_path, "w", encoding="utf-8", newline="") as run_profile_file:
+        csv_writer = csv.writer(run_profile_file, lineterminator="\n")
+        csv_writer.writerow(["country_name", "kind", "name", "count", "seconds"])
+        csv_writer.writerows(rows)
+
+    status = f"Run profile for {len(countries)} countries written to {run_profile_path}"
+    return status
@@ -14,7 +14,10 @@ from plotly.subplots import make_subplots
 
 from hdx.location.country import Country
 
-from hdx_scraper_climada.create_csv_files import make_detail_and_summary_file_paths
+from hdx_scraper_climada.create_csv_files import (
+    make_detail_and_summary_file_paths,
+    read_data_file,
+)
 from hdx_scraper_climada.utilities import HAS_TIMESERIES, read_countries
 from hdx_scraper_climada.download_from_hdx import (
     get_best_admin_shapes,
@@ -381,19 +384,15 @@ def get_detail_data_from_csv(
     output_paths = make_detail_and_summary_file_paths(
         country, indicator, export_directory=export_directory
     )
-    country_data = pandas.read_csv(output_paths["output_detail_path"])
 
     if country == "Syrian Arab Republic" and indicator == "litpop":
         print("No 'litpop' data for Syrian Arab Republic", flush=True)
         return None
 
-    country_data.drop(country_data.head(1).index, inplace=True)
+    country_data, _ = read_data_file(output_paths["output_detail_path"])
 
     if "region_name" in country_data:
         country_data.rename(columns={"region_name": "admin1_name"}, inplace=True)
-    country_data["latitude"] = country_data["latitude"].astype(float)
-    country_data["longitude"] = country_data["longitude"].astype(float)
-    country_data["value"] = country_data["value"].astype(float)
     return country_data
 
 
@@ -405,14 +404,10 @@ def get_summary_data_from_csv(
     output_paths = make_detail_and_summary_file_paths(
         country, indicator, export_directory=export_directory
     )
-    country_data = pandas.read_csv(output_paths["output_summary_path"])
+    country_data, _ = read_data_file(output_paths["output_summary_path"])
 
-    country_data.drop(country_data.head(1).index, inplace=True)
     if "region_name" in country_data:
         country_data.rename(columns={"region_name": "admin1_name"}, inplace=True)
-    country_data["latitude"] = country_data["latitude"].astype(float)
-    country_data["longitude"] = country_data["longitude"].astype(float)
-    country_data["value"] = country_data["value"].astype(float)
     return country_data
 
 
@@ -422,12 +417,8 @@ def get_timeseries_data_from_csv(
     output_paths = make_detail_and_summary_file_paths(
         country, indicator, export_directory=export_directory
     )
-    timeseries_data = pandas.read_csv(output_paths["output_timeseries_path"])
+    timeseries_data, _ = read_data_file(output_paths["output_timeseries_path"])
 
-    timeseries_data.drop(timeseries_data.head(1).index, inplace=True)
     if "region_name" in timeseries_data:
         timeseries_data.rename(columns={"region_name": "admin1_name"}, inplace=True)
-    timeseries_data["latitude"] = timeseries_data["latitude"].astype(float)
-    timeseries_data["longitude"] = timeseries_data["longitude"].astype(float)
-    timeseries_data["value"] = timeseries_data["value"].astype(float)
     return timeseries_data
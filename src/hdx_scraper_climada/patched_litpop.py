@@ -33,9 +33,10 @@ import climada.util.finance as u_fin
 from climada import CONFIG
 from climada.entity.exposures.base import DEF_REF_YEAR, INDICATOR_IMPF, Exposures
 from climada.entity.exposures.litpop import gpw_population as pop_util
-from climada.entity.exposures.litpop import nightlight as nl_util
 from climada.util.constants import SYSTEM_DIR
 
+from hdx_scraper_climada.patched_nightlight import load_nasa_nl_shape, load_raster_shape
+
 LOGGER = logging.getLogger(__name__)
 
 GPW_VERSION = CONFIG.exposures.litpop.gpw_population.gpw_version.int()
@@ -810,6 +811,47 @@ class LitPop(Exposures):
     set_country = set_countries
 
 
+def load_gpw_pop_shape(
+    geometry, reference_year, gpw_version, data_dir=SYSTEM_DIR, layer=0, verbose=True
+):
+    """Read gridded population data from the GPW TIFF cropped to a shape.
+
+    A replacement for gpw_population.load_gpw_pop_shape which reads through the
+    shared windowed reader in patched_nightlight, using the memory mapped copy
+    of the raster from `hdx-climada download --optimize` where there is one.
+
+    Parameters
+    ----------
+    geometry : shape or geometry object
+        shape to crop data to in degree lon/lat.
+    reference_year : int
+        target year for data extraction, the closest year with GPW data is used.
+    gpw_version : int
+        Version number of GPW population data.
+    data_dir : Path, optional
+        Path to data directory holding GPW data folders. The default is SYSTEM_DIR.
+    layer : int, optional
+        relevant data layer in input TIFF file to return. The default is 0.
+    verbose : bool, optional
+        Enable verbose logging about the used GPW version and reference year. Default: True.
+
+    Returns
+    -------
+    pop_data : 2D numpy array
+        contains extracted population count data per grid point in shape
+    meta : dict
+        contains meta data per array, including "transform" with meta data on
+        coordinates.
+    global_transform : Affine instance
+        contains six numbers, providing transform info for global GWP grid.
+    """
+    file_path = pop_util.get_gpw_file_path(
+        gpw_version, reference_year, data_dir=data_dir, verbose=verbose
+    )
+    pop_data, meta, global_transform = load_raster_shape(geometry, file_path, layer=layer, nodata=0)
+    return pop_data, meta, global_transform
+
+
 def _get_litpop_single_polygon(
     polygon,
     reference_year,
@@ -869,7 +911,7 @@ def _get_litpop_single_polygon(
         offsets = (1, 0)
     # import population data (2d array), meta data, and global grid info,
     # global_transform defines the origin (corner points) of the global traget grid:
-    pop, meta_pop, global_transform = pop_util.load_gpw_pop_shape(
+    pop, meta_pop, global_transform = load_gpw_pop_shape(
         polygon,
         reference_year,
         gpw_version=gpw_version,
@@ -878,9 +920,7 @@ def _get_litpop_single_polygon(
     )
     total_population = pop.sum()
     # import nightlight data (2d array) and associated meta data:
-    nlight, meta_nl = nl_util.load_nasa_nl_shape(
-        polygon, reference_year, data_dir=data_dir, dtype=float
-    )
+    nlight, meta_nl = load_nasa_nl_shape(polygon, reference_year, data_dir=data_dir, dtype=float)
 
     # if resolution is the same as for lit (15 arcsec), set grid same as lit:
     if res_arcsec == 15:
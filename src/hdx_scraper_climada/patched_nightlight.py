@@ -22,11 +22,14 @@ Define nightlight reader and cutting functions.
 """
 
 import glob
+import json
+import os
 import shutil
 import tarfile
 import gzip
 import pickle
 import logging
+from collections import OrderedDict
 from pathlib import Path
 import rasterio
 import time
@@ -36,6 +39,8 @@ import scipy.sparse as sparse
 import matplotlib.pyplot as plt
 from osgeo import gdal
 from PIL import Image
+from rasterio.features import geometry_mask, geometry_window
+from rasterio.windows import Window
 from shapefile import Shape
 
 from climada.util import ureg
@@ -72,6 +77,211 @@ BM_FILENAMES = [
 ]
 """Nightlight NASA files which generate the whole earth when put together."""
 
+RASTER_BLOCK_CACHE_MAX_BYTES = 512 * 1024**2
+"""Upper limit on the raster blocks held by RASTER_TILE_READER."""
+
+OPTIMIZE_ROWS_PER_STRIP = 1024
+"""Number of raster rows copied at a time by optimize_raster."""
+
+
+def get_optimized_raster_paths(path, band=1):
+    """Paths of the raw array and manifest written by optimize_raster for one band of a raster."""
+    stem = os.path.splitext(str(path))[0]
+    return f"{stem}.band{band}.npy", f"{stem}.band{band}.json"
+
+
+def optimize_raster(path, band=1):
+    """Rewrite one band of a GeoTIFF as a raw .npy array which is opened with
+    np.memmap by RasterTileReader, so windows are sliced from it rather than
+    decoded from compressed strips. The copy is made once, and again only if
+    the GeoTIFF changes.
+
+    Parameters
+    ----------
+    path : Path or str
+        full path to the GeoTIFF, e.g. a BlackMarble tile or the GPW raster
+    band : int, optional
+        band to rewrite, counting from 1. The default is 1.
+
+    Returns
+    -------
+    array_path : str
+        path to the .npy array
+    """
+    array_path, manifest_path = get_optimized_raster_paths(path, band)
+    source_stat = os.stat(path)
+    source = {"size": source_stat.st_size, "mtime": source_stat.st_mtime, "band": band}
+    if os.path.exists(manifest_path):
+        with open(manifest_path, encoding="utf-8") as manifest_file:
+            if json.load(manifest_file) == source:
+                return array_path
+        os.remove(manifest_path)
+
+    LOGGER.info("Rewriting band %d of %s to %s", band, path, array_path)
+    with rasterio.open(path, "r") as src:
+        out_array = np.lib.format.open_memmap(
+            f"{array_path}.tmp", mode="w+", dtype=src.dtypes[band - 1], shape=src.shape
+        )
+        for row_off in range(0, src.height, OPTIMIZE_ROWS_PER_STRIP):
+            height = min(OPTIMIZE_ROWS_PER_STRIP, src.height - row_off)
+            out_array[row_off : row_off + height, :] = src.read(
+                band, window=Window(0, row_off, src.width, height)
+            )
+        out_array.flush()
+        del out_array
+    os.replace(f"{array_path}.tmp", array_path)
+
+    # The manifest is written last so an interrupted rewrite is repeated
+    with open(manifest_path, "w", encoding="utf-8") as manifest_file:
+        json.dump(source, manifest_file)
+
+    return array_path
+
+
+def read_optimized_raster(path, band=1):
+    """Open the array written by optimize_raster as a read-only memmap, or
+    return None if there is none or the GeoTIFF has changed since it was made."""
+    array_path, manifest_path = get_optimized_raster_paths(path, band)
+    if not os.path.exists(manifest_path):
+        return None
+
+    source_stat = os.stat(path)
+    source = {"size": source_stat.st_size, "mtime": source_stat.st_mtime, "band": band}
+    with open(manifest_path, encoding="utf-8") as manifest_file:
+        if json.load(manifest_file) != source:
+            LOGGER.info("%s is out of date with %s, reading the GeoTIFF", array_path, path)
+            return None
+
+    return np.load(array_path, mmap_mode="r")
+
+
+class RasterTileReader:
+    """Windowed reader for the BlackMarble tiles and the GPW population raster.
+
+    Dataset handles are kept open for the life of the process and the blocks
+    read from them are kept in a least recently used cache, so countries made
+    of many polygons (e.g. island states) do not re-open and re-decode the same
+    parts of a 21600x21600 tile for each polygon. Where a band has been
+    rewritten by optimize_raster windows are sliced from its memmap instead.
+
+    Parameters
+    ----------
+    max_bytes : int
+        upper limit on the size of the cached blocks
+    """
+
+    def __init__(self, max_bytes=RASTER_BLOCK_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.datasets = {}
+        self.blocks = OrderedDict()
+        self.n_bytes = 0
+        self.memmaps = {}
+
+    def open(self, path):
+        """Return an open rasterio dataset for path, opening it on first use."""
+        path = str(path)
+        if path not in self.datasets:
+            self.datasets[path] = rasterio.open(path, "r")
+        return self.datasets[path]
+
+    def close(self):
+        """Close all open datasets and empty the block cache."""
+        for src in self.datasets.values():
+            src.close()
+        self.datasets = {}
+        self.blocks = OrderedDict()
+        self.n_bytes = 0
+        self.memmaps = {}
+
+    def get_memmap(self, path, band):
+        """Return the optimize_raster memmap for a band, or None if there is none."""
+        key = (str(path), band)
+        if key not in self.memmaps:
+            self.memmaps[key] = read_optimized_raster(path, band)
+        return self.memmaps[key]
+
+    def read_block(self, path, band, block_row, block_col):
+        """Read a single internal block of a tile, from the cache if possible."""
+        key = (str(path), band, block_row, block_col)
+        if key in self.blocks:
+            self.blocks.move_to_end(key)
+            return self.blocks[key]
+
+        src = self.open(path)
+        block_height, block_width = src.block_shapes[band - 1]
+        row_off = block_row * block_height
+        col_off = block_col * block_width
+        block = src.read(
+            band,
+            window=Window(
+                col_off,
+                row_off,
+                min(block_width, src.width - col_off),
+                min(block_height, src.height - row_off),
+            ),
+        )
+
+        self.blocks[key] = block
+        self.n_bytes += block.nbytes
+        while self.n_bytes > self.max_bytes and len(self.blocks) > 1:
+            _, evicted = self.blocks.popitem(last=False)
+            self.n_bytes -= evicted.nbytes
+
+        return block
+
+    def read_window(self, path, window, band=1):
+        """Read a window of a single band, assembled from block aligned reads.
+
+        Parameters
+        ----------
+        path : Path or str
+            full path to BlackMarble tif (including filename)
+        window : rasterio.windows.Window
+            window within the bounds of the tile
+        band : int, optional
+            band to read, counting from 1. The default is 1.
+
+        Returns
+        -------
+        out_image : 2D numpy ndarray
+            data in the window
+        """
+        row_start = int(window.row_off)
+        col_start = int(window.col_off)
+        row_stop = row_start + int(window.height)
+        col_stop = col_start + int(window.width)
+
+        band_memmap = self.get_memmap(path, band)
+        if band_memmap is not None:
+            return np.array(band_memmap[row_start:row_stop, col_start:col_stop])
+
+        src = self.open(path)
+        block_height, block_width = src.block_shapes[band - 1]
+
+        out_image = np.empty(
+            (row_stop - row_start, col_stop - col_start), dtype=src.dtypes[band - 1]
+        )
+        for block_row in range(row_start // block_height, (row_stop - 1) // block_height + 1):
+            for block_col in range(col_start // block_width, (col_stop - 1) // block_width + 1):
+                block = self.read_block(path, band, block_row, block_col)
+                block_row_off = block_row * block_height
+                block_col_off = block_col * block_width
+                r_0 = max(row_start, block_row_off)
+                r_1 = min(row_stop, block_row_off + block.shape[0])
+                c_0 = max(col_start, block_col_off)
+                c_1 = min(col_stop, block_col_off + block.shape[1])
+                out_image[
+                    r_0 - row_start : r_1 - row_start, c_0 - col_start : c_1 - col_start
+                ] = block[
+                    r_0 - block_row_off : r_1 - block_row_off,
+                    c_0 - block_col_off : c_1 - block_col_off,
+                ]
+
+        return out_image
+
+
+RASTER_TILE_READER = RasterTileReader()
+
 
 def load_nasa_nl_shape(geometry, year, data_dir=SYSTEM_DIR, dtype="float32"):
     """Read nightlight data from NASA BlackMarble tiles
@@ -151,29 +361,36 @@ def load_nasa_nl_shape(geometry, year, data_dir=SYSTEM_DIR, dtype="float32"):
             meta.update({"crs": rasterio.crs.CRS.from_epsg(4326), "dtype": dtype})
             if len(req_files) == 1:  # only one tile required:
                 return np.array(out_image, dtype=dtype), meta
-    # Else, combine data from multiple input files (BlackMarble tiles) -
-    # concatenate arrays from west to east and from north to south:
+    # Else, combine data from multiple input files (BlackMarble tiles) west to
+    # east and north to south, copying each tile once into the output array:
     del out_image
-    if results_array_north:  # northern hemisphere west to east
-        results_array_north = np.concatenate(results_array_north, axis=1)
-    if results_array_south:  # southern hemisphere west to east
-        results_array_south = np.concatenate(results_array_south, axis=1)
-    if isinstance(results_array_north, np.ndarray) and isinstance(results_array_south, np.ndarray):
-        # north to south if both hemispheres are involved
-        results_array_north = np.concatenate([results_array_north, results_array_south], axis=0)
-    elif isinstance(results_array_south, np.ndarray):  # only southern hemisphere
-        results_array_north = results_array_south
-    del results_array_south
+    rows = [row for row in [results_array_north, results_array_south] if row]
+    widths = [sum(tile.shape[1] for tile in row) for row in rows]
+    if len(set(widths)) != 1:
+        raise ValueError(
+            "BlackMarble tiles for the northern and southern hemisphere differ in width"
+        )
+    results_array = np.empty((sum(row[0].shape[0] for row in rows), widths[0]), dtype=dtype)
+    row_off = 0
+    for row in rows:
+        col_off = 0
+        for tile in row:
+            results_array[
+                row_off : row_off + tile.shape[0], col_off : col_off + tile.shape[1]
+            ] = tile
+            col_off += tile.shape[1]
+        row_off += row[0].shape[0]
+    del results_array_north, results_array_south
 
     # update number of elements per axis in meta dictionary:
     meta.update(
         {
-            "height": results_array_north.shape[0],
-            "width": results_array_north.shape[1],
+            "height": results_array.shape[0],
+            "width": results_array.shape[1],
             "dtype": dtype,
         }
     )
-    return np.array(results_array_north, dtype=dtype), meta
+    return results_array, meta
 
 
 def get_required_nl_files(bounds):
@@ -401,26 +618,64 @@ def load_nasa_nl_shape_single_tile(geometry, path, layer=0):
     meta : dict
         rasterio meta
     """
-    # open tif source file with raterio:
-    with rasterio.open(path, "r") as src:
-        # read cropped data from  source file (src) to np.ndarray:
-        out_image, transform = rasterio.mask.mask(src, [geometry], crop=True)
-        LOGGER.debug("Read cropped %s as np.ndarray.", path.name)
-        if out_image.shape[0] < layer:
-            raise IndexError(
-                f"{path.name} has only {out_image.shape[0]} layers,"
-                f" layer {layer} can't be accessed."
-            )
-        meta = src.meta
-        meta.update(
-            {
-                "driver": "GTiff",
-                "height": out_image.shape[1],
-                "width": out_image.shape[2],
-                "transform": transform,
-            }
+    out_image, meta, _ = load_raster_shape(geometry, path, layer=layer)
+    return out_image, meta
+
+
+def load_raster_shape(geometry, path, layer=0, nodata=None):
+    """Read a raster cropped to the bounding box of a shape through
+    RASTER_TILE_READER, with the pixels outside the shape and the raster's
+    own nodata pixels set to nodata, as rasterio.mask.mask(crop=True) does.
+
+    Parameters
+    ----------
+    geometry : shape or geometry object
+        shape to crop data to in the raster's coordinates
+    path : Path or str
+        full path to the raster
+    layer : int, optional
+        layer to be returned. The default is 0.
+    nodata : int or float, optional
+        fill value, the default is the raster's nodata value, or 0 if it has none.
+
+    Returns
+    -------
+    out_image : 2D numpy ndarray
+        2d array with data cropped to bounding box of shape
+    meta : dict
+        rasterio meta
+    global_transform : affine.Affine
+        transform of the whole raster
+    """
+    src = RASTER_TILE_READER.open(path)
+    if src.count <= layer:
+        raise IndexError(
+            f"{Path(path).name} has only {src.count} layers, layer {layer} can't be accessed."
         )
-    return out_image[layer, :, :], meta
+    window = geometry_window(src, [geometry])
+    out_image = RASTER_TILE_READER.read_window(path, window, band=layer + 1)
+    LOGGER.debug("Read cropped %s as np.ndarray.", Path(path).name)
+    transform = src.window_transform(window)
+    outside_mask = geometry_mask([geometry], out_shape=out_image.shape, transform=transform)
+    if src.nodata is not None:
+        if np.isnan(src.nodata):
+            outside_mask |= np.isnan(out_image)
+        else:
+            outside_mask |= out_image == src.nodata
+    if nodata is None:
+        nodata = src.nodata if src.nodata is not None else 0
+    out_image[outside_mask] = nodata
+
+    meta = src.meta
+    meta.update(
+        {
+            "driver": "GTiff",
+            "height": out_image.shape[0],
+            "width": out_image.shape[1],
+            "transform": transform,
+        }
+    )
+    return out_image, meta, src.transform
 
 
 def load_nightlight_nasa(bounds, req_files, year):
@@ -0,0 +1,170 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+import logging
+import os
+import threading
+
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any
+
+from climada.util.constants import SYSTEM_DIR
+
+from hdx.utilities.easy_logging import setup_logging
+
+from hdx_scraper_climada.climada_interface import get_climada_datasets, get_client
+
+setup_logging()
+LOGGER = logging.getLogger(__name__)
+
+PREFETCH_DISK_BUDGET_BYTES = 50 * 1024**3
+
+
+class ClimadaPrefetcher:
+    """Download the CLIMADA API datasets for the countries ahead of the one being processed in a
+    background thread pool, so that computation for one country overlaps the download for the
+    next. The CLIMADA client skips files it has already downloaded, so the computation then finds
+    the data on disk. Prefetching stops once the CLIMADA data directory would exceed the disk budget
+
+    Arguments:
+        countries {list[str]} -- country names in the order they will be processed
+        indicator {str} -- which indicator we are processing
+
+    Keyword Arguments:
+        lookahead {int} -- number of countries to fetch ahead of the current one (default: {2})
+        threads {int} -- number of download threads (default: {2})
+        disk_budget {float} -- disk budget in bytes for the CLIMADA data directory
+                               (default: {PREFETCH_DISK_BUDGET_BYTES})
+    """
+
+    def __init__(
+        self,
+        countries: list[str],
+        indicator: str,
+        lookahead: int = 2,
+        threads: int = 2,
+        disk_budget: float = None,
+    ):
+        self.countries = countries
+        self.indicator = indicator
+        self.lookahead = lookahead
+        self.disk_budget = PREFETCH_DISK_BUDGET_BYTES if disk_budget is None else disk_budget
+        # The client is made here rather than lazily in the threads so only one is ever made
+        self.client = get_client()
+        self.executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="prefetch")
+        self.futures: dict[str, Future] = {}
+        self.resolved_datasets = set()
+        self.committed_bytes = 0
+        self.lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def close(self):
+        self.executor.shutdown(wait=True, cancel_futures=True)
+
+    def advance(self, country: str):
+        """Wait for any prefetch of country to finish, so it is not downloaded twice, and start
+        prefetching the countries which follow it
+
+        Arguments:
+            country {str} -- the country about to be processed
+        """
+        position = self.countries.index(country)
+        for next_country in self.countries[position + 1 : position + 1 + self.lookahead]:
+            if next_country not in self.futures:
+                self.futures[next_country] = self.executor.submit(
+                    self.prefetch_country, next_country
+                )
+
+        future = self.futures.get(country)
+        if future is not None:
+            try:
+                LOGGER.info(future.result())
+            except Exception as error:  # pylint: disable=broad-exception-caught
+                # The computation downloads anything the prefetch failed to get
+                LOGGER.info(f"Prefetch for {country} failed with {error!r}")
+
+    def prefetch_country(self, country: str) -> str:
+        n_datasets = 0
+        for data_type, properties in get_climada_datasets(country, self.indicator):
+            dataset_key = (data_type, tuple(sorted(properties.items())))
+            with self.lock:
+                if dataset_key in self.resolved_datasets:
+                    continue
+                self.resolved_datasets.add(dataset_key)
+
+            dataset_info = self.client.get_dataset_info(data_type=data_type, properties=properties)
+            with self.lock:
+                missing_bytes = get_missing_bytes(dataset_info, SYSTEM_DIR)
+                if missing_bytes == 0:
+                    continue
+                # Bytes being downloaded by the other threads are not yet on disk in full
+                if (
+                    get_directory_size(SYSTEM_DIR) + self.committed_bytes + missing_bytes
+                    > self.disk_budget
+                ):
+                    status = (
+                        f"Prefetch for {country} stopped, {missing_bytes / 1024**3:0.1f}GB of "
+                        f"{data_type} would exceed the disk budget for {SYSTEM_DIR}"
+                    )
+                    return status
+                self.committed_bytes += missing_bytes
+
+            try:
+                self.client.download_dataset(dataset_info, target_dir=SYSTEM_DIR)
+            finally:
+                with self.lock:
+                    self.committed_bytes -= missing_bytes
+            n_datasets += 1
+
+        status = f"Prefetched {n_datasets} CLIMADA datasets for {country}-{self.indicator}"
+        return status
+
+
+def get_dataset_directory(dataset_info: Any, data_directory: str) -> str:
+    """The directory Client.download_dataset puts the files of a dataset in, that is
+    [data_directory]/[data_type_group]/[data_type]/[name]/[version]
+
+    Arguments:
+        dataset_info {DatasetInfo} -- dataset from Client.get_dataset_info
+        data_directory {str} -- the CLIMADA data directory
+
+    Returns:
+        str -- directory for the dataset files
+    """
+    dataset_directory = str(data_directory)
+    data_type = dataset_info.data_type
+    if data_type.data_type_group:
+        dataset_directory = os.path.join(dataset_directory, data_type.data_type_group)
+    if data_type.data_type_group != data_type.data_type:
+        dataset_directory = os.path.join(dataset_directory, data_type.data_type)
+    dataset_directory = os.path.join(dataset_directory, dataset_info.name)
+    if dataset_info.version:
+        dataset_directory = os.path.join(dataset_directory, dataset_info.version)
+
+    return dataset_directory
+
+
+def get_missing_bytes(dataset_info: Any, data_directory: str) -> int:
+    # A file is only present if it is at the path the client downloads it to and is complete
+    dataset_directory = get_dataset_directory(dataset_info, data_directory)
+    missing_bytes = 0
+    for file_info in dataset_info.files:
+        file_path = os.path.join(dataset_directory, file_info.file_name)
+        if not os.path.exists(file_path) or os.path.getsize(file_path) != file_info.file_size:
+            missing_bytes += file_info.file_size
+
+    return missing_bytes
+
+
+def get_directory_size(data_directory: str) -> int:
+    directory_size = 0
+    for directory, _, file_names in os.walk(data_directory):
+        for file_name in file_names:
+            directory_size += os.path.getsize(os.path.join(directory, file_name))
+
+    return directory_size
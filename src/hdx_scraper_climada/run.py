@@ -2,17 +2,43 @@
 # encoding: utf-8
 
 import datetime
+import json
 import logging
 import os
+import sys
 import time
 
+from contextlib import nullcontext
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+try:
+    import resource
+except ImportError:
+    # resource is not available on Windows, peak RSS is then not recorded
+    resource = None
+
+from hdx.location.country import Country
 from hdx.utilities.easy_logging import setup_logging
 
 from hdx_scraper_climada.create_csv_files import (
     export_indicator_data_to_csv,
     make_detail_and_summary_file_paths,
+    merge_summary_fragments,
+    write_parquet_files,
+    HXL_TAGS,
+    TIMESERIES_HXL_TAGS,
 )
 from hdx_scraper_climada.create_datasets import create_datasets_in_hdx
+from hdx_scraper_climada.climada_interface import (
+    build_crop_production_stores,
+    count_hazard_centroids,
+)
+from hdx_scraper_climada.download_from_hdx import (
+    convert_all_admin_boundaries_to_geoparquet,
+    count_admin_shapes_by_country,
+)
+from hdx_scraper_climada.instrumentation import write_run_profile
+from hdx_scraper_climada.prefetch import ClimadaPrefetcher
 from hdx_scraper_climada.utilities import (
     read_countries,
     print_banner_to_log,
@@ -24,11 +50,21 @@ from hdx_scraper_climada.utilities import (
 setup_logging()
 LOGGER = logging.getLogger(__name__)
 
+# A rough model of the memory used to process a country, used until a measured peak RSS is recorded
+WORKER_BASE_BYTES = 1.5 * 1024**3
+BYTES_PER_CENTROID = 2 * 1024
+BYTES_PER_SHAPE = 2 * 1024**2
 
-def check_for_existing_csv_files(indicator: str) -> set:
+
+def get_all_countries(indicator: str) -> set:
     all_countries = {x["country_name"] for x in read_countries(indicator=indicator)}
     if indicator == "storm-europe":
         all_countries = set(["Ukraine"])
+    return all_countries
+
+
+def check_for_existing_csv_files(indicator: str) -> set:
+    all_countries = get_all_countries(indicator)
     output_paths = make_detail_and_summary_file_paths("Haiti", indicator)
 
     # Check which countries are in the summary
@@ -75,21 +111,286 @@ def check_for_existing_csv_files(indicator: str) -> set:
     return countries_to_process
 
 
-def produce_csv_files(countries_to_process: list[dict], indicator: str):
-    for country in countries_to_process:
-        statuses = export_indicator_data_to_csv(country=country, indicator=indicator)
-        for status in statuses:
-            LOGGER.info(status)
+def produce_csv_files(
+    countries_to_process: list[str],
+    indicator: str,
+    workers: int = 1,
+    memory_budget: float = None,
+    incremental: bool = False,
+    prefetch: int = 0,
+    prefetch_disk_budget: float = None,
+    log_directory: str = None,
+) -> dict:
+    """Produce the CSV files for each country, either one after another or with countries spread
+    over a pool of worker processes. In the latter case countries are started largest first, by
+    expected memory footprint, and only while the total expected footprint of the running countries
+    stays within the memory budget. Each country writes its own summary fragments, which are merged
+    into the published summary files once all the countries are done
+
+    Arguments:
+        countries_to_process {list[str]} -- country names
+        indicator {str} -- which indicator we are processing
+
+    Keyword Arguments:
+        workers {int} -- number of worker processes, 1 processes countries in this process
+                         (default: {1})
+        memory_budget {float} -- memory budget in bytes for all running countries, None for no
+                                 limit (default: {None})
+        incremental {bool} -- add only new hazard events to existing timeseries summaries
+                              (default: {False})
+        prefetch {int} -- when processing countries one after another, download the CLIMADA data
+                          for this many countries ahead in the background (default: {0})
+        prefetch_disk_budget {float} -- disk budget in bytes for the CLIMADA data directory when
+                                        prefetching, None for the default (default: {None})
+        log_directory {str} -- directory for the worker logs and peak RSS record, None for
+                               output/logs (default: {None})
+
+    Returns:
+        dict -- a list of statuses for each country
+    """
+    country_statuses = {}
+    if workers <= 1:
+        prefetcher = nullcontext()
+        if prefetch > 0:
+            prefetcher = ClimadaPrefetcher(
+                countries_to_process,
+                indicator,
+                lookahead=prefetch,
+                disk_budget=prefetch_disk_budget,
+            )
+        with prefetcher:
+            for country in countries_to_process:
+                if prefetch > 0:
+                    prefetcher.advance(country)
+                statuses = export_indicator_data_to_csv(
+                    country=country, indicator=indicator, incremental=incremental, merge=False
+                )
+                for status in statuses:
+                    LOGGER.info(status)
+                country_statuses[country] = statuses
+        merge_indicator_summaries(indicator)
+        return country_statuses
+
+    if prefetch > 0:
+        LOGGER.info("Prefetching is only used when countries are processed one after another")
+
+    if log_directory is None:
+        log_directory = os.path.join(os.path.dirname(__file__), "output", "logs")
+    os.makedirs(log_directory, exist_ok=True)
+    LOGGER.info(f"Processing {len(countries_to_process)} countries with {workers} workers")
+    LOGGER.info(f"Worker logs are written to {log_directory}")
+
+    # Workers only read the boundary partitions, they are never converted while workers are running
+    convert_all_admin_boundaries_to_geoparquet()
+    footprints = estimate_country_footprints(countries_to_process, indicator, log_directory)
+    pending = order_countries_by_footprint(countries_to_process, footprints)
+    if memory_budget is None:
+        memory_budget = float("inf")
+    else:
+        LOGGER.info(f"Memory budget is {memory_budget / 1024**3:0.1f}GB")
+
+    running = {}
+    # A fresh process for each country means the peak RSS we measure belongs to that country
+    with ProcessPoolExecutor(max_workers=workers, max_tasks_per_child=1) as executor:
+        while pending or running:
+            committed = sum(footprints[x] for x in running.values())
+            while pending and len(running) < workers:
+                country = choose_next_country(
+                    pending, footprints, committed, memory_budget, len(running)
+                )
+                if country is None:
+                    break
+                pending.remove(country)
+                committed += footprints[country]
+                LOGGER.info(
+                    f"Starting {country}, expected footprint {footprints[country] / 1024**3:0.1f}GB"
+                )
+                future = executor.submit(
+                    export_country_in_worker, country, indicator, log_directory, incremental
+                )
+                running[future] = country
+
+            done, _ = wait(running.keys(), return_when=FIRST_COMPLETED)
+            for future in done:
+                country = running.pop(future)
+                try:
+                    statuses, peak_rss = future.result()
+                    record_peak_rss(log_directory, indicator, country, peak_rss)
+                except Exception as error:  # pylint: disable=broad-exception-caught
+                    statuses = [f"Processing for {country} failed with {error!r}"]
+                for status in statuses:
+                    LOGGER.info(f"{country}: {status}")
+                country_statuses[country] = statuses
+
+    log_country_statuses(country_statuses)
+    merge_indicator_summaries(indicator)
+
+    return country_statuses
+
+
+def merge_indicator_summaries(indicator: str):
+    output_paths = make_detail_and_summary_file_paths("Haiti", indicator)
+    LOGGER.info(merge_summary_fragments(output_paths["output_summary_path"], HXL_TAGS))
+    if indicator in HAS_TIMESERIES:
+        LOGGER.info(
+            merge_summary_fragments(output_paths["output_timeseries_path"], TIMESERIES_HXL_TAGS)
+        )
+
+
+def export_country_in_worker(
+    country: str, indicator: str, log_directory: str, incremental: bool = False
+) -> tuple[list[str], int | None]:
+    country_str = country.lower().replace(" ", "-")
+    log_file_path = os.path.join(log_directory, f"{indicator}-{country_str}.log")
+    file_handler = logging.FileHandler(log_file_path, mode="w", encoding="utf-8")
+    file_handler.setFormatter(
+        logging.Formatter("%(asctime)s - %(processName)s - %(name)s - %(levelname)s - %(message)s")
+    )
+    logging.getLogger().addHandler(file_handler)
 
+    try:
+        statuses = export_indicator_data_to_csv(
+            country=country, indicator=indicator, incremental=incremental, merge=False
+        )
+    finally:
+        logging.getLogger().removeHandler(file_handler)
+        file_handler.close()
+
+    peak_rss = None
+    if resource is not None:
+        # ru_maxrss is in bytes on macOS and kilobytes elsewhere
+        peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        if sys.platform != "darwin":
+            peak_rss = peak_rss * 1024
+
+    return statuses, peak_rss
+
+
+def estimate_country_footprints(
+    countries: list[str], indicator: str, log_directory: str
+) -> dict[str, float]:
+    """Estimate the peak memory use in bytes for processing each country, this is the peak RSS from
+    an earlier run if there is one or else a rough model based on the number of hazard centroids
+    and admin shapes
+
+    Arguments:
+        countries {list[str]} -- country names
+        indicator {str} -- which indicator we are processing
+        log_directory {str} -- directory holding the peak RSS record
+
+    Returns:
+        dict[str, float] -- expected footprint in bytes keyed by country
+    """
+    peak_rss_record = read_peak_rss(log_directory).get(indicator, {})
+    shape_counts = count_admin_shapes_by_country()
+
+    footprints = {}
+    for country in countries:
+        if country in peak_rss_record:
+            footprints[country] = peak_rss_record[country]
+            continue
+        n_centroids = count_hazard_centroids(country, indicator)
+        n_shapes = shape_counts.get(Country.get_iso3_country_code(country), 0)
+        footprints[country] = (
+            WORKER_BASE_BYTES + (n_centroids or 0) * BYTES_PER_CENTROID + n_shapes * BYTES_PER_SHAPE
+        )
+
+    return footprints
+
+
+def order_countries_by_footprint(countries: list[str], footprints: dict[str, float]) -> list[str]:
+    return sorted(countries, key=lambda x: footprints[x], reverse=True)
+
+
+def choose_next_country(
+    pending: list[str],
+    footprints: dict[str, float],
+    committed: float,
+    memory_budget: float,
+    n_running: int,
+) -> str | None:
+    """Choose the first pending country, largest first, whose expected footprint fits in what is
+    left of the memory budget
+
+    Arguments:
+        pending {list[str]} -- countries still to start, from order_countries_by_footprint
+        footprints {dict[str, float]} -- expected footprint in bytes keyed by country
+        committed {float} -- total expected footprint of the running countries
+        memory_budget {float} -- memory budget in bytes for all running countries
+        n_running {int} -- number of running countries
 
-def hdx_climada_run(indicator: str, country: str, hdx_site: str = "stage", dry_run: bool = True):
+    Returns:
+        str | None -- a country to start, or None to wait for a running country to finish
+    """
+    country = next((x for x in pending if committed + footprints[x] <= memory_budget), None)
+    if country is None and n_running == 0:
+        # Always run something, even if it is expected to exceed the budget on its own
+        country = pending[0]
+
+    return country
+
+
+def read_peak_rss(log_directory: str) -> dict:
+    peak_rss_path = os.path.join(log_directory, "peak-rss.json")
+    if not os.path.exists(peak_rss_path):
+        return {}
+    with open(peak_rss_path, encoding="utf-8") as peak_rss_file:
+        return json.load(peak_rss_file)
+
+
+def record_peak_rss(log_directory: str, indicator: str, country: str, peak_rss: int | None):
+    if peak_rss is None:
+        return
+    peak_rss_record = read_peak_rss(log_directory)
+    peak_rss_record.setdefault(indicator, {})[country] = peak_rss
+    with open(os.path.join(log_directory, "peak-rss.json"), "w", encoding="utf-8") as peak_rss_file:
+        json.dump(peak_rss_record, peak_rss_file, indent=2, sort_keys=True)
+
+
+def log_country_statuses(country_statuses: dict):
+    failed_countries = sorted(
+        country
+        for country, statuses in country_statuses.items()
+        if any(" failed with " in x for x in statuses)
+    )
+    LOGGER.info("Country statuses:")
+    for country in sorted(country_statuses.keys()):
+        LOGGER.info(f"{country:<30} {country_statuses[country][-1]}")
+    LOGGER.info(
+        f"{len(country_statuses) - len(failed_countries)} countries succeeded, "
+        f"{len(failed_countries)} failed"
+    )
+    for country in failed_countries:
+        LOGGER.info(f"Failed: {country}")
+
+
+def hdx_climada_run(
+    indicator: str,
+    country: str,
+    hdx_site: str = "stage",
+    dry_run: bool = True,
+    workers: int = 1,
+    memory_budget: float = None,
+    incremental: bool = False,
+    parquet: bool = False,
+    prefetch: int = 0,
+    prefetch_disk_budget: float = None,
+):
     t0 = time.time()
     LOGGER.info(f"Indicator: {indicator}")
     LOGGER.info(f"country: {country}")
     LOGGER.info(f"hdx_site: {hdx_site}")
     LOGGER.info(f"dry_run: {dry_run}")
+    LOGGER.info(f"workers: {workers}")
+    LOGGER.info(f"memory_budget: {memory_budget}")
+    LOGGER.info(f"incremental: {incremental}")
+    LOGGER.info(f"parquet: {parquet}")
+    LOGGER.info(f"prefetch: {prefetch}")
 
     countries_to_process = check_for_existing_csv_files(indicator)
+    if incremental and indicator in HAS_TIMESERIES:
+        # Every country is revisited to look for hazard events which are not in its timeseries
+        countries_to_process = sorted(get_all_countries(indicator))
 
     if country != "all":
         if country in countries_to_process:
@@ -103,7 +404,24 @@ def hdx_climada_run(indicator: str, country: str, hdx_site: str = "stage", dry_r
         LOGGER.info("Countries to process:")
         for country_ in countries_to_process:
             LOGGER.info(country_)
-        produce_csv_files(countries_to_process, indicator)
+        if indicator == "crop-production":
+            # The global exposures are split by country once here, rather than in every worker
+            for status in build_crop_production_stores():
+                LOGGER.info(status)
+        produce_csv_files(
+            countries_to_process,
+            indicator,
+            workers=workers,
+            memory_budget=memory_budget,
+            incremental=incremental,
+            prefetch=prefetch,
+            prefetch_disk_budget=prefetch_disk_budget,
+        )
+        LOGGER.info(write_run_profile(countries_to_process, indicator))
+
+    if parquet:
+        for status in write_parquet_files(sorted(get_all_countries(indicator)), indicator):
+            LOGGER.info(status)
 
     LOGGER.info(f"Processed all countries in {time.time()-t0:0.0f} seconds")
     LOGGER.info(f"Timestamp: {datetime.datetime.now().isoformat()}")
@@ -0,0 +1,286 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+import logging
+
+import geopandas
+import numpy as np
+import rasterio.features
+import rasterio.transform
+import shapely
+
+from scipy import sparse
+
+from hdx.utilities.easy_logging import setup_logging
+
+setup_logging()
+LOGGER = logging.getLogger(__name__)
+
+
+class AdminShapeIndex:
+    """An STRtree over all of the polygons making up a list of admin shapes, as returned by
+    get_best_admin_shapes. It is built once per country and answers "which points lie within
+    which shape" for a whole grid of points with a single bulk query, replacing a
+    geometry.within(shp) pass per polygon.
+
+    Arguments:
+        admin_shapes {list[geopandas.geoseries.GeoSeries]} -- one GeoSeries per admin area
+    """
+
+    def __init__(self, admin_shapes: list[geopandas.geoseries.GeoSeries]):
+        geometries = []
+        shape_numbers = []
+        for i, admin_shape in enumerate(admin_shapes):
+            for geometry in admin_shape:
+                if geometry is None or geometry.is_empty:
+                    continue
+                geometries.append(geometry)
+                shape_numbers.append(i)
+
+        self.n_shapes = len(admin_shapes)
+        self.shape_numbers = np.array(shape_numbers, dtype=np.int32)
+        self.tree = shapely.STRtree(geometries)
+
+    def query(self, longitudes: np.ndarray, latitudes: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """Find all (point, shape) pairs where the point lies within the shape
+
+        Arguments:
+            longitudes {np.ndarray} -- point longitudes
+            latitudes {np.ndarray} -- point latitudes
+
+        Returns:
+            tuple[np.ndarray, np.ndarray] -- point positions and shape numbers, sorted by shape
+                                             number then point position, without duplicates
+        """
+        points = shapely.points(
+            np.asarray(longitudes, dtype=np.float64), np.asarray(latitudes, dtype=np.float64)
+        )
+        point_positions, geometry_positions = self.tree.query(points, predicate="within")
+        shape_numbers = self.shape_numbers[geometry_positions]
+
+        # A point can fall inside more than one polygon of a MultiPolygon admin area
+        pairs = np.unique(np.stack([shape_numbers, point_positions]), axis=1)
+
+        return pairs[1], pairs[0]
+
+    def indices_within(self, longitudes: np.ndarray, latitudes: np.ndarray) -> list[np.ndarray]:
+        """Positions of the points within each admin shape, in ascending order
+
+        Arguments:
+            longitudes {np.ndarray} -- point longitudes
+            latitudes {np.ndarray} -- point latitudes
+
+        Returns:
+            list[np.ndarray] -- one array of point positions per admin shape
+        """
+        point_positions, shape_numbers = self.query(longitudes, latitudes)
+        boundaries = np.searchsorted(shape_numbers, np.arange(self.n_shapes + 1))
+
+        return [point_positions[boundaries[i] : boundaries[i + 1]] for i in range(self.n_shapes)]
+
+    def assignment_matrix(self, longitudes: np.ndarray, latitudes: np.ndarray) -> sparse.csr_matrix:
+        """A sparse point to admin shape assignment matrix with a one where a point lies within a
+        shape. A point within more than one shape has a one for each of them.
+
+        Arguments:
+            longitudes {np.ndarray} -- point longitudes
+            latitudes {np.ndarray} -- point latitudes
+
+        Returns:
+            sparse.csr_matrix -- an n_points x n_shapes matrix
+        """
+        point_positions, shape_numbers = self.query(longitudes, latitudes)
+        assignment = sparse.csr_matrix(
+            (np.ones(len(point_positions)), (point_positions, shape_numbers)),
+            shape=(len(longitudes), self.n_shapes),
+        )
+
+        return assignment
+
+
+def split_points_by_shape_rows(
+    longitudes: np.ndarray,
+    latitudes: np.ndarray,
+    admin_shapes: list[geopandas.GeoSeries],
+    use_grid: bool = False,
+) -> list[np.ndarray]:
+    """Positions of the points within each admin shape, taking the rows of each shape's GeoSeries in
+    turn as LitPop.from_shape_and_countries does. A point within two rows of a shape appears twice.
+
+    Arguments:
+        longitudes {np.ndarray} -- point longitudes
+        latitudes {np.ndarray} -- point latitudes
+        admin_shapes {list[geopandas.GeoSeries]} -- one GeoSeries per admin area
+
+    Keyword Arguments:
+        use_grid {bool} -- try grid_indices_within first, for points on a regular grid
+                           (default: {False})
+
+    Returns:
+        list[np.ndarray] -- one array of point positions per admin shape
+    """
+    row_shapes = []
+    row_owners = []
+    for i, admin_shape in enumerate(admin_shapes):
+        for geometry in admin_shape:
+            row_shapes.append([geometry])
+            row_owners.append(i)
+
+    row_positions = None
+    if use_grid:
+        row_positions = grid_indices_within(longitudes, latitudes, row_shapes)
+    if row_positions is None:
+        row_positions = AdminShapeIndex(row_shapes).indices_within(longitudes, latitudes)
+
+    shape_positions = [[] for _ in admin_shapes]
+    for owner, positions in zip(row_owners, row_positions):
+        shape_positions[owner].append(positions)
+
+    return [
+        np.concatenate(x) if len(x) != 0 else np.array([], dtype=np.int64) for x in shape_positions
+    ]
+
+
+def get_grid_step(unique_values: np.ndarray) -> float:
+    """The spacing of a regular grid from its distinct coordinates, which may have gaps. Each gap
+    is counted in whole steps of the smallest gap, and the step is the full span over their total,
+    so rounding of the coordinates, e.g. to 5 decimal places, does not build up across the grid
+
+    Arguments:
+        unique_values {np.ndarray} -- sorted distinct coordinates, at least two
+
+    Returns:
+        float -- the grid spacing
+    """
+    gaps = np.diff(unique_values)
+    n_steps = np.rint(gaps / gaps.min()).sum()
+
+    return (unique_values[-1] - unique_values[0]) / n_steps
+
+
+def get_grid_cells(
+    longitudes: np.ndarray, latitudes: np.ndarray, max_cells_per_point: int = 16
+) -> tuple[rasterio.Affine, tuple[int, int], np.ndarray, np.ndarray] | None:
+    """Find the regular lat/lon grid a set of points sits on, as for the centroids of a gridded
+    hazard or exposure. The grid spacing is found by get_grid_step and every point must lie within
+    1% of a step of a cell centre
+
+    Arguments:
+        longitudes {np.ndarray} -- point longitudes
+        latitudes {np.ndarray} -- point latitudes
+
+    Keyword Arguments:
+        max_cells_per_point {int} -- give up on grids which are mostly empty (default: {16})
+
+    Returns:
+        tuple | None -- the grid transform, its (height, width) and the row and column of each
+                        point, or None if the points are not on a regular grid
+    """
+    longitudes = np.asarray(longitudes, dtype=np.float64)
+    latitudes = np.asarray(latitudes, dtype=np.float64)
+    unique_longitudes = np.unique(longitudes)
+    unique_latitudes = np.unique(latitudes)
+    if len(unique_longitudes) < 2 or len(unique_latitudes) < 2:
+        return None
+
+    x_step = get_grid_step(unique_longitudes)
+    y_step = get_grid_step(unique_latitudes)
+    columns = np.rint((longitudes - unique_longitudes[0]) / x_step).astype(np.int64)
+    rows = np.rint((unique_latitudes[-1] - latitudes) / y_step).astype(np.int64)
+    shape = (int(rows.max()) + 1, int(columns.max()) + 1)
+    if shape[0] * shape[1] > max_cells_per_point * len(longitudes):
+        return None
+
+    on_grid = np.all(
+        np.abs(longitudes - (unique_longitudes[0] + columns * x_step)) <= 0.01 * x_step
+    ) and np.all(np.abs(latitudes - (unique_latitudes[-1] - rows * y_step)) <= 0.01 * y_step)
+    if not on_grid:
+        return None
+
+    transform = rasterio.transform.from_origin(
+        unique_longitudes[0] - x_step / 2.0, unique_latitudes[-1] + y_step / 2.0, x_step, y_step
+    )
+
+    return transform, shape, rows, columns
+
+
+def grid_indices_within(
+    longitudes: np.ndarray, latitudes: np.ndarray, admin_shapes: list[geopandas.GeoSeries]
+) -> list[np.ndarray] | None:
+    """The same answer as AdminShapeIndex(admin_shapes).indices_within for points on a regular
+    grid, found by rasterizing the admin shapes onto the grid once and reading each point's label
+    from its cell. Cells crossed by a shape boundary, or their neighbours, and cells covered by
+    more than one shape are resolved by the exact point in polygon test
+
+    Arguments:
+        longitudes {np.ndarray} -- point longitudes
+        latitudes {np.ndarray} -- point latitudes
+        admin_shapes {list[geopandas.GeoSeries]} -- one GeoSeries per admin area
+
+    Returns:
+        list[np.ndarray] | None -- one array of point positions per admin shape, or None if the
+                                   points are not on a regular grid
+    """
+    grid_cells = get_grid_cells(longitudes, latitudes)
+    if grid_cells is None:
+        return None
+    transform, shape, rows, columns = grid_cells
+
+    geometries = []
+    for i, admin_shape in enumerate(admin_shapes):
+        for geometry in admin_shape:
+            if geometry is None or geometry.is_empty:
+                continue
+            geometries.append((geometry, i + 1))
+    if len(geometries) == 0:
+        return [np.array([], dtype=np.int64) for _ in admin_shapes]
+
+    labels = rasterio.features.rasterize(
+        geometries, out_shape=shape, transform=transform, fill=0, dtype=np.int32
+    )
+    coverage = rasterio.features.rasterize(
+        [(geometry, 1) for geometry, _ in geometries],
+        out_shape=shape,
+        transform=transform,
+        fill=0,
+        dtype=np.uint16,
+        merge_alg=rasterio.features.MergeAlg.add,
+    )
+    edges = rasterio.features.rasterize(
+        [(geometry.boundary, 1) for geometry, _ in geometries],
+        out_shape=shape,
+        transform=transform,
+        fill=0,
+        all_touched=True,
+        dtype=np.uint8,
+    ).astype(bool)
+    # Widen the edge by a cell so boundaries lying along a cell edge are never missed
+    padded_edges = np.pad(edges, 1)
+    for row_offset in [-1, 0, 1]:
+        for column_offset in [-1, 0, 1]:
+            edges |= padded_edges[
+                1 + row_offset : 1 + row_offset + shape[0],
+                1 + column_offset : 1 + column_offset + shape[1],
+            ]
+
+    exact = edges[rows, columns] | (coverage[rows, columns] > 1)
+    point_labels = labels[rows, columns] - 1
+
+    fast_positions = np.flatnonzero(~exact & (point_labels >= 0))
+    fast_shape_numbers = point_labels[fast_positions]
+
+    exact_positions = np.flatnonzero(exact)
+    exact_shape_numbers = np.array([], dtype=np.int32)
+    if len(exact_positions) != 0:
+        exact_points, exact_shape_numbers = AdminShapeIndex(admin_shapes).query(
+            np.asarray(longitudes)[exact_positions], np.asarray(latitudes)[exact_positions]
+        )
+        exact_positions = exact_positions[exact_points]
+
+    positions = np.concatenate([fast_positions, exact_positions])
+    shape_numbers = np.concatenate([fast_shape_numbers, exact_shape_numbers])
+    order = np.lexsort((positions, shape_numbers))
+    positions = positions[order]
+    boundaries = np.searchsorted(shape_numbers[order], np.arange(len(admin_shapes) + 1))
+
+    return [positions[boundaries[i] : boundaries[i + 1]] for i in range(len(admin_shapes))]
@@ -3,6 +3,7 @@
 
 import csv
 import datetime
+import json
 import logging
 import os
 
@@ -28,6 +29,9 @@ HAS_TIMESERIES = [
     "storm-europe",
 ]
 
+# Country names keyed by the lower case, hyphenated form used in file names
+COUNTRY_STR_LOOKUP = {}
+
 NO_DATA = {}
 NO_DATA["litpop"] = set(["Syrian Arab Republic"])
 NO_DATA["crop-production"] = set()
@@ -82,16 +86,131 @@ Original at: https://climada.ethz.ch/disclaimer/
 
 
 def get_set_of_countries_in_summary_file(summary_file_path: str, indicator: str) -> set:
+    # Countries are in a summary file once they have a fragment, even if they have not been merged
     summary_countries = set()
-    if os.path.exists(summary_file_path):
-        with open(summary_file_path, encoding="utf-8") as summary_file:
-            rows = csv.DictReader(summary_file)
-            summary_countries = {x["country_name"] for x in rows if x["country_name"] != "#country"}
-            summary_countries = summary_countries.union(NO_DATA.get(indicator, set()))
+    summary_fragments = get_summary_fragments(summary_file_path)
+    if os.path.exists(summary_file_path) or len(summary_fragments) != 0:
+        if os.path.exists(summary_file_path):
+            summary_file_index = read_summary_file_index(summary_file_path)
+            summary_countries = set(summary_file_index["countries"].keys())
+        summary_countries = summary_countries.union(summary_fragments.keys())
+        summary_countries = summary_countries.union(NO_DATA.get(indicator, set()))
 
     return summary_countries
 
 
+def get_summary_fragment_path(summary_file_path: str, country: str) -> str:
+    country_str = country.lower().replace(" ", "-")
+    return os.path.join(
+        os.path.dirname(summary_file_path),
+        "fragments",
+        f"{country_str}-{os.path.basename(summary_file_path)}",
+    )
+
+
+def get_summary_fragments(summary_file_path: str) -> dict:
+    """Find the per-country fragments of a summary or timeseries summary file
+
+    Arguments:
+        summary_file_path {str} -- path to the merged summary file
+
+    Returns:
+        dict -- fragment paths keyed by the country name in each fragment
+    """
+    fragment_directory = os.path.join(os.path.dirname(summary_file_path), "fragments")
+    if not os.path.exists(fragment_directory):
+        return {}
+
+    summary_fragments = {}
+    suffix = f"-{os.path.basename(summary_file_path)}"
+    for file_name in sorted(os.listdir(fragment_directory)):
+        if not file_name.endswith(suffix):
+            continue
+        fragment_path = os.path.join(fragment_directory, file_name)
+        # The country is found from the file name, only fragments for countries which are not in
+        # countries.csv are opened to read it from their first row
+        country = get_country_from_country_str(file_name[: -len(suffix)])
+        if country is None:
+            with open(fragment_path, encoding="utf-8") as fragment_file:
+                first_row = next(csv.DictReader(fragment_file), None)
+            if first_row is not None:
+                country = first_row["country_name"]
+        if country is not None:
+            summary_fragments[country] = fragment_path
+
+    return summary_fragments
+
+
+def get_country_from_country_str(country_str: str) -> str | None:
+    if len(COUNTRY_STR_LOOKUP) == 0:
+        for row in read_countries():
+            COUNTRY_STR_LOOKUP[row["country_name"].lower().replace(" ", "-")] = row["country_name"]
+    return COUNTRY_STR_LOOKUP.get(country_str)
+
+
+def get_summary_file_index_path(summary_file_path: str) -> str:
+    return f"{os.path.splitext(summary_file_path)[0]}.index.json"
+
+
+def read_summary_file_index(summary_file_path: str) -> dict:
+    """Read the index of a summary or timeseries summary file, which gives the number of rows and
+    the byte ranges holding them for each country. The index is rebuilt by scanning the summary
+    file if it is missing or the summary file has changed size since it was written
+
+    Arguments:
+        summary_file_path {str} -- path to the summary file
+
+    Returns:
+        dict -- {"size": summary file size, "countries": {country: {"rows": n, "ranges": [...]}}}
+    """
+    index_path = get_summary_file_index_path(summary_file_path)
+    if os.path.exists(index_path):
+        with open(index_path, encoding="utf-8") as index_file:
+            summary_file_index = json.load(index_file)
+        if summary_file_index["size"] == os.path.getsize(summary_file_path):
+            return summary_file_index
+
+    summary_file_index = build_summary_file_index(summary_file_path)
+    write_summary_file_index(summary_file_path, summary_file_index)
+    return summary_file_index
+
+
+def build_summary_file_index(summary_file_path: str) -> dict:
+    summary_file_index = {"size": 0, "countries": {}}
+    with open(summary_file_path, "rb") as summary_file:
+        header = next(csv.reader([summary_file.readline().decode("utf-8", errors="ignore")]))
+        country_column = header.index("country_name")
+        offset = summary_file.tell()
+        for line in summary_file:
+            row = next(csv.reader([line.decode("utf-8", errors="ignore")]))
+            if row[country_column] != "#country":
+                add_summary_file_index_rows(
+                    summary_file_index, row[country_column], 1, offset, offset + len(line)
+                )
+            offset += len(line)
+
+    summary_file_index["size"] = offset
+    return summary_file_index
+
+
+def add_summary_file_index_rows(
+    summary_file_index: dict, country: str, n_rows: int, start: int, stop: int
+):
+    entry = summary_file_index["countries"].setdefault(country, {"rows": 0, "ranges": []})
+    entry["rows"] += n_rows
+    if len(entry["ranges"]) != 0 and entry["ranges"][-1][1] == start:
+        entry["ranges"][-1][1] = stop
+    elif len(entry["ranges"]) == 0 or entry["ranges"][-1] != [start, stop]:
+        entry["ranges"].append([start, stop])
+
+
+def write_summary_file_index(summary_file_path: str, summary_file_index: dict):
+    index_path = get_summary_file_index_path(summary_file_path)
+    with open(f"{index_path}.tmp", "w", encoding="utf-8") as index_file:
+        json.dump(summary_file_index, index_file)
+    os.replace(f"{index_path}.tmp", index_path)
+
+
 def write_dictionary(
     output_filepath: str, output_rows: list[dict[str, Any]], append: bool = True
 ) -> str:
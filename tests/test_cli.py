@@ -0,0 +1,43 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+import subprocess
+import sys
+
+import pytest
+
+# Commands which do not use CLIMADA or the HDX API should start without importing any of these
+HEAVY_MODULES = ["climada", "geopandas", "hdx.data.dataset", "pandas"]
+
+CLI_SCRIPT = f"""
+import sys
+from hdx_scraper_climada.cli import hdx_climada
+try:
+    hdx_climada(standalone_mode=False)
+except SystemExit:
+    pass
+print("heavy_modules:" + ",".join(x for x in {HEAVY_MODULES!r} if x in sys.modules))
+"""
+
+
+def run_cli(arguments: list[str]) -> list[str]:
+    result = subprocess.run(
+        [sys.executable, "-c", CLI_SCRIPT, *arguments],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+    heavy_modules_line = [x for x in result.stdout.splitlines() if x.startswith("heavy_modules:")]
+    heavy_modules = [x for x in heavy_modules_line[0].split(":")[1].split(",") if x != ""]
+    return heavy_modules
+
+
+@pytest.mark.parametrize(
+    "arguments",
+    [["--help"], ["dataset_date", "--indicator", "litpop", "--source", "local"]],
+)
+def test_cli_startup_imports(arguments):
+    heavy_modules = run_cli(arguments)
+
+    assert heavy_modules == []
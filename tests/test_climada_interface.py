@@ -8,9 +8,17 @@ Ian Hopkinson 2024-01-16
 
 import os
 import time
+from collections import OrderedDict
+from types import SimpleNamespace
+
+import geopandas
+import numpy as np
 import pandas as pd
 import pytest
 
+from scipy import sparse
+from shapely.geometry import box
+
 
 from climada.util.api_client import Client
 
@@ -22,15 +30,26 @@ from hdx_scraper_climada.download_from_hdx import (
     get_admin2_shapes_from_hdx,
 )
 
+from hdx_scraper_climada import climada_interface
 from hdx_scraper_climada.climada_interface import (
+    aggregate_events_by_admin,
+    aggregate_value,
+    calculate_crop_production_for_admin1,
+    calculate_crop_production_for_admin1_by_exposure,
     calculate_indicator_for_admin1,
     calculate_indicator_timeseries_admin,
     filter_dataframe_with_geometry,
+    filter_dataframe_with_intensity,
+    estimate_hazard_bytes,
     flood_timeseries_data_shim,
+    get_climada_datasets,
     get_date_range_from_live_api,
+    get_hazard_from_cache,
+    transform_intensity_values,
 )
 
 from hdx_scraper_climada.create_csv_files import make_detail_and_summary_file_paths
+from hdx_scraper_climada.spatial_index import AdminShapeIndex
 
 
 COUNTRY_ISO3A = "HTI"
@@ -177,6 +196,14 @@ def test_calculate_indicator_for_admin1_crop_production():
     assert len(admin1_indicator_gdf) == 128
 
 
+def test_crop_production_matrix_matches_exposure_filters():
+    for admin1_shape in ADMIN1_SHAPES:
+        matrix_gdf = calculate_crop_production_for_admin1(admin1_shape, COUNTRY)
+        exposure_gdf = calculate_crop_production_for_admin1_by_exposure(admin1_shape, COUNTRY)
+
+        pd.testing.assert_frame_equal(matrix_gdf, exposure_gdf, check_dtype=False)
+
+
 def test_calculate_indicator_for_admin1_earthquake():
     indicator = "earthquake"
 
@@ -309,6 +336,173 @@ def test_filter_dataframe_with_geometry():
     assert admin_indicator_uncached_gdf["value"].equals(admin_indicator_cached_gdf["value"])
 
 
+def make_hazard(n_centroids: int) -> SimpleNamespace:
+    intensity = sparse.csr_matrix(np.ones((2, n_centroids)))
+    return SimpleNamespace(
+        intensity=intensity,
+        fraction=sparse.csr_matrix(intensity.shape),
+        centroids=SimpleNamespace(lat=np.zeros(n_centroids), lon=np.zeros(n_centroids)),
+    )
+
+
+class FakeHazardClient:
+    def __init__(self):
+        self.requests = []
+
+    def get_hazard(self, climada_indicator, properties=None):
+        self.requests.append(properties["country_iso3alpha"])
+        return make_hazard(10)
+
+
+def test_get_hazard_from_cache_evicts_least_recently_used(monkeypatch):
+    fake_client = FakeHazardClient()
+    hazard_bytes = estimate_hazard_bytes(make_hazard(10), np.zeros(10))
+    monkeypatch.setattr(climada_interface, "get_client", lambda: fake_client)
+    monkeypatch.setattr(climada_interface, "HAZARD_CACHE", OrderedDict())
+    monkeypatch.setattr(climada_interface, "HAZARD_CACHE_MAX_BYTES", int(2.5 * hazard_bytes))
+
+    def cached_countries():
+        return [dict(x[1])["country_iso3alpha"] for x in climada_interface.HAZARD_CACHE]
+
+    for country_iso3alpha in ["HTI", "JAM", "CUB"]:
+        get_hazard_from_cache("earthquake", {"country_iso3alpha": country_iso3alpha})
+    assert cached_countries() == ["JAM", "CUB"]
+
+    # A hit fetches nothing and moves its entry to the most recently used end
+    hazard, max_intensity = get_hazard_from_cache("earthquake", {"country_iso3alpha": "JAM"})
+    assert fake_client.requests == ["HTI", "JAM", "CUB"]
+    assert cached_countries() == ["CUB", "JAM"]
+    assert max_intensity.tolist() == 10 * [1.0]
+
+    get_hazard_from_cache("earthquake", {"country_iso3alpha": "DOM"})
+    assert cached_countries() == ["JAM", "DOM"]
+
+
+def test_get_climada_datasets():
+    assert get_climada_datasets("Haiti", "tropical-cyclone") == [
+        ("tropical_cyclone", {"event_type": "observed", "country_iso3alpha": "HTI"})
+    ]
+    assert len(get_climada_datasets("Haiti", "crop-production")) == 8
+    assert get_climada_datasets("Haiti", "litpop") == []
+
+
+def test_filter_dataframe_with_intensity():
+    values = np.array([0.0, 300.0, 900.0, 1300.0, 2500.0])
+    country_data = pd.DataFrame({"latitude": 5 * [18.5], "longitude": 5 * [-72.5], "value": values})
+
+    flood_data = filter_dataframe_with_intensity(country_data, "flood")
+    wildfire_data = filter_dataframe_with_intensity(country_data, "wildfire")
+    river_flood_values, keep = transform_intensity_values(values, "river_flood")
+
+    assert flood_data.index.to_list() == [1, 2, 3, 4]
+    assert wildfire_data["value"].to_list() == [0.0, 300.0, 450.0, 325.0, 625.0]
+    assert country_data["value"].to_list() == values.tolist()
+    assert keep is None and river_flood_values.tolist() == values.tolist()
+
+
+@pytest.mark.parametrize("indicator", ["earthquake", "flood", "wildfire"])
+def test_aggregate_events_by_admin(indicator):
+    admin_shapes = [
+        geopandas.GeoSeries([box(0.0, 0.0, 2.0, 2.0)]),
+        geopandas.GeoSeries([box(2.0, 0.0, 4.0, 2.0)]),
+    ]
+    longitudes = np.array([0.5, 1.5, 0.5, 2.5, 3.5, 3.5, 5.0])
+    latitudes = np.array([0.5, 0.5, 1.5, 0.5, 0.5, 1.5, 0.5])
+    dense_intensity = np.array(
+        [
+            [1.0, 0.0, 700.0, 0.0, 0.0, 0.0, 9.0],
+            [0.0, 0.0, 0.0, 2.5, 3.25, 1300.0, 0.0],
+            [0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 4.0],
+        ]
+    )
+
+    assignment = AdminShapeIndex(admin_shapes).assignment_matrix(longitudes, latitudes)
+    event_admin_table = aggregate_events_by_admin(
+        indicator, sparse.csr_matrix(dense_intensity), assignment, latitudes, longitudes
+    )
+
+    expected_rows = []
+    for i, values in enumerate(dense_intensity):
+        country_data = pd.DataFrame(
+            {"latitude": latitudes, "longitude": longitudes, "value": values}
+        )
+        country_data = filter_dataframe_with_intensity(country_data, indicator)
+        for j, admin_shape in enumerate(admin_shapes):
+            admin_gdf = filter_dataframe_with_geometry(country_data, admin_shape, indicator)
+            value, aggregation = aggregate_value(indicator, admin_gdf)
+            if value > 0.0:
+                expected_rows.append(
+                    (
+                        i,
+                        j,
+                        value,
+                        round(admin_gdf["latitude"].mean(), 4),
+                        round(admin_gdf["longitude"].mean(), 4),
+                        aggregation,
+                    )
+                )
+
+    actual_rows = [
+        (
+            event_admin_table["event"][k],
+            event_admin_table["shape"][k],
+            event_admin_table["value"][k],
+            event_admin_table["latitude"][k],
+            event_admin_table["longitude"][k],
+            event_admin_table["aggregation"],
+        )
+        for k in range(len(event_admin_table["event"]))
+    ]
+
+    assert actual_rows == expected_rows
+
+
+def test_get_admin1_positions_builds_one_index_per_country(monkeypatch):
+    admin1_shapes = [
+        geopandas.GeoSeries([box(0.0, 0.0, 2.0, 2.0)]),
+        geopandas.GeoSeries([box(2.0, 0.0, 4.0, 2.0)]),
+    ]
+    built_indexes = []
+
+    class CountingAdminShapeIndex(AdminShapeIndex):
+        def __init__(self, admin_shapes):
+            built_indexes.append(len(admin_shapes))
+            super().__init__(admin_shapes)
+
+    monkeypatch.setattr(climada_interface, "AdminShapeIndex", CountingAdminShapeIndex)
+    monkeypatch.setattr(climada_interface, "ADMIN_SHAPE_INDEX_CACHE", {})
+    monkeypatch.setattr(
+        climada_interface, "get_admin1_shapes_from_hdx", lambda x: (["A", "B"], admin1_shapes)
+    )
+    longitudes = np.array([0.5, 2.5, 1.5, 3.5, 5.0])
+    latitudes = np.array([0.5, 0.5, 1.5, 1.5, 0.5])
+    country_data = pd.DataFrame({"latitude": latitudes, "longitude": longitudes, "value": 1.0})
+
+    for points_key in ["litpop_alt", "crop-production.mai.noirr.USD"]:
+        for admin1_shape, expected_positions in zip(admin1_shapes, [[0, 2], [1, 3]]):
+            positions = climada_interface.get_admin1_positions(
+                admin1_shape, COUNTRY, points_key, longitudes, latitudes
+            )
+            assert positions.tolist() == expected_positions
+            admin1_gdf = filter_dataframe_with_geometry(
+                country_data, admin1_shape, points_key, index_within=positions
+            )
+            assert admin1_gdf.equals(
+                filter_dataframe_with_geometry(country_data, admin1_shape, points_key)
+            )
+
+    # One index over both shapes for the country, plus one per shape for the unindexed filters
+    assert built_indexes == [2, 1, 1, 1, 1]
+    # A shape from elsewhere is left to filter_dataframe_with_geometry
+    other_shape = geopandas.GeoSeries([box(4.0, 0.0, 6.0, 2.0)])
+    assert (
+        climada_interface.get_admin1_positions(
+            other_shape, COUNTRY, "litpop_alt", longitudes, latitudes
+        )
+        is None
+    )
+
+
 def test_calculate_indicator_for_admin1_flood():
     indicator = "flood"
 
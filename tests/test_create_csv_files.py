@@ -2,19 +2,45 @@
 # encoding: utf-8
 
 import csv
+import datetime
 import os
+import shutil
 import pytest
 
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+
+from scipy import sparse
+
+from hdx_scraper_climada import climada_interface, create_csv_files
+
 from hdx_scraper_climada.create_csv_files import (
     create_detail_dataframes,
     create_summary_data,
     write_detail_data,
+    write_detail_and_summary_data,
     write_summary_data,
     make_detail_and_summary_file_paths,
     export_indicator_data_to_csv,
+    read_timeseries_event_names,
+    record_timeseries_event_names,
+    write_summary_fragment,
+    merge_summary_fragments,
+    convert_csv_to_parquet,
+    read_data_file,
+    HXL_TAGS,
+    TIMESERIES_HXL_TAGS,
 )
 
-from hdx_scraper_climada.utilities import HAS_TIMESERIES
+from hdx_scraper_climada.utilities import (
+    HAS_TIMESERIES,
+    build_summary_file_index,
+    get_set_of_countries_in_summary_file,
+    get_summary_fragment_path,
+    read_summary_file_index,
+)
 
 EXPORT_DIRECTORY = os.path.join(os.path.dirname(__file__), "temp")
 COUNTRY = "Haiti"
@@ -84,6 +110,22 @@ def test_write_detail_data(haiti_detail_dataframes):
     )
 
 
+def test_write_detail_and_summary_data(haiti_detail_dataframes):
+    output_file_path = os.path.join(EXPORT_DIRECTORY, "haiti-admin1-earthquake-streamed.csv")
+    if os.path.exists(output_file_path):
+        os.remove(output_file_path)
+
+    _, summary_rows, n_lines = write_detail_and_summary_data(
+        (x for x in haiti_detail_dataframes), output_file_path
+    )
+
+    with open(output_file_path, encoding="utf-8") as detail_file:
+        rows = list(csv.DictReader(detail_file))
+
+    assert len(rows) == 1301
+    assert (summary_rows, n_lines) == create_summary_data(haiti_detail_dataframes)
+
+
 def test_write_summary_data(haiti_detail_dataframes):
     output_paths = make_detail_and_summary_file_paths(
         COUNTRY, INDICATOR, export_directory=EXPORT_DIRECTORY
@@ -111,6 +153,95 @@ def test_write_summary_data(haiti_detail_dataframes):
     )
 
 
+def test_convert_csv_to_parquet(haiti_detail_dataframes):
+    output_file_path = os.path.join(EXPORT_DIRECTORY, "haiti-admin1-earthquake-parquet.csv")
+    if os.path.exists(output_file_path):
+        os.remove(output_file_path)
+    _ = write_detail_data(haiti_detail_dataframes, output_file_path)
+
+    csv_data, csv_hxl_tags = read_data_file(output_file_path)
+    _ = convert_csv_to_parquet(output_file_path, HXL_TAGS)
+    parquet_data, parquet_hxl_tags = read_data_file(output_file_path)
+
+    assert list(parquet_hxl_tags.values()) == EXPECTED_HXL_TAGS
+    assert list(csv_hxl_tags.values()) == EXPECTED_HXL_TAGS
+    assert list(parquet_data.columns) == EXPECTED_COLUMN_LIST
+    assert len(parquet_data) == len(csv_data)
+    assert str(parquet_data["latitude"].dtype) == "float32"
+    assert str(parquet_data["country_name"].dtype) == "category"
+    assert parquet_data["value"].tolist() == csv_data["value"].tolist()
+    pd.testing.assert_frame_equal(parquet_data, csv_data)
+
+
+def test_read_data_file_timeseries_from_csv_and_parquet():
+    output_file_path = os.path.join(EXPORT_DIRECTORY, "haiti-admin1-timeseries-parquet.csv")
+    parquet_file_path = output_file_path.replace(".csv", ".parquet")
+    for file_path in [output_file_path, parquet_file_path]:
+        if os.path.exists(file_path):
+            os.remove(file_path)
+    with open(output_file_path, "w", encoding="utf-8", newline="") as output_file:
+        writer = csv.DictWriter(output_file, fieldnames=list(TIMESERIES_HXL_TAGS.keys()))
+        writer.writeheader()
+        writer.writerow(TIMESERIES_HXL_TAGS)
+        for event_date, value in [("1913-06-14T00:00:00", 4.65), ("2010-01-12T00:00:00", 7.1)]:
+            writer.writerow(
+                {
+                    "country_name": "Haiti",
+                    "admin1_name": "Nord",
+                    "admin2_name": "",
+                    "latitude": 19.6,
+                    "longitude": -72.2,
+                    "aggregation": "max",
+                    "indicator": "earthquake.date",
+                    "event_date": event_date,
+                    "value": value,
+                }
+            )
+
+    csv_data, csv_hxl_tags = read_data_file(output_file_path)
+    _ = convert_csv_to_parquet(output_file_path, TIMESERIES_HXL_TAGS)
+    parquet_data, parquet_hxl_tags = read_data_file(output_file_path)
+
+    assert csv_hxl_tags == parquet_hxl_tags == TIMESERIES_HXL_TAGS
+    # Dates stay as strings and a blank admin2_name stays an empty string, read from either file
+    assert parquet_data["event_date"].tolist() == ["1913-06-14T00:00:00", "2010-01-12T00:00:00"]
+    pd.testing.assert_frame_equal(parquet_data, csv_data)
+
+
+def test_write_summary_data_updates_index():
+    output_summary_path = os.path.join(EXPORT_DIRECTORY, "admin1-summaries-index-test.csv")
+    if os.path.exists(output_summary_path):
+        os.remove(output_summary_path)
+
+    for country, admin1_names in [("Haiti", ["Centre", "Nord"]), ("Chad", ["Batha"])]:
+        summary_rows = [
+            {
+                "country_name": country,
+                "admin1_name": admin1_name,
+                "latitude": 19.0,
+                "longitude": -72.0,
+                "aggregation": "max",
+                "indicator": "earthquake",
+                "value": 7.5,
+            }
+            for admin1_name in admin1_names
+        ]
+        _ = write_summary_data(summary_rows, output_summary_path)
+
+    summary_file_index = read_summary_file_index(output_summary_path)
+
+    assert summary_file_index == build_summary_file_index(output_summary_path)
+    assert summary_file_index["countries"]["Haiti"]["rows"] == 2
+    assert get_set_of_countries_in_summary_file(output_summary_path, "wildfire") == {
+        "Haiti",
+        "Chad",
+    }
+    start, stop = summary_file_index["countries"]["Chad"]["ranges"][0]
+    with open(output_summary_path, "rb") as summary_file:
+        summary_file.seek(start)
+        assert summary_file.read(stop - start).decode("utf-8").startswith("Chad,Batha")
+
+
 def test_make_detail_and_summary_file_paths():
     output_paths = make_detail_and_summary_file_paths(
         COUNTRY, INDICATOR, export_directory=EXPORT_DIRECTORY
@@ -120,8 +251,148 @@ def test_make_detail_and_summary_file_paths():
     assert "admin1-summaries-earthquake.csv" in output_paths["output_summary_path"]
     assert "admin1-timeseries-summaries-earthquake.csv" in output_paths["output_timeseries_path"]
 
-    for _, file_path in output_paths.items():
-        assert os.path.dirname(file_path) == os.path.join(EXPORT_DIRECTORY, f"{INDICATOR}")
+    for key, file_path in output_paths.items():
+        if "fragment" in key or "events" in key:
+            assert os.path.dirname(file_path) == os.path.join(
+                EXPORT_DIRECTORY, f"{INDICATOR}", "fragments"
+            )
+        else:
+            assert os.path.dirname(file_path) == os.path.join(EXPORT_DIRECTORY, f"{INDICATOR}")
+
+
+def test_merge_summary_fragments():
+    output_summary_path = os.path.join(EXPORT_DIRECTORY, "merge", "admin1-summaries-wildfire.csv")
+    os.makedirs(os.path.join(EXPORT_DIRECTORY, "merge", "fragments"), exist_ok=True)
+    for country in ["Haiti", "Chad", "Mali"]:
+        fragment_path = get_summary_fragment_path(output_summary_path, country)
+        if os.path.exists(fragment_path):
+            os.remove(fragment_path)
+    if os.path.exists(output_summary_path):
+        os.remove(output_summary_path)
+
+    # A published file from before fragments were introduced
+    legacy_rows = [dict(HXL_TAGS, country_name="Mali", admin1_name="Kayes", value=1.0)]
+    _ = write_summary_data(legacy_rows, output_summary_path)
+
+    for country, admin1_names in [("Haiti", ["Nord", "Sud"]), ("Chad", ["Batha"])]:
+        summary_rows = [
+            dict(HXL_TAGS, country_name=country, admin1_name=admin1_name, value=2.0)
+            for admin1_name in admin1_names
+        ]
+        _ = write_summary_fragment(
+            summary_rows, get_summary_fragment_path(output_summary_path, country)
+        )
+    _ = merge_summary_fragments(output_summary_path, HXL_TAGS)
+
+    with open(output_summary_path, encoding="utf-8") as summary_file:
+        rows = list(csv.DictReader(summary_file))
+
+    assert rows[0]["country_name"] == "#country"
+    assert [(x["country_name"], x["admin1_name"]) for x in rows[1:]] == [
+        ("Chad", "Batha"),
+        ("Haiti", "Nord"),
+        ("Haiti", "Sud"),
+        ("Mali", "Kayes"),
+    ]
+    assert read_summary_file_index(output_summary_path) == build_summary_file_index(
+        output_summary_path
+    )
+
+    # Recomputing a country replaces its rows
+    _ = write_summary_fragment(
+        [dict(HXL_TAGS, country_name="Haiti", admin1_name="Ouest", value=3.0)],
+        get_summary_fragment_path(output_summary_path, "Haiti"),
+    )
+    _ = merge_summary_fragments(output_summary_path, HXL_TAGS)
+
+    summary_file_index = read_summary_file_index(output_summary_path)
+    assert summary_file_index["countries"]["Haiti"]["rows"] == 1
+    assert summary_file_index["countries"]["Mali"]["rows"] == 1
+
+
+def test_record_timeseries_event_names():
+    events_path = os.path.join(EXPORT_DIRECTORY, "admin1-timeseries-events-test.json")
+    if os.path.exists(events_path):
+        os.remove(events_path)
+
+    _ = record_timeseries_event_names(events_path, "Haiti", ["event-2", "event-1", "event-2"])
+    _ = record_timeseries_event_names(events_path, "Chad", ["event-3"])
+    _ = record_timeseries_event_names(events_path, "Haiti", ["event-1", "event-2", "event-4"])
+
+    assert read_timeseries_event_names(events_path) == {
+        "Chad": ["event-3"],
+        "Haiti": ["event-1", "event-2", "event-4"],
+    }
+
+
+def make_synthetic_earthquake(event_names: list[str]) -> SimpleNamespace:
+    # Two centroids inland in Haiti, hit by every event
+    n_events = len(event_names)
+    return SimpleNamespace(
+        intensity=sparse.csr_matrix(np.full((n_events, 2), 5.0)),
+        centroids=SimpleNamespace(lat=np.array([18.51, 19.145]), lon=np.array([-72.29, -72.005])),
+        event_name=event_names,
+        date=np.array([datetime.date(2020, 1, i + 1).toordinal() for i in range(n_events)]),
+    )
+
+
+def test_export_indicator_data_to_csv_incremental_timeseries(monkeypatch):
+    export_directory = os.path.join(EXPORT_DIRECTORY, "incremental")
+    shutil.rmtree(export_directory, ignore_errors=True)
+    output_paths = make_detail_and_summary_file_paths(COUNTRY, INDICATOR, export_directory)
+    # An existing detail file means only the timeseries is made
+    os.makedirs(os.path.dirname(output_paths["output_detail_path"]), exist_ok=True)
+    with open(output_paths["output_detail_path"], "w", encoding="utf-8"):
+        pass
+
+    def use_synthetic_earthquake(event_names: list[str]):
+        hazard = make_synthetic_earthquake(event_names)
+        max_intensity = np.max(hazard.intensity, axis=0).toarray().flatten()
+        monkeypatch.setattr(
+            climada_interface, "get_hazard_from_cache", lambda *args: (hazard, max_intensity)
+        )
+        monkeypatch.setattr(
+            create_csv_files, "get_hazard_event_names", lambda country, indicator: event_names
+        )
+
+    def read_event_dates() -> list[str]:
+        with open(output_paths["output_timeseries_path"], encoding="utf-8") as timeseries_file:
+            rows = list(csv.DictReader(timeseries_file))[1:]
+        return sorted(x["event_date"][0:10] for x in rows)
+
+    use_synthetic_earthquake(["event-1", "event-2"])
+    _ = export_indicator_data_to_csv(COUNTRY, INDICATOR, export_directory=export_directory)
+    first_event_dates = read_event_dates()
+    n_rows_per_event = first_event_dates.count("2020-01-01")
+
+    assert n_rows_per_event != 0
+    assert set(first_event_dates) == {"2020-01-01", "2020-01-02"}
+
+    # Recorded events are skipped and only the new one is added
+    use_synthetic_earthquake(["event-1", "event-2", "event-3"])
+    _ = export_indicator_data_to_csv(
+        COUNTRY, INDICATOR, export_directory=export_directory, incremental=True
+    )
+
+    assert read_event_dates() == sorted(first_event_dates + n_rows_per_event * ["2020-01-03"])
+    assert read_timeseries_event_names(output_paths["output_timeseries_events_path"]) == {
+        COUNTRY: ["event-1", "event-2", "event-3"]
+    }
+
+    # Events are not recorded if their rows could not be written
+    def failing_write_summary_fragment(*args, **kwargs):
+        raise OSError("Disk full")
+
+    use_synthetic_earthquake(["event-1", "event-2", "event-3", "event-4"])
+    monkeypatch.setattr(create_csv_files, "write_summary_fragment", failing_write_summary_fragment)
+    with pytest.raises(OSError):
+        _ = export_indicator_data_to_csv(
+            COUNTRY, INDICATOR, export_directory=export_directory, incremental=True
+        )
+
+    assert read_timeseries_event_names(output_paths["output_timeseries_events_path"]) == {
+        COUNTRY: ["event-1", "event-2", "event-3"]
+    }
 
 
 # @pytest.mark.skip(reason="Fails with Blackmarble issue")
@@ -189,9 +460,14 @@ def indicator_data_to_csv_helper(country: str, indicator: str):
     if os.path.exists(output_paths["output_summary_path"]):
         os.remove(output_paths["output_summary_path"])
 
+    if os.path.exists(output_paths["output_summary_fragment_path"]):
+        os.remove(output_paths["output_summary_fragment_path"])
+
     if indicator in HAS_TIMESERIES:
         if os.path.exists(output_paths["output_timeseries_path"]):
             os.remove(output_paths["output_timeseries_path"])
+        if os.path.exists(output_paths["output_timeseries_fragment_path"]):
+            os.remove(output_paths["output_timeseries_fragment_path"])
 
     statuses = export_indicator_data_to_csv(country, indicator, export_directory=EXPORT_DIRECTORY)
 
@@ -6,6 +6,8 @@ import os
 import pytest
 
 from hdx_scraper_climada.download_from_hdx import (
+    BOUNDARY_REGISTRY,
+    convert_admin_boundaries_to_geoparquet,
     download_hdx_admin1_boundaries,
     get_admin1_shapes_from_hdx,
     get_admin2_shapes_from_hdx,
@@ -76,3 +78,41 @@ def test_get_best_admin_shapes():
     country_isoa3 = "HTI"
     _, _, _, admin_level = get_best_admin_shapes(country_isoa3)
     assert admin_level == "2"
+
+
+def test_convert_admin_boundaries_to_geoparquet():
+    partition_directory = convert_admin_boundaries_to_geoparquet("polbnda_adm1_1m_ocha.geojson")
+
+    assert os.path.exists(os.path.join(partition_directory, "HTI.parquet"))
+    assert os.path.exists(os.path.join(partition_directory, "_manifest.json"))
+
+
+def test_convert_admin_boundaries_to_geoparquet_replaces_stale_partitions():
+    partition_directory = convert_admin_boundaries_to_geoparquet("polbnda_adm1_1m_ocha.geojson")
+    with open(os.path.join(partition_directory, "_manifest.json"), "w", encoding="utf-8") as f:
+        f.write("{}")
+
+    partition_directory = convert_admin_boundaries_to_geoparquet("polbnda_adm1_1m_ocha.geojson")
+
+    assert os.path.exists(os.path.join(partition_directory, "HTI.parquet"))
+    with open(os.path.join(partition_directory, "_manifest.json"), encoding="utf-8") as f:
+        assert f.read() != "{}"
+    # The temporary and stale directories are removed once the new partitions are in place
+    leftovers = [
+        x
+        for x in os.listdir(os.path.dirname(partition_directory))
+        if x.startswith(os.path.basename(partition_directory)) and x.endswith((".tmp", ".old"))
+    ]
+    assert leftovers == []
+
+
+def test_boundary_registry_memoizes_shapes():
+    admin1_names, admin2_names, admin_shapes = get_admin2_shapes_from_hdx("HTI")
+    _, _, admin_shapes_again = get_admin2_shapes_from_hdx("HTI")
+
+    assert admin_shapes_again is admin_shapes
+    assert isinstance(admin1_names, tuple)
+    for admin2_name, admin_shape in zip(admin2_names, admin_shapes):
+        admin2_gdf = BOUNDARY_REGISTRY.get_boundaries("polbnda_adm2_1m_ocha.geojson", "HTI")
+        expected_shape = admin2_gdf[admin2_gdf["ADM2_REF"] == admin2_name]["geometry"]
+        assert admin_shape.equals(expected_shape)
@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+import os
+
+import numpy as np
+
+from hdx_scraper_climada.hazard_store import (
+    make_hazard_store_directory,
+    read_country_exposure,
+    read_hazard_reductions,
+    write_country_exposures,
+    write_hazard_reductions,
+)
+
+STORE_FOLDER = os.path.join(os.path.dirname(__file__), "temp", "hazard_store")
+DATA_TYPE = "earthquake"
+PROPERTIES = {"country_iso3alpha": "HTI"}
+DATASET_VERSION = {"uuid": "test-uuid", "version": "v1"}
+REDUCTIONS = {
+    "latitude": np.array([18.5, 19.0]),
+    "longitude": np.array([-72.5, -72.0]),
+    "max_intensity": np.array([0.0, 6.67]),
+    "date": np.array([696001, 738000]),
+    "event_name": ["event-1", "event-2"],
+}
+
+
+def test_make_hazard_store_directory():
+    store_directory = make_hazard_store_directory(DATA_TYPE, PROPERTIES, store_folder=STORE_FOLDER)
+    reordered_directory = make_hazard_store_directory(
+        DATA_TYPE, {"event_type": None, **PROPERTIES}, store_folder=STORE_FOLDER
+    )
+
+    assert os.path.dirname(store_directory) == os.path.join(STORE_FOLDER, DATA_TYPE)
+    assert store_directory != reordered_directory
+
+
+def test_write_and_read_hazard_reductions():
+    store_directory = make_hazard_store_directory(DATA_TYPE, PROPERTIES, store_folder=STORE_FOLDER)
+    _ = write_hazard_reductions(store_directory, REDUCTIONS, DATA_TYPE, PROPERTIES, DATASET_VERSION)
+
+    reductions = read_hazard_reductions(store_directory, DATASET_VERSION)
+
+    assert reductions["max_intensity"].tolist() == [0.0, 6.67]
+    assert reductions["event_name"].tolist() == ["event-1", "event-2"]
+    assert read_hazard_reductions(store_directory, {"uuid": "test-uuid", "version": "v2"}) is None
+
+
+def test_write_and_read_hazard_reductions_with_object_event_names():
+    store_directory = make_hazard_store_directory(
+        DATA_TYPE, {"country_iso3alpha": "JAM"}, store_folder=STORE_FOLDER
+    )
+    event_names = np.array(["1907-01-14_Kingston", "2010-01-12 Léogâne", ""], dtype=object)
+    reductions = {
+        **REDUCTIONS,
+        "date": np.array([696001.0, 734149.0, 738000.0]),
+        "event_name": event_names,
+    }
+    _ = write_hazard_reductions(store_directory, reductions, DATA_TYPE, PROPERTIES, DATASET_VERSION)
+
+    reductions = read_hazard_reductions(store_directory, DATASET_VERSION)
+
+    assert isinstance(reductions["event_name"], np.memmap)
+    assert reductions["event_name"].dtype.kind == "U"
+    assert reductions["event_name"].tolist() == event_names.tolist()
+    assert reductions["date"].tolist() == [696001.0, 734149.0, 738000.0]
+
+
+def test_write_and_read_country_exposures():
+    store_directory = make_hazard_store_directory(
+        "crop_production", {"crop": "mai"}, store_folder=STORE_FOLDER
+    )
+    exposure_columns = {
+        "latitude": np.array([1.0, 2.0, 3.0, 4.0]),
+        "longitude": np.array([10.0, 20.0, 30.0, 40.0]),
+        "value": np.array([0.5, 1.5, 2.5, 3.5]),
+    }
+    _ = write_country_exposures(
+        store_directory,
+        exposure_columns,
+        np.array([332, 4, 332, 4]),
+        "crop_production",
+        {"crop": "mai"},
+        DATASET_VERSION,
+    )
+
+    haiti_exposure = read_country_exposure(store_directory, DATASET_VERSION, 332)
+    missing_exposure = read_country_exposure(store_directory, DATASET_VERSION, 840)
+
+    assert haiti_exposure["value"].tolist() == [0.5, 2.5]
+    assert haiti_exposure["longitude"].tolist() == [10.0, 30.0]
+    assert len(missing_exposure["latitude"]) == 0
+    assert read_country_exposure(store_directory, {"uuid": "other", "version": "v1"}, 332) is None
+
+
+def test_write_country_exposures_with_float_region_ids():
+    store_directory = make_hazard_store_directory(
+        "crop_production", {"crop": "whe"}, store_folder=STORE_FOLDER
+    )
+    exposure_columns = {
+        "latitude": np.array([1.0, 2.0]),
+        "longitude": np.array([10.0, 20.0]),
+        "value": np.array([0.5, 1.5]),
+    }
+    _ = write_country_exposures(
+        store_directory,
+        exposure_columns,
+        np.array([332.0, 4.0]),
+        "crop_production",
+        {"crop": "whe"},
+        DATASET_VERSION,
+    )
+
+    assert sorted(os.listdir(store_directory)) == ["332.npz", "4.npz", "manifest.json"]
+    assert read_country_exposure(store_directory, DATASET_VERSION, 332)["value"].tolist() == [0.5]
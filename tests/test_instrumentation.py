@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+import csv
+import json
+import os
+
+from hdx_scraper_climada.instrumentation import (
+    COUNTERS,
+    SPANS,
+    get_profile_path,
+    increment,
+    reset_profile,
+    span,
+    write_profile,
+    write_run_profile,
+)
+
+EXPORT_DIRECTORY = os.path.join(os.path.dirname(__file__), "temp")
+INDICATOR = "earthquake"
+
+
+def test_span_and_increment():
+    reset_profile()
+    for _ in range(2):
+        with span("spatial_filter"):
+            increment("points_filtered", 10)
+    increment("hazard_cache_miss")
+
+    assert SPANS["spatial_filter"]["count"] == 2
+    assert SPANS["spatial_filter"]["seconds"] >= 0.0
+    assert COUNTERS == {"points_filtered": 20, "hazard_cache_miss": 1}
+
+    reset_profile()
+    assert SPANS == {}
+    assert COUNTERS == {}
+
+
+def test_span_records_time_when_an_exception_is_raised():
+    reset_profile()
+    try:
+        with span("hazard_fetch"):
+            raise ValueError("No hazard")
+    except ValueError:
+        pass
+
+    assert SPANS["hazard_fetch"]["count"] == 1
+
+
+def test_write_profile_and_run_profile():
+    countries = ["Haiti", "Sri Lanka"]
+    for i, country in enumerate(countries):
+        reset_profile()
+        with span("csv_write"):
+            increment("summary_rows", i + 1)
+        status = write_profile(country, INDICATOR, EXPORT_DIRECTORY)
+        assert "Profile for" in status
+
+    profile_path = get_profile_path("Sri Lanka", INDICATOR, EXPORT_DIRECTORY)
+    assert profile_path.endswith(os.path.join("profiles", "earthquake-sri-lanka.json"))
+    with open(profile_path, encoding="utf-8") as profile_file:
+        profile = json.load(profile_file)
+    assert profile["country"] == "Sri Lanka"
+    assert profile["spans"]["csv_write"]["count"] == 1
+    assert profile["counters"] == {"summary_rows": 2}
+
+    status = write_run_profile(countries + ["Atlantis"], INDICATOR, EXPORT_DIRECTORY)
+    assert "Run profile for 3 countries" in status
+
+    run_profile_path = os.path.join(EXPORT_DIRECTORY, "profiles", f"{INDICATOR}-run-profile.csv")
+    with open(run_profile_path, encoding="utf-8") as run_profile_file:
+        rows = list(csv.DictReader(run_profile_file))
+
+    assert [(x["country_name"], x["kind"], x["name"]) for x in rows] == [
+        ("Haiti", "span", "csv_write"),
+        ("Haiti", "counter", "summary_rows"),
+        ("Sri Lanka", "span", "csv_write"),
+        ("Sri Lanka", "counter", "summary_rows"),
+    ]
+    assert rows[1]["count"] == "1"
@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+import os
+
+import numpy as np
+import rasterio
+import rasterio.mask
+
+from shapely.geometry import Polygon
+
+from hdx_scraper_climada.patched_nightlight import (
+    RasterTileReader,
+    load_nasa_nl_shape_single_tile,
+    optimize_raster,
+)
+
+TILE_PATH = os.path.join(os.path.dirname(__file__), "temp", "BlackMarble_test_tile.tif")
+
+
+def make_test_tile():
+    os.makedirs(os.path.dirname(TILE_PATH), exist_ok=True)
+    data = (np.arange(64 * 64) % 251).astype(np.uint8).reshape(1, 64, 64)
+    with rasterio.open(
+        TILE_PATH,
+        "w",
+        driver="GTiff",
+        height=64,
+        width=64,
+        count=1,
+        dtype="uint8",
+        crs="EPSG:4326",
+        transform=rasterio.transform.from_origin(0.0, 64.0, 1.0, 1.0),
+        tiled=True,
+        blockxsize=16,
+        blockysize=16,
+    ) as dst:
+        dst.write(data)
+
+
+def test_load_nasa_nl_shape_single_tile_matches_mask():
+    make_test_tile()
+    geometry = Polygon([(3.5, 10.5), (40.2, 20.0), (20.0, 50.7)])
+
+    out_image, meta = load_nasa_nl_shape_single_tile(geometry, TILE_PATH)
+
+    with rasterio.open(TILE_PATH) as src:
+        expected, expected_transform = rasterio.mask.mask(src, [geometry], crop=True)
+
+    assert np.array_equal(out_image, expected[0])
+    assert meta["transform"] == expected_transform
+    assert meta["height"] == expected.shape[1]
+
+
+def test_black_marble_tile_reader_evicts_blocks():
+    make_test_tile()
+    reader = RasterTileReader(max_bytes=3 * 16 * 16)
+
+    out_image = reader.read_window(TILE_PATH, rasterio.windows.Window(5, 7, 40, 20))
+
+    with rasterio.open(TILE_PATH) as src:
+        expected = src.read(1)[7:27, 5:45]
+    assert np.array_equal(out_image, expected)
+    assert len(reader.blocks) == 3
+    reader.close()
+
+
+def test_optimize_raster_gives_same_window():
+    make_test_tile()
+    array_path = optimize_raster(TILE_PATH)
+    reader = RasterTileReader()
+
+    out_image = reader.read_window(TILE_PATH, rasterio.windows.Window(5, 7, 40, 20))
+
+    with rasterio.open(TILE_PATH) as src:
+        expected = src.read(1)[7:27, 5:45]
+    assert os.path.exists(array_path)
+    assert np.array_equal(out_image, expected)
+    assert len(reader.blocks) == 0
+    reader.close()
+    os.remove(array_path)
+    os.remove(array_path.replace(".npy", ".json"))
@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+import os
+import shutil
+import threading
+
+from types import SimpleNamespace
+
+from hdx_scraper_climada import prefetch
+from hdx_scraper_climada.prefetch import ClimadaPrefetcher, get_dataset_directory
+
+DATA_DIRECTORY = os.path.join(os.path.dirname(__file__), "temp", "climada_data")
+FILE_SIZE = 100
+
+
+class FakeClient:
+    def __init__(self):
+        self.downloads = []
+        self.lock = threading.Lock()
+
+    def get_dataset_info(self, data_type: str = None, properties: dict = None) -> SimpleNamespace:
+        name = "-".join([data_type, *sorted(str(x) for x in properties.values())])
+        return SimpleNamespace(
+            data_type=SimpleNamespace(data_type_group="hazard", data_type=data_type),
+            name=name,
+            version="v1",
+            files=[SimpleNamespace(file_name=f"{name}.hdf5", file_size=FILE_SIZE)],
+        )
+
+    def download_dataset(self, dataset_info: SimpleNamespace, target_dir: str = None):
+        dataset_directory = get_dataset_directory(dataset_info, target_dir)
+        os.makedirs(dataset_directory, exist_ok=True)
+        for file_info in dataset_info.files:
+            with open(os.path.join(dataset_directory, file_info.file_name), "wb") as data_file:
+                data_file.write(file_info.file_size * b"0")
+        with self.lock:
+            self.downloads.append(dataset_info.name)
+
+
+def make_prefetcher(monkeypatch, countries: list[str], **kwargs) -> ClimadaPrefetcher:
+    shutil.rmtree(DATA_DIRECTORY, ignore_errors=True)
+    os.makedirs(DATA_DIRECTORY)
+    monkeypatch.setattr(prefetch, "SYSTEM_DIR", DATA_DIRECTORY)
+    monkeypatch.setattr(prefetch, "get_client", FakeClient)
+    # Every country shares a global dataset as well as having its own
+    monkeypatch.setattr(
+        prefetch,
+        "get_climada_datasets",
+        lambda country, indicator: [
+            (indicator, {"country_iso3alpha": country}),
+            ("crop_production", {"spatial_coverage": "global"}),
+        ],
+    )
+
+    return ClimadaPrefetcher(countries, "earthquake", **kwargs)
+
+
+def test_prefetcher_fetches_the_lookahead(monkeypatch):
+    with make_prefetcher(monkeypatch, ["A", "B", "C", "D"], lookahead=2) as prefetcher:
+        prefetcher.advance("A")
+        assert sorted(prefetcher.futures.keys()) == ["B", "C"]
+        prefetcher.advance("B")
+        assert sorted(prefetcher.futures.keys()) == ["B", "C", "D"]
+        # Closing the prefetcher cancels prefetches which have not started, so wait for them
+        _ = [x.result() for x in prefetcher.futures.values()]
+
+    assert sorted(prefetcher.client.downloads) == [
+        "crop_production-global",
+        "earthquake-B",
+        "earthquake-C",
+        "earthquake-D",
+    ]
+
+
+def test_prefetcher_skips_resolved_and_downloaded_datasets(monkeypatch):
+    with make_prefetcher(monkeypatch, ["A", "B", "C"], lookahead=2, threads=1) as prefetcher:
+        client = prefetcher.client
+        # B is already downloaded in full, C only in part
+        for country, size in [("B", FILE_SIZE), ("C", FILE_SIZE // 2)]:
+            dataset_info = client.get_dataset_info("earthquake", {"country_iso3alpha": country})
+            dataset_directory = get_dataset_directory(dataset_info, DATA_DIRECTORY)
+            os.makedirs(dataset_directory)
+            with open(os.path.join(dataset_directory, f"earthquake-{country}.hdf5"), "wb") as f:
+                f.write(size * b"0")
+        # A file of the same name belonging to another dataset does not count
+        other_directory = os.path.join(DATA_DIRECTORY, "hazard", "other")
+        os.makedirs(other_directory)
+        with open(os.path.join(other_directory, "crop_production-global.hdf5"), "wb") as f:
+            f.write(FILE_SIZE * b"0")
+
+        prefetcher.advance("A")
+        _ = [x.result() for x in prefetcher.futures.values()]
+
+    # The global dataset is fetched once, with B, and C's partial download is fetched again
+    assert client.downloads == ["crop_production-global", "earthquake-C"]
+
+
+def test_prefetcher_stops_at_the_disk_budget(monkeypatch):
+    with make_prefetcher(
+        monkeypatch, ["A", "B", "C"], lookahead=2, threads=1, disk_budget=3 * FILE_SIZE
+    ) as prefetcher:
+        prefetcher.advance("A")
+        statuses = [x.result() for x in prefetcher.futures.values()]
+
+    assert prefetcher.client.downloads == [
+        "earthquake-B",
+        "crop_production-global",
+        "earthquake-C",
+    ]
+    assert statuses[0] == "Prefetched 2 CLIMADA datasets for B-earthquake"
+    assert statuses[1] == "Prefetched 1 CLIMADA datasets for C-earthquake"
+
+    with make_prefetcher(
+        monkeypatch, ["A", "B", "C"], lookahead=2, threads=1, disk_budget=FILE_SIZE // 2
+    ) as prefetcher:
+        prefetcher.advance("A")
+        status = prefetcher.futures["B"].result()
+
+    assert prefetcher.client.downloads == []
+    assert status.startswith("Prefetch for B stopped")
@@ -0,0 +1,160 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+import logging
+import os
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+
+from hdx_scraper_climada import run
+from hdx_scraper_climada.run import (
+    choose_next_country,
+    estimate_country_footprints,
+    order_countries_by_footprint,
+    produce_csv_files,
+    read_peak_rss,
+    record_peak_rss,
+    BYTES_PER_CENTROID,
+    BYTES_PER_SHAPE,
+    WORKER_BASE_BYTES,
+)
+
+LOG_DIRECTORY = os.path.join(os.path.dirname(__file__), "temp", "logs")
+INDICATOR = "earthquake"
+FOOTPRINTS = {"Haiti": 6.0, "Jamaica": 5.0, "Cuba": 3.0, "Dominica": 1.0}
+
+
+class ThreadPoolExecutorForTests(ThreadPoolExecutor):
+    # Worker threads see the stubs set with monkeypatch, worker processes would not
+    def __init__(self, max_workers: int = None, max_tasks_per_child: int = None):
+        super().__init__(max_workers=max_workers)
+
+
+def stub_export_indicator_data_to_csv(
+    country: str, indicator: str, incremental: bool = False, merge: bool = True
+) -> list[str]:
+    if country == "Jamaica":
+        raise ValueError(f"No {indicator} data")
+    logging.getLogger(__name__).warning(f"Stub processing {country}")
+    return [f"Processing for {country} took 0 seconds"]
+
+
+def test_produce_csv_files_with_workers(monkeypatch):
+    merged_indicators = []
+    monkeypatch.setattr(run, "ProcessPoolExecutor", ThreadPoolExecutorForTests)
+    monkeypatch.setattr(run, "convert_all_admin_boundaries_to_geoparquet", lambda: [])
+    monkeypatch.setattr(run, "export_indicator_data_to_csv", stub_export_indicator_data_to_csv)
+    monkeypatch.setattr(
+        run,
+        "estimate_country_footprints",
+        lambda countries, indicator, log_directory: {x: 1.0 for x in countries},
+    )
+    monkeypatch.setattr(run, "merge_indicator_summaries", merged_indicators.append)
+    if os.path.exists(os.path.join(LOG_DIRECTORY, "peak-rss.json")):
+        os.remove(os.path.join(LOG_DIRECTORY, "peak-rss.json"))
+
+    country_statuses = produce_csv_files(
+        ["Haiti", "Jamaica"], INDICATOR, workers=2, log_directory=LOG_DIRECTORY
+    )
+
+    assert country_statuses["Haiti"] == ["Processing for Haiti took 0 seconds"]
+    assert len(country_statuses["Jamaica"]) == 1
+    assert "Processing for Jamaica failed with ValueError" in country_statuses["Jamaica"][0]
+    assert merged_indicators == [INDICATOR]
+
+    with open(os.path.join(LOG_DIRECTORY, f"{INDICATOR}-haiti.log"), encoding="utf-8") as log_file:
+        assert "Stub processing Haiti" in log_file.read()
+    assert os.path.exists(os.path.join(LOG_DIRECTORY, f"{INDICATOR}-jamaica.log"))
+
+    # The worker log handlers are removed once each country is done
+    assert not any(
+        getattr(x, "baseFilename", "").startswith(os.path.abspath(LOG_DIRECTORY))
+        for x in logging.getLogger().handlers
+    )
+    assert list(read_peak_rss(LOG_DIRECTORY)[INDICATOR].keys()) == ["Haiti"]
+
+
+def test_estimate_country_footprints(monkeypatch):
+    monkeypatch.setattr(run, "count_admin_shapes_by_country", lambda: {"HTI": 10, "JAM": 14})
+    monkeypatch.setattr(
+        run, "count_hazard_centroids", lambda country, indicator: {"Haiti": 1000}.get(country)
+    )
+    if os.path.exists(os.path.join(LOG_DIRECTORY, "peak-rss.json")):
+        os.remove(os.path.join(LOG_DIRECTORY, "peak-rss.json"))
+    os.makedirs(LOG_DIRECTORY, exist_ok=True)
+
+    footprints = estimate_country_footprints(["Haiti", "Jamaica"], INDICATOR, LOG_DIRECTORY)
+
+    assert (
+        footprints["Haiti"] == WORKER_BASE_BYTES + 1000 * BYTES_PER_CENTROID + 10 * BYTES_PER_SHAPE
+    )
+    # No hazard centroids are stored for Jamaica
+    assert footprints["Jamaica"] == WORKER_BASE_BYTES + 14 * BYTES_PER_SHAPE
+
+    # A measured peak RSS replaces the estimate, for that indicator only
+    record_peak_rss(LOG_DIRECTORY, INDICATOR, "Haiti", 123456)
+    record_peak_rss(LOG_DIRECTORY, "flood", "Jamaica", 654321)
+    record_peak_rss(LOG_DIRECTORY, INDICATOR, "Jamaica", None)
+
+    footprints = estimate_country_footprints(["Haiti", "Jamaica"], INDICATOR, LOG_DIRECTORY)
+
+    assert footprints["Haiti"] == 123456
+    assert footprints["Jamaica"] == WORKER_BASE_BYTES + 14 * BYTES_PER_SHAPE
+
+
+def test_order_countries_by_footprint():
+    assert order_countries_by_footprint(["Cuba", "Dominica", "Haiti", "Jamaica"], FOOTPRINTS) == [
+        "Haiti",
+        "Jamaica",
+        "Cuba",
+        "Dominica",
+    ]
+
+
+def test_choose_next_country_stays_within_memory_budget():
+    pending = order_countries_by_footprint(list(FOOTPRINTS.keys()), FOOTPRINTS)
+
+    assert choose_next_country(pending, FOOTPRINTS, 0.0, 8.0, 0) == "Haiti"
+    # Jamaica and Cuba would take the total over the budget, Dominica fits
+    pending.remove("Haiti")
+    assert choose_next_country(pending, FOOTPRINTS, 6.0, 8.0, 1) == "Dominica"
+    assert choose_next_country(["Jamaica", "Cuba"], FOOTPRINTS, 7.0, 8.0, 2) is None
+    # A country larger than the whole budget still runs once nothing else is running
+    assert choose_next_country(["Haiti"], FOOTPRINTS, 0.0, 4.0, 0) == "Haiti"
+
+
+def test_produce_csv_files_stays_within_memory_budget(monkeypatch):
+    lock = threading.Lock()
+    running = set()
+    committed_footprints = []
+
+    def stub_export(country: str, indicator: str, incremental: bool = False, merge: bool = True):
+        with lock:
+            running.add(country)
+            committed_footprints.append(sum(FOOTPRINTS[x] for x in running))
+        # Hold the country long enough for the others to be scheduled alongside it
+        time.sleep(0.05)
+        with lock:
+            running.remove(country)
+        return [f"Processing for {country} took 0 seconds"]
+
+    monkeypatch.setattr(run, "ProcessPoolExecutor", ThreadPoolExecutorForTests)
+    monkeypatch.setattr(run, "convert_all_admin_boundaries_to_geoparquet", lambda: [])
+    monkeypatch.setattr(run, "export_indicator_data_to_csv", stub_export)
+    monkeypatch.setattr(
+        run, "estimate_country_footprints", lambda countries, indicator, log_directory: FOOTPRINTS
+    )
+    monkeypatch.setattr(run, "merge_indicator_summaries", lambda indicator: None)
+
+    country_statuses = produce_csv_files(
+        list(FOOTPRINTS.keys()),
+        INDICATOR,
+        workers=4,
+        memory_budget=8.0,
+        log_directory=LOG_DIRECTORY,
+    )
+
+    assert sorted(country_statuses.keys()) == sorted(FOOTPRINTS.keys())
+    assert max(committed_footprints) <= 8.0
@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+import geopandas
+import numpy as np
+
+from shapely.geometry import MultiPolygon, Polygon, box
+
+from hdx_scraper_climada.spatial_index import (
+    AdminShapeIndex,
+    get_grid_cells,
+    grid_indices_within,
+    split_points_by_shape_rows,
+)
+
+ADMIN_SHAPES = [
+    geopandas.GeoSeries([box(0.0, 0.0, 1.0, 1.0)]),
+    geopandas.GeoSeries([MultiPolygon([box(1.0, 0.0, 2.0, 1.0), box(3.0, 0.0, 4.0, 1.0)])]),
+    geopandas.GeoSeries([Polygon([(0.0, 2.0), (1.0, 2.0), (0.5, 3.0)])]),
+]
+LONGITUDES = np.array([0.5, 1.5, 3.5, 5.0, 0.5, 1.0, 0.2])
+LATITUDES = np.array([0.5, 0.5, 0.5, 0.5, 2.5, 0.5, 0.2])
+
+
+def test_admin_shape_index_matches_within():
+    shape_index = AdminShapeIndex(ADMIN_SHAPES)
+    indices_within = shape_index.indices_within(LONGITUDES, LATITUDES)
+
+    points = geopandas.GeoSeries(geopandas.points_from_xy(LONGITUDES, LATITUDES))
+    assert len(indices_within) == len(ADMIN_SHAPES)
+    for admin_shape, positions in zip(ADMIN_SHAPES, indices_within):
+        expected = np.zeros(len(points), dtype=bool)
+        for shp in admin_shape:
+            expected = expected | points.within(shp).to_numpy()
+        assert positions.tolist() == np.flatnonzero(expected).tolist()
+
+
+def test_admin_shape_index_boundary_points_excluded():
+    shape_index = AdminShapeIndex(ADMIN_SHAPES)
+    point_positions, _ = shape_index.query(LONGITUDES, LATITUDES)
+
+    # The point at (1.0, 0.5) is on the boundary shared by the first two shapes
+    assert 5 not in point_positions.tolist()
+
+
+def test_split_points_by_shape_rows_follows_row_order():
+    admin_shapes = [
+        geopandas.GeoSeries([box(0.0, 0.0, 0.6, 1.0), box(0.0, 0.0, 1.0, 1.0)]),
+        ADMIN_SHAPES[2],
+    ]
+    shape_positions = split_points_by_shape_rows(LONGITUDES, LATITUDES, admin_shapes)
+
+    assert shape_positions[0].tolist() == [0, 6, 0, 6]
+    assert shape_positions[1].tolist() == [4]
+
+
+def test_grid_indices_within_matches_admin_shape_index():
+    # A 0.1 degree grid with centres on the shared boundaries at 1.0 and 2.0 degrees
+    grid_longitudes, grid_latitudes = np.meshgrid(
+        np.round(np.arange(-0.5, 4.5, 0.1), 5), np.round(np.arange(-0.5, 3.5, 0.1), 5)
+    )
+    longitudes = grid_longitudes.ravel()
+    latitudes = grid_latitudes.ravel()
+    overlapping_shapes = ADMIN_SHAPES + [geopandas.GeoSeries([box(0.5, 0.5, 1.5, 2.5)])]
+
+    grid_positions = grid_indices_within(longitudes, latitudes, overlapping_shapes)
+    expected_positions = AdminShapeIndex(overlapping_shapes).indices_within(longitudes, latitudes)
+
+    assert [x.tolist() for x in grid_positions] == [x.tolist() for x in expected_positions]
+
+
+def test_grid_indices_within_rejects_scattered_points():
+    assert grid_indices_within(LONGITUDES, LATITUDES, ADMIN_SHAPES) is None
+
+
+def test_get_grid_cells_on_rounded_arcsec_grids():
+    # CLIMADA's 150 and 30 arcsecond grids over Haiti, with centroids rounded to 5 decimal places
+    # as in calculate_hazards_for_admin1. The rounded steps between neighbours are uneven
+    for resolution_arcsec in [150, 30]:
+        step = resolution_arcsec / 3600
+        grid_longitudes, grid_latitudes = np.meshgrid(
+            -74.5 + step / 2 + step * np.arange(int(3.0 / step)),
+            20.1 - step / 2 - step * np.arange(int(2.1 / step)),
+        )
+        # Drop a band of columns so the grid has gaps, as a hazard over islands does
+        keep = (grid_longitudes < -73.5) | (grid_longitudes > -73.0)
+        longitudes = grid_longitudes[keep].round(5)
+        latitudes = grid_latitudes[keep].round(5)
+
+        grid_cells = get_grid_cells(longitudes, latitudes)
+
+        assert grid_cells is not None
+        transform, shape, rows, columns = grid_cells
+        assert shape == grid_longitudes.shape
+        assert rows.tolist() == np.nonzero(keep)[0].tolist()
+        assert columns.tolist() == np.nonzero(keep)[1].tolist()
+
+
+def test_split_points_by_shape_rows_on_grid():
+    grid_longitudes, grid_latitudes = np.meshgrid(
+        np.round(np.arange(-0.5, 4.5, 0.1), 5), np.round(np.arange(-0.5, 3.5, 0.1), 5)
+    )
+    admin_shapes = [
+        geopandas.GeoSeries([box(0.0, 0.0, 0.6, 1.0), box(0.0, 0.0, 1.0, 1.0)]),
+        ADMIN_SHAPES[1],
+        ADMIN_SHAPES[2],
+    ]
+
+    grid_positions = split_points_by_shape_rows(
+        grid_longitudes.ravel(), grid_latitudes.ravel(), admin_shapes, use_grid=True
+    )
+    expected_positions = split_points_by_shape_rows(
+        grid_longitudes.ravel(), grid_latitudes.ravel(), admin_shapes
+    )
+
+    assert [x.tolist() for x in grid_positions] == [x.tolist() for x in expected_positions]
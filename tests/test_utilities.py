@@ -14,6 +14,8 @@ from hdx_scraper_climada.utilities import (
     print_banner_to_log,
     read_documentation_from_file,
     read_countries,
+    get_summary_fragment_path,
+    get_summary_fragments,
 )
 
 TEMP_FILE_PATH = os.path.join(Path(__file__).parent, "temp", "tmp.csv")
@@ -104,3 +106,30 @@ def test_read_countries_floods():
     countries = read_countries(indicator="floods")
     assert len(countries) == 46
     assert len(countries) == len({x["iso3alpha_country_code"] for x in countries})
+
+
+def test_get_summary_fragments():
+    summary_file_path = os.path.join(
+        Path(__file__).parent, "temp", "fragments-test", "admin1-summaries-flood.csv"
+    )
+    fragment_directory = os.path.join(os.path.dirname(summary_file_path), "fragments")
+    os.makedirs(fragment_directory, exist_ok=True)
+    for file_name in os.listdir(fragment_directory):
+        os.remove(os.path.join(fragment_directory, file_name))
+
+    for country in ["Sri Lanka", "Atlantis"]:
+        with open(
+            get_summary_fragment_path(summary_file_path, country), "w", encoding="utf-8"
+        ) as fragment_file:
+            fragment_file.write(f"country_name,value\n{country},1.0\n")
+    # Other files in the fragments directory are ignored
+    with open(os.path.join(fragment_directory, "haiti-admin1-summaries-litpop.csv"), "w") as f:
+        f.write("country_name,value\nHaiti,1.0\n")
+
+    summary_fragments = get_summary_fragments(summary_file_path)
+
+    # Sri Lanka is found from its file name, Atlantis is not in countries.csv so from its first row
+    assert summary_fragments == {
+        "Atlantis": get_summary_fragment_path(summary_file_path, "Atlantis"),
+        "Sri Lanka": get_summary_fragment_path(summary_file_path, "Sri Lanka"),
+    }